@@ -0,0 +1,212 @@
+"""Runtime settings for the bot, read from environment variables."""
+
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """Reads a boolean flag such as `1`, `true`, `yes` or `on` from the environment."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _env_int(name: str, default: int) -> int:
+    """Reads an integer from the environment, falling back to the default on bad input."""
+    value = os.getenv(name)
+    try:
+        return int(value) if value else default
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    """Reads a float from the environment, falling back to the default on bad input."""
+    value = os.getenv(name)
+    try:
+        return float(value) if value else default
+    except ValueError:
+        return default
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Tunable bot settings. Every field can be overridden by the env var named in `from_env`."""
+
+    # Plan streaming (progressive edits of the "generating" placeholder)
+    stream_plan: bool = True
+    stream_edit_interval: float = 1.0  # Seconds between two edits of the same message
+    stream_message_limit: int = 4000  # Roll over to a new message past this many chars
+
+    # Update processing: how many updates (of different users) are handled at once, 1 = sequential
+    concurrent_updates: int = 64
+
+    # Persistence backend: "sqlite" (incremental, per-user rows) or "pickle" (legacy single file)
+    persistence_backend: str = "sqlite"
+
+    # Refinement history: prompt token budget, recent turns kept verbatim, turns folded per summary update
+    history_token_budget: int = 6000
+    history_keep_turns: int = 4
+    history_summary_batch_turns: int = 2
+
+    # Plan modifications as compact structured patches applied to the stored plan (off = free-text answer)
+    plan_patch_enabled: bool = True
+
+    # Plans built locally from the generation rules (level, goal, 5-week wave); the model only adapts them to injuries
+    plan_template_enabled: bool = False
+
+    # Plans generated day by day: a short call fixes the split, then the days are written at most this many at once
+    plan_fanout_enabled: bool = False
+    plan_fanout_concurrency: int = 5
+
+    # Plans with week 1 only, later weeks generated on demand (/week N); optionally the next week in the background
+    plan_lazy_weeks: bool = False
+    plan_week_prefetch: bool = False
+
+    # Speculative plans for both goals while the goal is picked: at most this many generations at once, kept this long
+    speculation_enabled: bool = False
+    speculation_max_in_flight: int = 8
+    speculation_ttl: float = 600.0
+
+    # Deterministic plan questions (kg for a week, a day or week of the plan) answered locally, without OpenAI
+    local_answers_enabled: bool = True
+
+    # Plan cache for similar profiles (profiles with injuries are never cached); empty path = memory only
+    plan_cache_enabled: bool = True
+    plan_cache_max_entries: int = 1000
+    plan_cache_ttl: float = 86400.0
+    plan_cache_path: str = ""
+
+    # Background plan generation: worker pool size (= max concurrent generations) and waiting-queue depth
+    plan_queue_enabled: bool = True
+    plan_queue_workers: int = 8
+    plan_queue_max_depth: int = 100
+
+    # Update delivery: "polling" or "webhook" (local HTTP server behind WEBHOOK_URL, verified by the secret token)
+    update_mode: str = "polling"
+    webhook_url: str = ""
+    webhook_listen: str = "0.0.0.0"
+    webhook_port: int = 8443
+    webhook_path: str = "telegram"
+    webhook_secret_token: str = ""
+    webhook_max_connections: int = 40
+
+    # OpenAI client-side rate limits (per model, adjusted from response headers) and the share of them we use
+    openai_rate_limit_enabled: bool = True
+    openai_requests_per_minute: float = 500.0
+    openai_tokens_per_minute: float = 30000.0
+    openai_rate_limit_headroom: float = 0.95
+
+    # OpenAI resilience: attempts per call (with jittered exponential backoff), hedged second requests for calls
+    # slower than the p95 latency, and a circuit breaker opening after consecutive failures
+    openai_max_attempts: int = 3
+    openai_backoff_base: float = 0.5
+    openai_backoff_max: float = 8.0
+    openai_hedge_enabled: bool = False
+    openai_hedge_min_samples: int = 20
+    openai_circuit_failure_threshold: int = 5
+    openai_circuit_reset_timeout: float = 30.0
+
+    # Outbound Telegram scheduler: messages per second overall, per chat, and the per-chat burst
+    telegram_scheduler_enabled: bool = True
+    telegram_global_rate: float = 30.0
+    telegram_chat_rate: float = 1.0
+    telegram_chat_burst: int = 3
+
+    # Prometheus metrics endpoint port, 0 = disabled
+    metrics_port: int = 0
+
+    # Bot API endpoint override (e.g. a local fake Telegram); empty = api.telegram.org
+    telegram_api_url: str = ""
+
+    # Logging: console level, log file (JSON lines, empty = none) and its level, and the share of
+    # requests whose full payloads (profiles, prompts, responses) are dumped at DEBUG, 0 = never
+    log_level: str = "INFO"
+    log_file: str = "ai_gym_bro.log"
+    log_file_level: str = "DEBUG"
+    log_payload_sample_rate: float = 0.0
+
+    # Langfuse tracing of OpenAI calls: "auto" (on when LANGFUSE_PUBLIC_KEY and LANGFUSE_SECRET_KEY are set),
+    # "on" or "off"; the share of calls traced, overall and per operation ("refine_plan=0.1,summarize_history=0");
+    # events are exported in batches from a bounded buffer, dropping new events when it is full
+    tracing_mode: str = "auto"
+    tracing_sample_rate: float = 1.0
+    tracing_sample_rates: str = ""
+    tracing_batch_size: int = 50
+    tracing_flush_interval: float = 2.0
+    tracing_buffer_size: int = 1000
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """Builds settings from the current environment."""
+        return cls(
+            stream_plan=_env_bool("STREAM_PLAN", cls.stream_plan),
+            stream_edit_interval=_env_float("STREAM_EDIT_INTERVAL", cls.stream_edit_interval),
+            stream_message_limit=_env_int("STREAM_MESSAGE_LIMIT", cls.stream_message_limit),
+            concurrent_updates=_env_int("CONCURRENT_UPDATES", cls.concurrent_updates),
+            persistence_backend=os.getenv("PERSISTENCE_BACKEND", cls.persistence_backend).strip().lower(),
+            history_token_budget=_env_int("HISTORY_TOKEN_BUDGET", cls.history_token_budget),
+            history_keep_turns=_env_int("HISTORY_KEEP_TURNS", cls.history_keep_turns),
+            history_summary_batch_turns=_env_int("HISTORY_SUMMARY_BATCH_TURNS", cls.history_summary_batch_turns),
+            plan_patch_enabled=_env_bool("PLAN_PATCH_ENABLED", cls.plan_patch_enabled),
+            plan_template_enabled=_env_bool("PLAN_TEMPLATE_ENABLED", cls.plan_template_enabled),
+            plan_fanout_enabled=_env_bool("PLAN_FANOUT_ENABLED", cls.plan_fanout_enabled),
+            plan_fanout_concurrency=_env_int("PLAN_FANOUT_CONCURRENCY", cls.plan_fanout_concurrency),
+            plan_lazy_weeks=_env_bool("PLAN_LAZY_WEEKS", cls.plan_lazy_weeks),
+            plan_week_prefetch=_env_bool("PLAN_WEEK_PREFETCH", cls.plan_week_prefetch),
+            speculation_enabled=_env_bool("SPECULATION_ENABLED", cls.speculation_enabled),
+            speculation_max_in_flight=_env_int("SPECULATION_MAX_IN_FLIGHT", cls.speculation_max_in_flight),
+            speculation_ttl=_env_float("SPECULATION_TTL", cls.speculation_ttl),
+            local_answers_enabled=_env_bool("LOCAL_ANSWERS_ENABLED", cls.local_answers_enabled),
+            plan_cache_enabled=_env_bool("PLAN_CACHE_ENABLED", cls.plan_cache_enabled),
+            plan_cache_max_entries=_env_int("PLAN_CACHE_MAX_ENTRIES", cls.plan_cache_max_entries),
+            plan_cache_ttl=_env_float("PLAN_CACHE_TTL", cls.plan_cache_ttl),
+            plan_cache_path=os.getenv("PLAN_CACHE_PATH", cls.plan_cache_path),
+            plan_queue_enabled=_env_bool("PLAN_QUEUE_ENABLED", cls.plan_queue_enabled),
+            plan_queue_workers=_env_int("PLAN_QUEUE_WORKERS", cls.plan_queue_workers),
+            plan_queue_max_depth=_env_int("PLAN_QUEUE_MAX_DEPTH", cls.plan_queue_max_depth),
+            update_mode=os.getenv("UPDATE_MODE", cls.update_mode).strip().lower(),
+            webhook_url=os.getenv("WEBHOOK_URL", cls.webhook_url),
+            webhook_listen=os.getenv("WEBHOOK_LISTEN", cls.webhook_listen),
+            webhook_port=_env_int("WEBHOOK_PORT", cls.webhook_port),
+            webhook_path=os.getenv("WEBHOOK_PATH", cls.webhook_path).strip("/"),
+            webhook_secret_token=os.getenv("WEBHOOK_SECRET_TOKEN", cls.webhook_secret_token),
+            webhook_max_connections=_env_int("WEBHOOK_MAX_CONNECTIONS", cls.webhook_max_connections),
+            openai_rate_limit_enabled=_env_bool("OPENAI_RATE_LIMIT_ENABLED", cls.openai_rate_limit_enabled),
+            openai_requests_per_minute=_env_float("OPENAI_REQUESTS_PER_MINUTE", cls.openai_requests_per_minute),
+            openai_tokens_per_minute=_env_float("OPENAI_TOKENS_PER_MINUTE", cls.openai_tokens_per_minute),
+            openai_rate_limit_headroom=_env_float("OPENAI_RATE_LIMIT_HEADROOM", cls.openai_rate_limit_headroom),
+            openai_max_attempts=_env_int("OPENAI_MAX_ATTEMPTS", cls.openai_max_attempts),
+            openai_backoff_base=_env_float("OPENAI_BACKOFF_BASE", cls.openai_backoff_base),
+            openai_backoff_max=_env_float("OPENAI_BACKOFF_MAX", cls.openai_backoff_max),
+            openai_hedge_enabled=_env_bool("OPENAI_HEDGE_ENABLED", cls.openai_hedge_enabled),
+            openai_hedge_min_samples=_env_int("OPENAI_HEDGE_MIN_SAMPLES", cls.openai_hedge_min_samples),
+            openai_circuit_failure_threshold=_env_int(
+                "OPENAI_CIRCUIT_FAILURE_THRESHOLD", cls.openai_circuit_failure_threshold
+            ),
+            openai_circuit_reset_timeout=_env_float("OPENAI_CIRCUIT_RESET_TIMEOUT", cls.openai_circuit_reset_timeout),
+            telegram_scheduler_enabled=_env_bool("TELEGRAM_SCHEDULER_ENABLED", cls.telegram_scheduler_enabled),
+            telegram_global_rate=_env_float("TELEGRAM_GLOBAL_RATE", cls.telegram_global_rate),
+            telegram_chat_rate=_env_float("TELEGRAM_CHAT_RATE", cls.telegram_chat_rate),
+            telegram_chat_burst=_env_int("TELEGRAM_CHAT_BURST", cls.telegram_chat_burst),
+            metrics_port=_env_int("METRICS_PORT", cls.metrics_port),
+            telegram_api_url=os.getenv("TELEGRAM_API_URL", cls.telegram_api_url),
+            log_level=os.getenv("LOG_LEVEL", cls.log_level).strip().upper(),
+            log_file=os.getenv("LOG_FILE", cls.log_file),
+            log_file_level=os.getenv("LOG_FILE_LEVEL", cls.log_file_level).strip().upper(),
+            log_payload_sample_rate=_env_float("LOG_PAYLOAD_SAMPLE_RATE", cls.log_payload_sample_rate),
+            tracing_mode=os.getenv("TRACING_MODE", cls.tracing_mode).strip().lower(),
+            tracing_sample_rate=_env_float("TRACING_SAMPLE_RATE", cls.tracing_sample_rate),
+            tracing_sample_rates=os.getenv("TRACING_SAMPLE_RATES", cls.tracing_sample_rates),
+            tracing_batch_size=_env_int("TRACING_BATCH_SIZE", cls.tracing_batch_size),
+            tracing_flush_interval=_env_float("TRACING_FLUSH_INTERVAL", cls.tracing_flush_interval),
+            tracing_buffer_size=_env_int("TRACING_BUFFER_SIZE", cls.tracing_buffer_size),
+        )
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Returns the process-wide settings, read once from the environment."""
+    return Settings.from_env()
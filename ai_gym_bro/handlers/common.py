@@ -12,7 +12,21 @@
     GENERATING_PLAN,
     AWAITING_REFINEMENT_CHOICE,
     AWAITING_REFINEMENT_INPUT,
-) = range(10) # Updated range
+) = range(10)  # Updated range
+
+# State names used as metric labels
+STATE_NAMES = {
+    ASK_AGE: "ask_age",
+    ASK_HEIGHT: "ask_height",
+    ASK_WEIGHT: "ask_weight",
+    ASK_EXPERIENCE: "ask_experience",
+    ASK_BENCH: "ask_bench",
+    ASK_INJURIES: "ask_injuries",
+    SELECT_GOAL: "select_goal",
+    GENERATING_PLAN: "generating_plan",
+    AWAITING_REFINEMENT_CHOICE: "awaiting_refinement_choice",
+    AWAITING_REFINEMENT_INPUT: "awaiting_refinement_input",
+}
 
 # Goal options
 MUSCLE_GAIN = "Набор мышечной массы"
@@ -28,18 +42,23 @@ USER_DATA_BENCH = "bench"
 USER_DATA_INJURIES = "injuries"
 USER_DATA_GOAL = "goal"
 USER_DATA_PLAN = "plan"
-USER_DATA_HISTORY = "history" # To store conversation for refinement
-USER_DATA_REFINEMENT_TYPE = "refinement_type" # New key: 'ask' or 'modify'
+USER_DATA_HISTORY = "history"  # To store conversation for refinement
+USER_DATA_HISTORY_SUMMARY = "history_summary"  # Rolling summary of older refinement turns
+USER_DATA_REFINEMENT_TYPE = "refinement_type"  # New key: 'ask' or 'modify'
+USER_DATA_PLAN_WEEKS = "plan_weeks"  # Weeks generated so far, for plans generated week by week only
+USER_DATA_PLAN_JOB_STATE = "plan_job_state"  # State a queued plan job ended in, taken by the next update
 
 # Refinement choice options (callback data)
 ASK_QUESTION_CALLBACK = "refine_ask"
 MODIFY_PLAN_CALLBACK = "refine_modify"
+WEEK_CALLBACK_PREFIX = "week_"  # Followed by the week number
 
 # Define command descriptions
 COMMAND_DESCRIPTIONS = {
     "start": "Start interaction and plan generation workflow",
     "help": "Show available commands and bot description",
     "cancel": "Cancel the current operation/conversation",
+    "week": "Show week N of the plan, e.g. /week 2",
 }
 
 # Training plan instructions
@@ -57,4 +76,4 @@ TRAINING_PLAN_INSTRUCTIONS = (
     "   - Формат: подходы×повторы\n"
     "   - Например: «3×15» означает 3 подхода по 15 повторений\n\n"
     "Вы всегда можете увидеть эти инструкции, выполнив команду /help"
-)
\ No newline at end of file
+)
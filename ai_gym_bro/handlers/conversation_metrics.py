@@ -0,0 +1,55 @@
+"""ConversationHandler that reports per-state timings and the number of active conversations."""
+
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from loguru import logger
+from telegram import Update
+from telegram.ext import Application, ConversationHandler
+
+from ai_gym_bro.handlers.common import STATE_NAMES
+from ai_gym_bro.metrics import ACTIVE_CONVERSATIONS, CONVERSATION_HANDLER_LATENCY, CONVERSATION_STATE_DURATION
+
+ConversationKey = Tuple[int | str, ...]
+
+
+def _state_label(state: Optional[object]) -> str:
+    return "entry" if state is None else STATE_NAMES.get(state, str(state))
+
+
+class InstrumentedConversationHandler(ConversationHandler):
+    """`ConversationHandler` observing how long the bot took to handle each update, by the state
+    it arrived in (`conversation_handler_seconds`), and on every transition how long the
+    conversation stayed in the state it left (`conversation_state_seconds`).
+
+    Records logged while an update is handled get `user_id` and `state` fields.
+
+    State entry times are kept in memory only: conversations restored from persistence after
+    a restart report durations from their next transition on.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._entered_at: Dict[ConversationKey, float] = {}
+
+    async def handle_update(  # type: ignore[override]
+        self, update: Update, application: Application, check_result: Any, context: Any
+    ) -> Optional[object]:
+        current_state, key = check_result[0], check_result[1]
+        user_id = update.effective_user.id if update.effective_user else None
+        started = time.monotonic()
+        try:
+            # Log records written while the update is handled carry the user and state
+            with logger.contextualize(user_id=user_id, state=_state_label(current_state)):
+                return await super().handle_update(update, application, check_result, context)
+        finally:
+            finished = time.monotonic()
+            CONVERSATION_HANDLER_LATENCY.labels(_state_label(current_state)).observe(finished - started)
+            new_state = self._conversations.get(key)
+            if new_state != current_state:
+                entered_at = self._entered_at.pop(key, None)
+                if current_state is not None and entered_at is not None:
+                    CONVERSATION_STATE_DURATION.labels(_state_label(current_state)).observe(finished - entered_at)
+                if new_state is not None:
+                    self._entered_at[key] = finished
+            ACTIVE_CONVERSATIONS.set(len(self._conversations))
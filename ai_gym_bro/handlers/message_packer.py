@@ -0,0 +1,226 @@
+"""Packing of long Markdown answers into as few Telegram HTML messages as possible.
+
+The model answers in Markdown, which Telegram does not render as is. The text is
+converted to Telegram's HTML subset line by line (headers and bold, italics, inline
+code, bullets; fenced code and tables become `<pre>` blocks), then packed greedily:
+whole sections (blank-line separated) when they fit, otherwise lines, otherwise
+words, so messages are filled close to the limit without cutting through a word,
+a tag or an HTML entity.
+"""
+
+import html
+import re
+from typing import Any, Awaitable, Callable, List, Optional
+
+from loguru import logger
+from telegram import Message
+from telegram.error import BadRequest
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Telegram counts UTF-16 units of the parsed text; the margin covers emoji (2 units each)
+PACK_LIMIT = 4000
+
+_HEADER = re.compile(r"^\s{0,3}#{1,6}\s+(.*?)\s*#*\s*$")
+_BULLET = re.compile(r"^(\s*)[-*+]\s+")
+_TABLE_RULE = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$")
+_INLINE_CODE = re.compile(r"`([^`\n]+)`")
+_BOLD = re.compile(r"\*\*(?=\S)(.+?)(?<=\S)\*\*|__(?=\S)(.+?)(?<=\S)__")
+_ITALIC = re.compile(r"(?<![\w*])\*(?=\S)([^*\n]+?)(?<=\S)\*(?![\w*])")
+_TAG = re.compile(r"<[^>]+>")
+_TAG_RESERVE = 32
+
+
+class _Block:
+    """A section of the message: HTML lines, optionally wrapped (e.g. in <pre>)."""
+
+    def __init__(self, lines: List[str], prefix: str = "", suffix: str = "") -> None:
+        self.lines = lines
+        self.prefix = prefix
+        self.suffix = suffix
+
+    def render(self, lines: Optional[List[str]] = None) -> str:
+        return self.prefix + "\n".join(self.lines if lines is None else lines) + self.suffix
+
+
+def _inline_to_html(text: str) -> str:
+    """Converts inline Markdown of one line to HTML, escaping everything else."""
+    parts = _INLINE_CODE.split(text)
+    converted = []
+    for index, part in enumerate(parts):
+        if index % 2:  # Inside backticks: no further formatting
+            converted.append(f"<code>{html.escape(part, quote=False)}</code>")
+            continue
+        escaped = html.escape(part, quote=False)
+        escaped = _BOLD.sub(lambda m: f"<b>{m.group(1) or m.group(2)}</b>", escaped)
+        converted.append(_ITALIC.sub(r"<i>\1</i>", escaped))
+    return "".join(converted)
+
+
+def _line_to_html(line: str) -> str:
+    """Converts one Markdown line (header, bullet or text) to HTML."""
+    header = _HEADER.match(line)
+    if header:
+        # The whole header is bold already, so bold markers inside it are dropped
+        title = _BOLD.sub(lambda m: m.group(1) or m.group(2), header.group(1))
+        return f"<b>{_inline_to_html(title)}</b>"
+    bullet = _BULLET.match(line)
+    if bullet and not _TABLE_RULE.match(line):
+        return f"{bullet.group(1)}• {_inline_to_html(line[bullet.end() :])}"
+    return _inline_to_html(line)
+
+
+def markdown_to_blocks(text: str) -> List[_Block]:
+    """Splits Markdown into blank-line separated blocks of Telegram HTML."""
+    blocks: List[_Block] = []
+    current: List[str] = []
+    lines = text.replace("\r\n", "\n").split("\n")
+    index = 0
+
+    def close_paragraph() -> None:
+        if current:
+            blocks.append(_Block(list(current)))
+            current.clear()
+
+    while index < len(lines):
+        line = lines[index]
+        if line.strip().startswith("```"):
+            close_paragraph()
+            code: List[str] = []
+            index += 1
+            while index < len(lines) and not lines[index].strip().startswith("```"):
+                code.append(html.escape(lines[index], quote=False))
+                index += 1
+            blocks.append(_Block(code or [""], "<pre>", "</pre>"))
+        elif line.lstrip().startswith("|"):
+            # Telegram has no tables: keep them aligned in a monospace block
+            close_paragraph()
+            table: List[str] = []
+            while index < len(lines) and lines[index].lstrip().startswith("|"):
+                table.append(html.escape(lines[index].strip(), quote=False))
+                index += 1
+            blocks.append(_Block(table, "<pre>", "</pre>"))
+            continue
+        elif not line.strip():
+            close_paragraph()
+        else:
+            if _HEADER.match(line):
+                close_paragraph()  # Headers (weeks, days) start a new section even without a blank line
+            current.append(_line_to_html(line))
+        index += 1
+    close_paragraph()
+    return blocks
+
+
+def _split_words(line: str, limit: int) -> List[str]:
+    """Splits an over-long HTML line at spaces outside of tags, cutting hard only when unavoidable."""
+    if len(line) <= limit:
+        return [line]
+    width = limit - _TAG_RESERVE  # Room for the tags reopened/closed around each piece
+    pieces: List[str] = []
+    while len(line) > width:
+        cut = line.rfind(" ", 0, width + 1)
+        while cut > 0 and _inside_markup(line, cut):
+            cut = line.rfind(" ", 0, cut)
+        if cut <= 0:
+            cut = width
+            while cut > 1 and _inside_markup(line, cut):
+                cut -= 1
+        pieces.append(line[:cut].rstrip())
+        line = line[cut:].lstrip(" ")
+    pieces.append(line)
+    return _balance_tags(pieces)
+
+
+def _inside_markup(line: str, position: int) -> bool:
+    """True if `position` falls inside an HTML tag or entity."""
+    return line.rfind("<", 0, position) > line.rfind(">", 0, position) or line.rfind("&", 0, position) > line.rfind(
+        ";", 0, position
+    )
+
+
+def _balance_tags(pieces: List[str]) -> List[str]:
+    """Closes inline tags left open at the end of a piece and reopens them in the next one."""
+    balanced = []
+    open_tags: List[str] = []
+    for piece in pieces:
+        prefix = "".join(f"<{tag}>" for tag in open_tags)
+        for match in re.finditer(r"<(/?)(b|i|code)>", piece):
+            if match.group(1):
+                if open_tags and open_tags[-1] == match.group(2):
+                    open_tags.pop()
+            else:
+                open_tags.append(match.group(2))
+        balanced.append(prefix + piece + "".join(f"</{tag}>" for tag in reversed(open_tags)))
+    return balanced
+
+
+def pack_blocks(blocks: List[_Block], limit: int = PACK_LIMIT) -> List[str]:
+    """Greedily packs blocks into messages of at most `limit` characters."""
+    messages: List[str] = []
+    current = ""
+
+    def fits(part: str, separator: str) -> bool:
+        return len(current) + len(separator) + len(part) <= limit if current else len(part) <= limit
+
+    def add(part: str, separator: str) -> None:
+        nonlocal current
+        current = current + separator + part if current else part
+
+    def flush() -> None:
+        nonlocal current
+        if current:
+            messages.append(current)
+        current = ""
+
+    for block in blocks:
+        rendered = block.render()
+        if fits(rendered, "\n\n"):
+            add(rendered, "\n\n")
+            continue
+        if len(rendered) <= limit and len(current) > limit // 2:
+            # The section fits a message of its own and the current one is well filled
+            flush()
+            add(rendered, "\n\n")
+            continue
+
+        # Split the block at line boundaries, filling the current message first
+        room = limit - len(block.prefix) - len(block.suffix)
+        lines = [piece for line in block.lines for piece in _split_words(line, room)]
+        group: List[str] = []
+        for line in lines:
+            if fits(block.render([*group, line]), "\n\n"):
+                group.append(line)
+                continue
+            if group:
+                add(block.render(group), "\n\n")
+            flush()
+            group = [line]
+        if group:
+            add(block.render(group), "\n\n")
+    flush()
+    return messages
+
+
+def pack_message(text: str, limit: int = PACK_LIMIT) -> List[str]:
+    """Converts a Markdown answer to Telegram HTML messages of at most `limit` characters."""
+    return pack_blocks(markdown_to_blocks(text), limit)
+
+
+def html_to_text(message: str) -> str:
+    """Plain-text fallback of a packed message."""
+    return html.unescape(_TAG.sub("", message))
+
+
+async def send_packed(send: Callable[..., Awaitable[Message]], text: str, **kwargs: Any) -> int:
+    """Sends a long Markdown answer with `send` (e.g. `message.reply_text`) and returns the message count.
+
+    A message Telegram fails to parse is resent as plain text rather than lost.
+    """
+    messages = pack_message(text)
+    for message in messages:
+        try:
+            await send(text=message, parse_mode="HTML", **kwargs)
+        except BadRequest as e:
+            logger.warning(f"Telegram rejected packed HTML ({e}), sending plain text instead.")
+            await send(text=html_to_text(message), **kwargs)
+    return len(messages)
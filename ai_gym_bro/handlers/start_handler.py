@@ -9,12 +9,24 @@ from ai_gym_bro.handlers.common import (
     COMMAND_DESCRIPTIONS, # Assuming you might define this centrally later
     TRAINING_PLAN_INSTRUCTIONS,  # Add this import
 )
+from ai_gym_bro.services.inflight import get_inflight_calls
+from ai_gym_bro.services.plan_queue import get_plan_queue
+from ai_gym_bro.services.speculation import get_speculative_plans
+
+
+def abort_generations(user_id: int) -> None:
+    """Drops the user's queued plan job and cancels their generations in flight, speculative ones included."""
+    get_speculative_plans().cancel(user_id)
+    get_plan_queue().cancel(user_id)
+    get_inflight_calls().cancel(user_id)
+
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Starts the conversation and asks for the first piece of info (age)."""
     user = update.effective_user
     logger.info(f"User {user.id} ({user.username}) started interaction.")
     context.user_data.clear() # Clear data from previous sessions
+    abort_generations(user.id)
 
     await update.message.reply_html(
         f"Привет {user.mention_html()}! Я твой AI Gym Bro. 💪\n\n"
@@ -49,4 +61,5 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         "Хорошо, операция отменена. До встречи! Напиши /start, если передумаешь."
     )
     context.user_data.clear()
+    abort_generations(user.id)
     return ConversationHandler.END 
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""Progressive rendering of streamed text into Telegram messages."""
+
+import asyncio
+import time
+from typing import Callable, List
+
+from loguru import logger
+from telegram import Bot
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from ai_gym_bro.handlers.message_packer import html_to_text, pack_message
+from ai_gym_bro.outbound_scheduler import bulk_request_kwargs
+
+
+class StreamingMessageWriter:
+    """Renders a growing text into a chat by editing a message in place.
+
+    Edits are rate limited to one per `edit_interval` seconds. When the text of the
+    current message grows past `message_limit` characters, the message is finalized
+    (cut at the last line break when possible) and writing continues in a new one.
+    The raw text is shown while it streams; `finalize` renders the finished text as HTML.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        bot: Bot,
+        chat_id: int,
+        message_id: int,
+        edit_interval: float = 1.0,
+        message_limit: int = 4000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._bot = bot
+        self._chat_id = chat_id
+        self._edit_interval = edit_interval
+        self._message_limit = message_limit
+        self._clock = clock
+        self._text = ""  # Full text of the message currently being written
+        self._shown = ""  # What Telegram currently displays for that message
+        self._last_edit = float("-inf")
+        self.message_ids: List[int] = [message_id]
+
+    @property
+    def has_output(self) -> bool:
+        """True once any streamed text reached the chat (or is waiting for the final flush)."""
+        return bool(self._text) or len(self.message_ids) > 1
+
+    async def append(self, delta: str) -> None:
+        """Adds a streamed delta, editing or rolling over messages as needed."""
+        self._text += delta
+        while len(self._text) > self._message_limit:
+            await self._roll_over()
+        if self._clock() - self._last_edit >= self._edit_interval:
+            await self._edit()
+
+    async def flush(self) -> None:
+        """Makes sure the current message shows everything received so far."""
+        await self._edit(final=True)
+
+    async def finalize(self, text: str) -> None:
+        """Replaces the streamed Markdown with `text` packed into HTML messages.
+
+        The streamed messages are edited in order; pages beyond them are sent as new
+        messages and streamed messages left over are deleted. A page Telegram fails to
+        parse is shown as plain text.
+        """
+        pages = pack_message(text)
+        for index, page in enumerate(pages):
+            if index < len(self.message_ids):
+                await self._render(self.message_ids[index], page)
+                continue
+            try:
+                message = await self._bot.send_message(
+                    chat_id=self._chat_id, text=page, parse_mode="HTML", **bulk_request_kwargs(self._bot)
+                )
+            except BadRequest as e:
+                logger.warning(f"Telegram rejected packed HTML ({e}), sending plain text instead.")
+                message = await self._bot.send_message(
+                    chat_id=self._chat_id, text=html_to_text(page), **bulk_request_kwargs(self._bot)
+                )
+            self.message_ids.append(message.message_id)
+        for message_id in self.message_ids[len(pages) :]:
+            try:
+                await self._bot.delete_message(chat_id=self._chat_id, message_id=message_id)
+            except TelegramError as e:
+                logger.warning(f"Could not delete streamed message {message_id} in chat {self._chat_id}: {e}")
+        del self.message_ids[len(pages) :]
+
+    async def _render(self, message_id: int, page: str) -> None:
+        """Edits a streamed message to its final HTML page, or to its plain text if the HTML is rejected."""
+        for text, parse_mode in ((page, "HTML"), (html_to_text(page), None)):
+            try:
+                await self._bot.edit_message_text(
+                    chat_id=self._chat_id,
+                    message_id=message_id,
+                    text=text,
+                    parse_mode=parse_mode,
+                    **bulk_request_kwargs(self._bot),
+                )
+                return
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    return
+                logger.warning(f"Final edit of message {message_id} rejected in chat {self._chat_id}: {e}")
+            except TelegramError as e:
+                logger.warning(f"Final edit of message {message_id} failed in chat {self._chat_id}: {e}")
+                return
+
+    async def _roll_over(self) -> None:
+        """Finalizes the current message and continues the text in a new one."""
+        cut = self._text.rfind("\n", 0, self._message_limit)
+        if cut < self._message_limit // 2:
+            cut = self._message_limit
+        head, self._text = self._text[:cut], self._text[cut:].lstrip("\n")
+        await self._edit(head, final=True)
+        message = await self._bot.send_message(
+            chat_id=self._chat_id, text=self._text or "…", **bulk_request_kwargs(self._bot)
+        )
+        self.message_ids.append(message.message_id)
+        self._shown = self._text or "…"
+        self._last_edit = self._clock()
+
+    async def _edit(self, text: str | None = None, final: bool = False) -> None:
+        """Edits the current message to `text` (defaults to the buffered text) if it changed.
+
+        Intermediate edits are skipped when Telegram throttles us; `final` edits wait and retry once.
+        """
+        text = self._text if text is None else text
+        if not text.strip() or text == self._shown:
+            return
+        try:
+            # Intermediate edits are dropped rather than queued behind a flood wait
+            await self._bot.edit_message_text(
+                chat_id=self._chat_id,
+                message_id=self.message_ids[-1],
+                text=text,
+                **bulk_request_kwargs(self._bot, retry=final),
+            )
+            self._shown = text
+        except RetryAfter as e:
+            logger.warning(f"Stream edit throttled in chat {self._chat_id}, retry after {e.retry_after}s")
+            if final:
+                await asyncio.sleep(e.retry_after)
+                await self._edit(text)
+        except BadRequest as e:
+            # "Message is not modified" and similar are harmless for a progressive preview
+            logger.debug(f"Stream edit rejected in chat {self._chat_id}: {e}")
+        except TelegramError as e:
+            logger.warning(f"Stream edit failed in chat {self._chat_id}: {e}")
+        self._last_edit = self._clock()
@@ -1,48 +1,80 @@
 """Handles the multi-step conversation workflow for plan generation."""
 
+import asyncio
+from functools import partial
+
 from loguru import logger
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Message, Update
 from telegram.ext import (
+    CallbackQueryHandler,
     ContextTypes,
     ConversationHandler,
     MessageHandler,
-    CallbackQueryHandler,
     filters,
 )
 
-from ai_gym_bro.services import openai_service  # Use the alias
+from ai_gym_bro.config import get_settings
 from ai_gym_bro.handlers.common import (
     ASK_AGE,
-    ASK_HEIGHT,
-    ASK_WEIGHT,
-    ASK_EXPERIENCE,
     ASK_BENCH,
+    ASK_EXPERIENCE,
+    ASK_HEIGHT,
     ASK_INJURIES,
-    SELECT_GOAL,
-    GENERATING_PLAN,
+    ASK_QUESTION_CALLBACK,
+    ASK_WEIGHT,
     AWAITING_REFINEMENT_CHOICE,
     AWAITING_REFINEMENT_INPUT,  # Updated states
-    GOAL_OPTIONS,
-    MUSCLE_GAIN,
     FAT_LOSS,
-    ASK_QUESTION_CALLBACK,
+    GENERATING_PLAN,
+    GOAL_OPTIONS,
     MODIFY_PLAN_CALLBACK,  # Refinement callback data
+    MUSCLE_GAIN,
+    SELECT_GOAL,
+    TRAINING_PLAN_INSTRUCTIONS,  # Add this import
     USER_DATA_AGE,
-    USER_DATA_HEIGHT,
-    USER_DATA_WEIGHT,
-    USER_DATA_EXPERIENCE,
     USER_DATA_BENCH,
-    USER_DATA_INJURIES,
+    USER_DATA_EXPERIENCE,
     USER_DATA_GOAL,
-    USER_DATA_PLAN,
+    USER_DATA_HEIGHT,
     USER_DATA_HISTORY,
+    USER_DATA_HISTORY_SUMMARY,
+    USER_DATA_INJURIES,
+    USER_DATA_PLAN,
+    USER_DATA_PLAN_JOB_STATE,
+    USER_DATA_PLAN_WEEKS,
     USER_DATA_REFINEMENT_TYPE,  # New user data key
-    TRAINING_PLAN_INSTRUCTIONS,  # Add this import
+    USER_DATA_WEIGHT,
+    WEEK_CALLBACK_PREFIX,
 )
-from ai_gym_bro.handlers.start_handler import start, cancel  # Import start for entry point, cancel for fallback
+from ai_gym_bro.handlers.conversation_metrics import InstrumentedConversationHandler
+from ai_gym_bro.handlers.message_packer import send_packed
+from ai_gym_bro.handlers.start_handler import cancel, start  # Import start for entry point, cancel for fallback
+from ai_gym_bro.handlers.stream_writer import StreamingMessageWriter
+from ai_gym_bro.logging_config import log_payload
+from ai_gym_bro.outbound_scheduler import bulk_request_kwargs
+from ai_gym_bro.services import openai_service  # Use the alias
+from ai_gym_bro.services.history_manager import get_history_manager
+from ai_gym_bro.services.history_store import compact_message, expand_history
+from ai_gym_bro.services.inflight import CallCancelledError, fingerprint, get_inflight_calls
+from ai_gym_bro.services.local_answers import answer_locally
+from ai_gym_bro.services.plan_patch import PatchError
+from ai_gym_bro.services.plan_queue import PlanJob, QueueFullError, get_plan_queue
+from ai_gym_bro.services.plan_weeks import TOTAL_WEEKS, render_week, weeks_in_plan
+from ai_gym_bro.services.profile import bench_max_kg
+from ai_gym_bro.services.speculation import SpeculativePlan, get_speculative_plans
 
 # --- Helper Functions ---
 
+# Everything the plan depends on except the goal
+PROFILE_KEYS = (
+    USER_DATA_AGE,
+    USER_DATA_HEIGHT,
+    USER_DATA_WEIGHT,
+    USER_DATA_EXPERIENCE,
+    USER_DATA_BENCH,
+    USER_DATA_INJURIES,
+)
+
 
 async def _ask_next_question(update: Update, context: ContextTypes.DEFAULT_TYPE, question: str, next_state: int) -> int:
     """Helper to ask a question and return the next state."""
@@ -67,10 +99,44 @@ async def _store_and_advance(
     """Helper to store user text input and ask the next question."""
     user_input = update.message.text
     context.user_data[key] = user_input
-    logger.debug(f"User {update.effective_user.id}: Stored {key} = {user_input}")
+    logger.debug("User {}: Stored {}", update.effective_user.id, key)
     return await _ask_next_question(update, context, question, next_state)
 
 
+def _create_stream_writer(
+    context: ContextTypes.DEFAULT_TYPE, placeholder: Message | bool
+) -> StreamingMessageWriter | None:
+    """Returns a writer that streams the plan into the placeholder message, if streaming is enabled."""
+    settings = get_settings()
+    if not settings.stream_plan or not isinstance(placeholder, Message):
+        return None
+    return StreamingMessageWriter(
+        context.bot,
+        chat_id=placeholder.chat_id,
+        message_id=placeholder.message_id,
+        edit_interval=settings.stream_edit_interval,
+        message_limit=settings.stream_message_limit,
+    )
+
+
+def _schedule_history_summary(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Folds refinement turns that left the verbatim window into the summary, in the background."""
+    history = context.user_data.get(USER_DATA_HISTORY)
+    summary = context.user_data.get(USER_DATA_HISTORY_SUMMARY)
+    if not history or not get_history_manager().turns_to_summarize(history, summary):
+        return
+    context.application.create_task(_fold_history(context.user_data, history, summary))
+
+
+async def _fold_history(user_data: dict, history: list, summary: dict | None) -> None:
+    """Computes the new rolling summary and stores it unless the conversation was restarted meanwhile."""
+    full_history = expand_history(history, user_data.get(USER_DATA_PLAN))
+    new_summary = await get_history_manager().fold(full_history, summary, openai_service.summarize_history)
+    if new_summary and user_data.get(USER_DATA_HISTORY) is history:
+        user_data[USER_DATA_HISTORY_SUMMARY] = new_summary
+        logger.debug(f"History summary now covers {new_summary['turns']} turns")
+
+
 # --- State Handler Functions ---
 
 
@@ -116,23 +182,44 @@ async def received_bench(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         update,
         context,
         USER_DATA_BENCH,
-        "Есть ли у вас какие-либо текущие травмы или физические ограничения, о которых мне следует знать? (Напишите 'Нет', если нет)",
+        "Есть ли у вас какие-либо текущие травмы или физические ограничения, о которых мне следует знать? "
+        "(Напишите 'Нет', если нет)",
         ASK_INJURIES,
     )
 
 
+def _goal_keyboard() -> InlineKeyboardMarkup:
+    """Keyboard with the training goal options."""
+    keyboard = [
+        [InlineKeyboardButton("Набор мышечной массы", callback_data=MUSCLE_GAIN)],
+        [InlineKeyboardButton("Уменьшение жировой массы", callback_data=FAT_LOSS)],
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+
+def _profile(context: ContextTypes.DEFAULT_TYPE) -> dict:
+    return {key: context.user_data.get(key) for key in PROFILE_KEYS}
+
+
+def _start_speculative_plans(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> None:
+    """Starts generating the plans of both goals while the user picks one (see services/speculation.py)."""
+    profile = _profile(context)
+
+    async def generate(goal: str, on_delta) -> tuple:
+        return await openai_service.generate_plan({**profile, USER_DATA_GOAL: goal}, on_delta=on_delta)
+
+    get_speculative_plans().start(user_id, profile, GOAL_OPTIONS, generate)
+
+
 async def received_injuries(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Stores injuries and asks for training goal."""
     user_input = update.message.text
     context.user_data[USER_DATA_INJURIES] = user_input
-    logger.debug(f"User {update.effective_user.id}: Stored {USER_DATA_INJURIES} = {user_input}")
+    logger.debug("User {}: Stored {}", update.effective_user.id, USER_DATA_INJURIES)
+    if get_settings().speculation_enabled:
+        _start_speculative_plans(context, update.effective_user.id)
 
-    keyboard = [
-        [InlineKeyboardButton("Набор мышечной массы", callback_data=MUSCLE_GAIN)],
-        [InlineKeyboardButton("Уменьшение жировой массы", callback_data=FAT_LOSS)],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text("Наконец, какова ваша основная цель тренировок?", reply_markup=reply_markup)
+    await update.message.reply_text("Наконец, какова ваша основная цель тренировок?", reply_markup=_goal_keyboard())
     return SELECT_GOAL
 
 
@@ -144,61 +231,266 @@ async def received_goal(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     context.user_data[USER_DATA_GOAL] = goal
     logger.info(f"User {update.effective_user.id}: Selected goal {goal}")
 
-    await query.edit_message_text(
-        text=f"Отлично! Цель выбрана: {goal}.\n\nГенерирую ваш персональный план... Это может занять некоторое время. 🧠"
+    # A plan already generated (or generating) for this goal skips the queue
+    speculative = None
+    if get_settings().speculation_enabled:
+        speculative = get_speculative_plans().take(update.effective_user.id, _profile(context), goal)
+
+    if speculative is None and get_settings().plan_queue_enabled and get_plan_queue().running:
+        return await _enqueue_plan_generation(update, context)
+
+    placeholder = await query.edit_message_text(
+        text=f"Отлично! Цель выбрана: {goal}.\n\n"
+        "Генерирую ваш персональный план... Это может занять некоторое время. 🧠"
     )
+    return await _generate_and_send_plan(
+        context, update.effective_chat.id, update.effective_user.id, placeholder, speculative
+    )
+
+
+async def _enqueue_plan_generation(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Hands plan generation to the background queue and tells the user their place in line."""
+    query = update.callback_query
+    queue = get_plan_queue()
+    chat_id, user_id = update.effective_chat.id, update.effective_user.id
+    goal = context.user_data[USER_DATA_GOAL]
+    placeholder: Message | bool = True
+    placeholder_ready = asyncio.Event()
+
+    async def run_job() -> None:
+        await placeholder_ready.wait()  # The job may be picked up before the placeholder is shown
+        state = await _generate_and_send_plan(context, chat_id, user_id, placeholder)
+        # The conversation can only change state from a handler: the next update moves it on (see plan_in_progress)
+        context.user_data[USER_DATA_PLAN_JOB_STATE] = state
+        context.application.mark_data_for_update_persistence(user_ids=[user_id])
+
+    context.user_data.pop(USER_DATA_PLAN_JOB_STATE, None)  # Left over by an earlier job
+    try:
+        position = queue.submit(PlanJob(user_id=user_id, run=run_job))
+    except QueueFullError:
+        logger.warning(f"Plan queue full, asking user {user_id} to retry later.")
+        await query.edit_message_text(
+            text="Сейчас очень много запросов 😓 Пожалуйста, выберите цель еще раз через пару минут.",
+            reply_markup=_goal_keyboard(),
+        )
+        return SELECT_GOAL
+
+    ahead = position - queue.idle_workers
+    queue_note = f"Вы №{ahead} в очереди, я пришлю план, как только он будет готов." if ahead > 0 else ""
+    try:
+        placeholder = await query.edit_message_text(
+            text=f"Отлично! Цель выбрана: {goal}.\n\nГенерирую ваш персональный план... 🧠\n{queue_note}".strip()
+        )
+    finally:
+        placeholder_ready.set()
+    return GENERATING_PLAN
+
+
+async def _take_over_speculative_plan(
+    speculative: SpeculativePlan, writer: StreamingMessageWriter | None, user_id: int, key: str
+) -> tuple[str | None, list]:
+    """Waits for the speculative plan, streaming the rest of it; returns (plan, history), no plan if it failed."""
+    logger.info(f"User {user_id}: using the speculative plan")
+    generate = partial(speculative.result, writer.append if writer else None)
+    plan, history = await get_inflight_calls().run(user_id, key, generate)
+    if not plan:
+        logger.warning(f"User {user_id}: speculative plan failed, generating it again")
+    return plan, history
+
+
+async def _generate_and_send_plan(
+    context: ContextTypes.DEFAULT_TYPE,
+    chat_id: int,
+    user_id: int,
+    placeholder: Message | bool,
+    speculative: SpeculativePlan | None = None,
+) -> int:
+    """Generates the plan or takes over the speculative one, sends it with the refinement options."""
+    # When streaming, the placeholder is edited in place as the plan arrives
+    writer = _create_stream_writer(context, placeholder)
 
     # --- Plan Generation --- (Transition happens here implicitly)
     try:
         user_info = context.user_data.copy()  # Get collected data
-        plan, history = await openai_service.generate_plan(user_info)
+        # The same plan requested again while in flight joins it, /cancel and /start cancel it
+        key = fingerprint("plan", _profile(context), user_info.get(USER_DATA_GOAL))
+        plan, history = None, []
+        if speculative is not None:
+            plan, history = await _take_over_speculative_plan(speculative, writer, user_id, key)
+            if not plan and writer is not None and writer.has_output:
+                writer = None  # Partial output is on screen, the new plan is sent in full instead
+        if not plan:
+            if writer:
+                generate = partial(openai_service.generate_plan, user_info, on_delta=writer.append)
+            else:
+                generate = partial(openai_service.generate_plan, user_info)
+            plan, history = await get_inflight_calls().run(user_id, key, generate)
 
         if plan:
             context.user_data[USER_DATA_PLAN] = plan
             # Initialize history for refinement
             context.user_data[USER_DATA_HISTORY] = history
+            _store_plan_weeks(context.user_data, plan)
 
-            # Send instructions first
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text=TRAINING_PLAN_INSTRUCTIONS,
-                parse_mode="Markdown"
-            )
+            streamed = writer is not None and writer.has_output
+            if streamed:
+                # The plan is already on screen as raw Markdown, render it like a plan sent in full
+                await writer.finalize(plan)
 
-            # Send plan in chunks if too long (Telegram limit is 4096 chars)
-            for i in range(0, len(plan), 4000):
-                await context.bot.send_message(chat_id=update.effective_chat.id, text=plan[i : i + 4000])
+            # Send instructions (before the plan, unless it was streamed above)
+            await context.bot.send_message(chat_id=chat_id, text=TRAINING_PLAN_INSTRUCTIONS, parse_mode="Markdown")
+
+            if not streamed:
+                # Send plan split at section/line boundaries (Telegram limit is 4096 chars)
+                await send_packed(
+                    partial(context.bot.send_message, chat_id=chat_id), plan, **bulk_request_kwargs(context.bot)
+                )
 
             # Present refinement options
             keyboard = [
                 [InlineKeyboardButton("❓ Задать вопрос", callback_data=ASK_QUESTION_CALLBACK)],
                 [InlineKeyboardButton("✏️ Предложить изменение", callback_data=MODIFY_PLAN_CALLBACK)],
-                [InlineKeyboardButton("🏁 Завершить (Отмена)", callback_data="cancel_refinement")],  # Option to exit loop
+                # Option to exit loop
+                [InlineKeyboardButton("🏁 Завершить (Отмена)", callback_data="cancel_refinement")],
             ]
+            text = "Что бы вы хотели сделать дальше?"
+            if USER_DATA_PLAN_WEEKS in context.user_data:
+                keyboard.insert(0, [_week_button(2)])
+                text = f"В плане расписана неделя 1, следующие — по кнопке или командой /week N. {text}"
             reply_markup = InlineKeyboardMarkup(keyboard)
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id, text="Что бы вы хотели сделать дальше?", reply_markup=reply_markup
-            )
+            await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup)
+            _prefetch_next_week(context, user_id)
             return AWAITING_REFINEMENT_CHOICE  # Go to new state
         else:
-            logger.error(f"Plan generation failed for user {update.effective_user.id}")
+            logger.error(f"Plan generation failed for user {user_id}")
             await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text="Извините, произошла ошибка при генерации вашего плана. Пожалуйста, попробуйте позже, отправив /start.",
+                chat_id=chat_id,
+                text="Извините, произошла ошибка при генерации вашего плана. "
+                "Пожалуйста, попробуйте позже, отправив /start.",
             )
             context.user_data.clear()
             return ConversationHandler.END
 
+    except CallCancelledError:
+        logger.info(f"User {user_id}: plan generation cancelled")
+        return SELECT_GOAL  # The /cancel (or /start) that cancelled it ends the conversation
+
     except Exception as e:
-        logger.exception(f"Exception during plan generation for user {update.effective_user.id}: {e}")
+        logger.exception(f"Exception during plan generation for user {user_id}: {e}")
         await context.bot.send_message(
-            chat_id=update.effective_chat.id,
+            chat_id=chat_id,
             text="Произошла непредвиденная ошибка при генерации плана. Пожалуйста, попробуйте /start снова.",
         )
         context.user_data.clear()
         return ConversationHandler.END
 
 
+# --- Plans generated week by week ---
+
+# Weeks are generated under one key per user, so /week joins a prefetch (or an earlier /week) in flight
+WEEKS_KEY = "weeks"
+
+
+def _store_plan_weeks(user_data: dict, plan: str) -> None:
+    """Records how many weeks a plan generated week by week has; other plans have them all."""
+    weeks = weeks_in_plan(plan)
+    if get_settings().plan_lazy_weeks and weeks < TOTAL_WEEKS:
+        user_data[USER_DATA_PLAN_WEEKS] = max(weeks, 1)
+    else:
+        user_data.pop(USER_DATA_PLAN_WEEKS, None)
+
+
+def _week_button(week: int) -> InlineKeyboardButton:
+    return InlineKeyboardButton(f"📅 Неделя {week}", callback_data=f"{WEEK_CALLBACK_PREFIX}{week}")
+
+
+async def _generate_weeks(context: ContextTypes.DEFAULT_TYPE, user_id: int, upto: int) -> str | None:
+    """Generates the plan's weeks up to `upto` and stores them, unless the plan was replaced meanwhile."""
+    user_data = context.user_data
+    plan, weeks_done = user_data[USER_DATA_PLAN], user_data[USER_DATA_PLAN_WEEKS]
+    new_plan = await openai_service.generate_weeks(user_data.copy(), plan, weeks_done, upto)
+    if new_plan and user_data.get(USER_DATA_PLAN) is plan:
+        user_data[USER_DATA_PLAN] = new_plan
+        user_data[USER_DATA_PLAN_WEEKS] = upto
+        context.application.mark_data_for_update_persistence(user_ids=[user_id])
+    return new_plan
+
+
+async def _ensure_weeks(context: ContextTypes.DEFAULT_TYPE, user_id: int, upto: int) -> str | None:
+    """Returns the plan with weeks up to `upto`, generating the missing ones; joins a generation in flight."""
+    while (weeks_done := context.user_data.get(USER_DATA_PLAN_WEEKS)) is not None and weeks_done < upto:
+        # A joined generation may stop short of `upto`, the next round generates the rest
+        if not await get_inflight_calls().run(user_id, WEEKS_KEY, partial(_generate_weeks, context, user_id, upto)):
+            return None
+    return context.user_data.get(USER_DATA_PLAN)
+
+
+def _prefetch_next_week(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> None:
+    """Generates the week after the last one in the background, while the bot is otherwise idle."""
+    weeks_done = context.user_data.get(USER_DATA_PLAN_WEEKS)
+    if not get_settings().plan_week_prefetch or weeks_done is None or weeks_done >= TOTAL_WEEKS:
+        return
+    if get_inflight_calls().in_flight(user_id, WEEKS_KEY) or get_plan_queue().depth > 0:
+        return  # Already generating, or plans are waiting for workers
+    get_inflight_calls().start(user_id, WEEKS_KEY, partial(_generate_weeks, context, user_id, weeks_done + 1))
+
+
+async def show_week(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Shows one week of the plan (/week N or a week button), generating the week first if needed."""
+    query = update.callback_query
+    if query:
+        await query.answer()
+        week = int(query.data.removeprefix(WEEK_CALLBACK_PREFIX))
+        reply = query.message.reply_text
+    else:
+        week = int(context.args[0]) if context.args and context.args[0].isdigit() else None
+        reply = update.message.reply_text
+    user_id = update.effective_user.id
+
+    if not context.user_data.get(USER_DATA_PLAN):
+        await reply("У вас пока нет плана. Отправьте /start, чтобы создать его.")
+        return
+    if week is None or not 1 <= week <= TOTAL_WEEKS:
+        await reply(f"Укажите неделю от 1 до {TOTAL_WEEKS}, например: /week 2")
+        return
+
+    weeks_done = context.user_data.get(USER_DATA_PLAN_WEEKS)
+    if weeks_done is not None and week > weeks_done:
+        if not get_inflight_calls().in_flight(user_id, WEEKS_KEY):
+            await reply(f"Составляю неделю {week}... ⏳")
+        try:
+            plan = await _ensure_weeks(context, user_id, week)
+        except CallCancelledError:
+            logger.info(f"User {user_id}: week {week} generation cancelled")
+            return
+        if not plan or context.user_data.get(USER_DATA_PLAN_WEEKS, TOTAL_WEEKS) < week:
+            await reply("Не удалось составить эту неделю. Пожалуйста, попробуйте позже.")
+            return
+    else:
+        plan = context.user_data[USER_DATA_PLAN]
+
+    await send_packed(reply, render_week(plan, week, bench_max_kg(context.user_data)))
+    if week < TOTAL_WEEKS:
+        await reply("Следующая неделя:", reply_markup=InlineKeyboardMarkup([[_week_button(week + 1)]]))
+    _prefetch_next_week(context, user_id)
+
+
+async def plan_in_progress(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Answers messages sent while a queued plan is generated, or moves on to the state its job ended in."""
+    state = context.user_data.pop(USER_DATA_PLAN_JOB_STATE, None)
+    if state is not None:
+        # Neither the refinement choice nor an ended conversation expects text
+        await unknown_state_handler(update, context)
+        return state
+
+    position = get_plan_queue().position(update.effective_user.id)
+    if position:
+        await update.message.reply_text(f"Ваш план еще в очереди (вы №{position}). Пожалуйста, подождите. ⏳")
+    else:
+        await update.message.reply_text("Ваш план уже генерируется, осталось совсем немного. ⏳")
+    return GENERATING_PLAN
+
+
 # New handler for refinement choice buttons
 async def received_refinement_choice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handles the user's choice between asking a question or suggesting modification."""
@@ -222,17 +514,48 @@ async def received_refinement_choice(update: Update, context: ContextTypes.DEFAU
         return ConversationHandler.END
     else:
         logger.warning(f"Received unexpected callback data in refinement choice: {choice}")
-        await query.edit_message_text(text="Извините, что-то пошло не так. Пожалуйста, попробуйте снова или используйте /cancel.")
+        await query.edit_message_text(
+            text="Извините, что-то пошло не так. Пожалуйста, попробуйте снова или используйте /cancel."
+        )
         return AWAITING_REFINEMENT_CHOICE
 
 
+def _next_action_keyboard() -> InlineKeyboardMarkup:
+    """Keyboard shown after an answer: another question, another change, or finish."""
+    keyboard = [
+        [InlineKeyboardButton("❓ Задать еще вопрос", callback_data=ASK_QUESTION_CALLBACK)],
+        [InlineKeyboardButton("✏️ Предложить еще изменение", callback_data=MODIFY_PLAN_CALLBACK)],
+        [InlineKeyboardButton("🏁 Завершить (Отмена)", callback_data="cancel_refinement")],
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def _modify_plan(context: ContextTypes.DEFAULT_TYPE, history: list) -> tuple:
+    """Applies the requested change to the stored plan as a patch; returns the summary and changed sections.
+
+    Falls back to a free-text answer from `refine_plan` if the model's patch does not apply.
+    """
+    summary = context.user_data.get(USER_DATA_HISTORY_SUMMARY)
+    plan = context.user_data[USER_DATA_PLAN]
+    try:
+        modification, new_history = await openai_service.modify_plan(history, summary, plan)
+    except PatchError as e:
+        logger.warning(f"Invalid plan patch ({e}), answering with a free-text refinement instead.")
+        return await openai_service.refine_plan(history, summary, plan)
+    if modification is None:
+        return None, new_history
+    context.user_data[USER_DATA_PLAN] = modification.plan
+    return modification.render(), new_history
+
+
 # Renamed from received_refinement_request
 async def process_refinement_input(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handles user's text input for refinement/questions after choice."""
     user_request = update.message.text
     user = update.effective_user
     refinement_type = context.user_data.get(USER_DATA_REFINEMENT_TYPE, "unknown")
-    logger.info(f"User {user.id} refinement input (type: {refinement_type}): {user_request}")
+    logger.info("User {} refinement input (type: {}, {} chars)", user.id, refinement_type, len(user_request))
+    log_payload("Refinement input", lambda: user_request)
 
     if USER_DATA_HISTORY not in context.user_data or not context.user_data[USER_DATA_HISTORY]:
         logger.warning(f"User {user.id} in refinement state but no history found.")
@@ -243,30 +566,40 @@ async def process_refinement_input(update: Update, context: ContextTypes.DEFAULT
         return ConversationHandler.END
 
     history = context.user_data[USER_DATA_HISTORY]
-    history.append({"role": "user", "content": user_request})
+    history.append(compact_message({"role": "user", "content": user_request}))
+
+    if refinement_type == "ask" and get_settings().local_answers_enabled:
+        answer = answer_locally(user_request, context.user_data.get(USER_DATA_PLAN), bench_max_kg(context.user_data))
+        if answer:
+            logger.info(f"User {user.id}: question answered locally from the plan")
+            history.append(compact_message({"role": "assistant", "content": answer}))
+            _schedule_history_summary(context)
+            await send_packed(update.message.reply_text, answer)
+            await update.message.reply_text("Что бы вы хотели сделать дальше?", reply_markup=_next_action_keyboard())
+            return AWAITING_REFINEMENT_CHOICE
 
     await update.message.reply_text("Понял. Обдумываю ваш запрос... 🤔")
 
     try:
-        response, new_history = await openai_service.refine_plan(history)
+        if refinement_type == "modify" and get_settings().plan_patch_enabled and context.user_data.get(USER_DATA_PLAN):
+            refine = partial(_modify_plan, context, history)
+        else:
+            refine = partial(
+                openai_service.refine_plan,
+                history,
+                context.user_data.get(USER_DATA_HISTORY_SUMMARY),
+                context.user_data.get(USER_DATA_PLAN),
+            )
+        key = fingerprint("refine", refinement_type, user_request)
+        response, new_history = await get_inflight_calls().run(user.id, key, refine)
 
         if response:
-            if len(response) > 4096:
-                logger.warning("Refinement response exceeds Telegram limit. Sending truncated.")
-                response_part = response[:4000] + "... (ответ обрезан)"
-            else:
-                response_part = response
-
             context.user_data[USER_DATA_HISTORY] = new_history
-            await update.message.reply_text(response_part)
+            _schedule_history_summary(context)
+            # Long answers are sent in full, split into as few messages as possible
+            await send_packed(update.message.reply_text, response)
 
-            keyboard = [
-                [InlineKeyboardButton("❓ Задать еще вопрос", callback_data=ASK_QUESTION_CALLBACK)],
-                [InlineKeyboardButton("✏️ Предложить еще изменение", callback_data=MODIFY_PLAN_CALLBACK)],
-                [InlineKeyboardButton("🏁 Завершить (Отмена)", callback_data="cancel_refinement")],
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await update.message.reply_text("Что бы вы хотели сделать дальше?", reply_markup=reply_markup)
+            await update.message.reply_text("Что бы вы хотели сделать дальше?", reply_markup=_next_action_keyboard())
             return AWAITING_REFINEMENT_CHOICE
         else:
             logger.error(f"Plan refinement failed for user {user.id}")
@@ -277,10 +610,15 @@ async def process_refinement_input(update: Update, context: ContextTypes.DEFAULT
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             await update.message.reply_text(
-                "Извините, я не смог обработать этот запрос. Попробуйте переформулировать или выберите опцию:", reply_markup=reply_markup
+                "Извините, я не смог обработать этот запрос. Попробуйте переформулировать или выберите опцию:",
+                reply_markup=reply_markup,
             )
             return AWAITING_REFINEMENT_CHOICE
 
+    except CallCancelledError:
+        logger.info(f"User {user.id}: refinement cancelled")
+        return AWAITING_REFINEMENT_CHOICE
+
     except Exception as e:
         logger.exception(f"Exception during plan refinement for user {user.id}: {e}")
         keyboard = [
@@ -290,7 +628,8 @@ async def process_refinement_input(update: Update, context: ContextTypes.DEFAULT
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await update.message.reply_text(
-            "Произошла непредвиденная ошибка. Пожалуйста, попробуйте снова или выберите опцию:", reply_markup=reply_markup
+            "Произошла непредвиденная ошибка. Пожалуйста, попробуйте снова или выберите опцию:",
+            reply_markup=reply_markup,
         )
         return AWAITING_REFINEMENT_CHOICE
 
@@ -305,10 +644,12 @@ async def unknown_state_handler(update: Update, context: ContextTypes.DEFAULT_TY
 
 # --- Conversation Handler Definition ---
 
+REFINEMENT_CHOICE_PATTERN = f"^({ASK_QUESTION_CALLBACK}|{MODIFY_PLAN_CALLBACK}|cancel_refinement)$"
+
 
 def create_workflow_handler() -> ConversationHandler:
     """Creates the ConversationHandler for the main workflow."""
-    return ConversationHandler(
+    return InstrumentedConversationHandler(
         entry_points=[MessageHandler(filters.Regex("^/start$"), start)],  # Use start from start_handler as entry
         states={
             ASK_AGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, received_age)],
@@ -318,17 +659,22 @@ def create_workflow_handler() -> ConversationHandler:
             ASK_BENCH: [MessageHandler(filters.TEXT & ~filters.COMMAND, received_bench)],
             ASK_INJURIES: [MessageHandler(filters.TEXT & ~filters.COMMAND, received_injuries)],
             SELECT_GOAL: [CallbackQueryHandler(received_goal)],
-            # Note: GENERATING_PLAN is a transient state handled within received_goal
+            # GENERATING_PLAN is only used when the plan is generated by the background queue;
+            # the job sends the refinement options itself once the plan is ready and records the
+            # state it ended in, which plan_in_progress moves the conversation to
+            GENERATING_PLAN: [
+                CallbackQueryHandler(received_refinement_choice, pattern=REFINEMENT_CHOICE_PATTERN),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, plan_in_progress),
+            ],
             AWAITING_REFINEMENT_CHOICE: [
-                CallbackQueryHandler(
-                    received_refinement_choice,
-                    pattern=f"^({ASK_QUESTION_CALLBACK}|{MODIFY_PLAN_CALLBACK}|cancel_refinement)$",
-                )
+                CallbackQueryHandler(received_refinement_choice, pattern=REFINEMENT_CHOICE_PATTERN)
             ],
             AWAITING_REFINEMENT_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_refinement_input)],
         },
         fallbacks=[
             MessageHandler(filters.Regex("^/cancel$"), cancel),  # Use cancel from start_handler
+            # Restarts from any state, cancelling a generation in progress (see PerUserUpdateProcessor)
+            MessageHandler(filters.Regex("^/start$"), start),
             CallbackQueryHandler(cancel, pattern="^cancel_refinement$"),  # Handle cancel button from refinement choice
             MessageHandler(filters.COMMAND, unknown_state_handler),  # Handle unexpected commands
             MessageHandler(filters.ALL, unknown_state_handler),  # Handle unexpected message types
@@ -0,0 +1,29 @@
+"""Bot API HTTP transport that records the latency of every request."""
+
+import time
+from typing import Any, Optional, Tuple
+
+from telegram.request import HTTPXRequest, RequestData
+
+from ai_gym_bro.metrics import TELEGRAM_REQUEST_LATENCY
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """`HTTPXRequest` observing `telegram_request_seconds` by Bot API method and HTTP status."""
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        **timeouts: Any,
+    ) -> Tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]  # .../bot<token>/sendMessage; keeps the token out of labels
+        started = time.monotonic()
+        status = "error"  # Network errors and timeouts raise before a status is known
+        try:
+            code, payload = await super().do_request(url, method, request_data, **timeouts)
+            status = str(code)
+            return code, payload
+        finally:
+            TELEGRAM_REQUEST_LATENCY.labels(api_method, status).observe(time.monotonic() - started)
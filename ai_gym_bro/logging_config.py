@@ -0,0 +1,53 @@
+"""Loguru setup and helpers keeping logging cheap on the event loop.
+
+Sinks are written from a background thread (`enqueue=True`), so a slow disk or console
+does not block handlers. The log file holds one JSON object per line, with the fields
+bound to the record (user id, state, operation, latency, tokens) under `extra`.
+
+Large payloads (profiles, prompts, model responses) are only dumped through
+`log_payload`, for the sampled share of calls set by LOG_PAYLOAD_SAMPLE_RATE.
+"""
+
+import random
+import sys
+from typing import Any, Callable
+
+from loguru import logger
+
+from ai_gym_bro.config import Settings, get_settings
+
+CONSOLE_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan> - <level>{message}</level>"
+)
+LOG_FILE_ROTATION = "10 MB"
+
+
+def setup_logging(settings: Settings) -> None:
+    """Replaces loguru's default sink with the console and JSON file sinks of `settings`."""
+    logger.remove()
+    logger.add(sys.stdout, level=settings.log_level, format=CONSOLE_FORMAT, enqueue=True)
+    if settings.log_file:
+        logger.add(
+            settings.log_file,
+            level=settings.log_file_level,
+            rotation=LOG_FILE_ROTATION,
+            serialize=True,
+            enqueue=True,
+        )
+
+
+def payload_sampled() -> bool:
+    """Decides whether the current call dumps its payloads."""
+    rate = get_settings().log_payload_sample_rate
+    return rate > 0 and random.random() < rate
+
+
+def log_payload(label: str, payload: Callable[[], Any]) -> None:
+    """Logs `payload()` at DEBUG for a sampled share of calls.
+
+    `payload` is only called, and its result only formatted, if the dump is sampled and a
+    sink accepts DEBUG.
+    """
+    if payload_sampled():
+        logger.opt(lazy=True, depth=1).debug("{}: {}", lambda: label, payload)
@@ -1,85 +1,173 @@
 """Main entry point for the Telegram bot."""
 
 import os
-from pathlib import Path
 
+from dotenv import load_dotenv
 from loguru import logger
 from telegram import Update
 from telegram.ext import (
     Application,
-    ContextTypes,
-    PicklePersistence,
+    BasePersistence,
+    CallbackQueryHandler,
     CommandHandler,
+    PicklePersistence,
 )
-from dotenv import load_dotenv
 
 # Import handlers
+from ai_gym_bro.config import get_settings
 from ai_gym_bro.handlers import start_handler, workflow_handler
+from ai_gym_bro.handlers.common import WEEK_CALLBACK_PREFIX
+from ai_gym_bro.instrumented_request import InstrumentedRequest
+from ai_gym_bro.logging_config import setup_logging
+from ai_gym_bro.metrics import start_metrics_server
+from ai_gym_bro.outbound_scheduler import OutboundScheduler
+from ai_gym_bro.services import openai_service
+from ai_gym_bro.services.inflight import get_inflight_calls
+from ai_gym_bro.services.plan_queue import get_plan_queue
+from ai_gym_bro.services.speculation import get_speculative_plans
+from ai_gym_bro.services.tracing import get_tracer
+from ai_gym_bro.storage.migrate_pickle import DEFAULT_PICKLE_PATH, DEFAULT_SQLITE_PATH, migrate_pickle
+from ai_gym_bro.storage.sqlite_persistence import SQLitePersistence
+from ai_gym_bro.update_processor import PerUserUpdateProcessor
 
 
 async def post_init(application: Application) -> None:
-    """Sets the bot commands after initialization."""
-    commands = [
-        (command, description)
-        for command, description in start_handler.COMMAND_DESCRIPTIONS.items()
-    ]
+    """Sets the bot commands and starts the OpenAI client, trace exporter and plan workers after initialization."""
+    commands = [(command, description) for command, description in start_handler.COMMAND_DESCRIPTIONS.items()]
     await application.bot.set_my_commands(commands)
     logger.info("Bot commands set.")
 
+    openai_service.get_client()
+    tracer = get_tracer()
+    if tracer:
+        await tracer.exporter.start()
 
-def main() -> None:
-    """Starts the bot."""
-    load_dotenv() # Load environment variables from .env file
+    if get_settings().plan_queue_enabled:
+        await get_plan_queue().start()
 
-    bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
-    if not bot_token:
-        logger.error("TELEGRAM_BOT_TOKEN environment variable not set!")
-        return
 
-    # Setup persistence
-    persistence_path = Path(__file__).parent / "persistence" / "bot_persistence.pkl"
-    persistence_path.parent.mkdir(parents=True, exist_ok=True) # Ensure directory exists
-    logger.info(f"Using persistence file: {persistence_path}")
-    persistence = PicklePersistence(filepath=persistence_path)
+async def post_shutdown(application: Application) -> None:
+    """Stops background workers, closes the OpenAI client and flushes traces before the application exits."""
+    if get_plan_queue().running:
+        await get_plan_queue().stop()
+    get_speculative_plans().cancel_all()
+    get_inflight_calls().cancel_all()
+    await openai_service.close_client()
+    tracer = get_tracer()
+    if tracer:
+        await tracer.exporter.stop()  # Exports the traces still buffered
 
-    # Create the Application
-    application = (
+
+def create_persistence(backend: str) -> BasePersistence:
+    """Creates the configured persistence, importing the legacy pickle into a new SQLite database."""
+    DEFAULT_PICKLE_PATH.parent.mkdir(parents=True, exist_ok=True)  # Ensure directory exists
+    if backend == "pickle":
+        logger.info(f"Using persistence file: {DEFAULT_PICKLE_PATH}")
+        return PicklePersistence(filepath=DEFAULT_PICKLE_PATH)
+
+    if not DEFAULT_SQLITE_PATH.exists() and DEFAULT_PICKLE_PATH.exists():
+        logger.info("Found legacy pickle persistence, importing it into SQLite...")
+        migrate_pickle(DEFAULT_PICKLE_PATH, DEFAULT_SQLITE_PATH)
+    logger.info(f"Using SQLite persistence: {DEFAULT_SQLITE_PATH}")
+    return SQLitePersistence(DEFAULT_SQLITE_PATH)
+
+
+# Update types the handlers react to: commands/text messages and inline keyboard callbacks
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+
+def build_application(bot_token: str, persistence: BasePersistence | None = None) -> Application:
+    """Builds the Application with all handlers registered."""
+    settings = get_settings()
+
+    builder = (
         Application.builder()
         .token(bot_token)
-        .persistence(persistence)
-        .post_init(post_init) # Set commands after setup
-        .build()
+        .request(InstrumentedRequest(connection_pool_size=256))  # Same pool size as PTB's default
+        .post_init(post_init)  # Set commands after setup
+        .post_shutdown(post_shutdown)
     )
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    if settings.telegram_api_url:
+        api_url = settings.telegram_api_url.rstrip("/")
+        builder = builder.base_url(f"{api_url}/bot").base_file_url(f"{api_url}/file/bot")
+    if settings.telegram_scheduler_enabled:
+        # Outgoing messages are paced to Telegram's global and per-chat flood limits
+        builder = builder.rate_limiter(
+            OutboundScheduler(settings.telegram_global_rate, settings.telegram_chat_rate, settings.telegram_chat_burst)
+        )
+    if settings.concurrent_updates > 1:
+        # Different users are served concurrently, each user's updates stay in order
+        logger.info(f"Processing up to {settings.concurrent_updates} updates concurrently.")
+        # /cancel cancels the user's generation right away instead of waiting behind it
+        builder = builder.concurrent_updates(
+            PerUserUpdateProcessor(settings.concurrent_updates, on_abort=start_handler.abort_generations)
+        )
+    application = builder.build()
 
     # Add top-level command handlers first (like /help)
     application.add_handler(CommandHandler("help", start_handler.help_command))
+    # Weeks of the plan are shown in any state, before the conversation's fallback sees /week
+    application.add_handler(CommandHandler("week", workflow_handler.show_week))
+    application.add_handler(CallbackQueryHandler(workflow_handler.show_week, pattern=f"^{WEEK_CALLBACK_PREFIX}\\d+$"))
 
     # Create and add the main workflow handler
     conv_handler = workflow_handler.create_workflow_handler()
     application.add_handler(conv_handler)
+    return application
+
+
+def main() -> None:
+    """Starts the bot."""
+    load_dotenv()  # Load environment variables from .env file
+    settings = get_settings()
+    setup_logging(settings)
+
+    bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not bot_token:
+        logger.error("TELEGRAM_BOT_TOKEN environment variable not set!")
+        return
+
+    if settings.update_mode == "webhook" and not (settings.webhook_url and settings.webhook_secret_token):
+        logger.error("Webhook mode requires WEBHOOK_URL and WEBHOOK_SECRET_TOKEN to be set!")
+        return
+
+    if settings.metrics_port:
+        start_metrics_server(settings.metrics_port)
+
+    # Setup persistence
+    persistence = create_persistence(settings.persistence_backend)
+
+    # Create the Application
+    application = build_application(bot_token, persistence)
 
     # Configure logging for PTB
     # logging.basicConfig( # Handled by Loguru setup potentially
     #     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
     # )
     # logging.getLogger("httpx").setLevel(logging.WARNING)
-    logger.info("Starting bot polling...")
 
     # Start the Bot
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if settings.update_mode == "webhook":
+        # Telegram pushes updates to our HTTP server; requests without the secret token header are rejected
+        logger.info(
+            f"Starting bot webhook server on {settings.webhook_listen}:{settings.webhook_port}"
+            f"/{settings.webhook_path}..."
+        )
+        application.run_webhook(
+            listen=settings.webhook_listen,
+            port=settings.webhook_port,
+            url_path=settings.webhook_path,
+            webhook_url=settings.webhook_url,
+            secret_token=settings.webhook_secret_token,
+            max_connections=settings.webhook_max_connections,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+    else:
+        logger.info("Starting bot polling...")
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == "__main__":
-    # Configure Loguru
-    logger.add(
-        "ai_gym_bro.log",
-        rotation="10 MB",
-        level="DEBUG", # Log debug messages to file
-        format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {name}:{function}:{line} - {message}"
-    )
-    logger.add(
-        lambda msg: print(msg, end=""), # Log info to console
-        level="INFO",
-        format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan> - <level>{message}</level>"
-    )
     main()
@@ -0,0 +1,108 @@
+"""Prometheus metrics of the bot, served on METRICS_PORT when it is set."""
+
+from loguru import logger
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+# --- OpenAI client resilience --- #
+OPENAI_REQUESTS = Counter(
+    "openai_requests_total", "OpenAI calls by operation and final outcome.", ["operation", "outcome"]
+)
+OPENAI_LATENCY = Histogram(
+    "openai_request_seconds",
+    "Latency of successful OpenAI calls, including retries and hedging.",
+    ["operation"],
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120),
+)
+OPENAI_RETRIES = Counter("openai_retries_total", "Retried OpenAI attempts by error type.", ["operation", "error"])
+OPENAI_HEDGES = Counter(
+    "openai_hedged_requests_total", "Hedged second requests by the attempt that won.", ["operation", "winner"]
+)
+OPENAI_CIRCUIT_STATE = Gauge("openai_circuit_state", "OpenAI circuit breaker state: 0 closed, 1 half-open, 2 open.")
+OPENAI_CIRCUIT_REJECTIONS = Counter(
+    "openai_circuit_rejections_total", "OpenAI calls failed fast by the open circuit.", ["operation"]
+)
+OPENAI_FIRST_TOKEN = Histogram(
+    "openai_time_to_first_token_seconds",
+    "Time from sending a request to its first content (the whole answer when not streamed).",
+    ["operation"],
+    buckets=(0.25, 0.5, 1, 2, 5, 10, 20, 30, 60),
+)
+OPENAI_TOKENS = Counter("openai_tokens_total", "Tokens reported in `usage` of OpenAI responses.", ["operation", "kind"])
+OPENAI_IN_FLIGHT = Gauge("openai_requests_in_flight", "OpenAI requests currently sent and unanswered.", ["operation"])
+
+# --- Tracing --- #
+TRACING_EVENTS = Counter(
+    "tracing_events_total",
+    "Langfuse trace events by outcome: exported, or dropped (buffer full or export failed).",
+    ["result"],
+)
+
+# --- Plan templates --- #
+PLAN_TEMPLATES = Counter(
+    "plan_templates_total",
+    "Plans built from the local template: as is, personalized by the model, or fallen back to full generation.",
+    ["result"],
+)
+
+# --- Fan-out plan generation --- #
+PLAN_FANOUT = Counter(
+    "plan_fanout_total",
+    "Plans generated day by day: merged, or fallen back to one completion (failed call, inconsistent days).",
+    ["result"],
+)
+
+# --- Speculative plans --- #
+SPECULATIVE_PLANS = Counter(
+    "speculative_plans_total",
+    "Speculative plan generations: started, skipped over budget, used, or wasted (goal not picked, cancelled).",
+    ["result"],
+)
+
+# --- Generations in flight --- #
+GENERATION_CALLS = Counter(
+    "generation_calls_total",
+    "User generations: started, coalesced into the same request in flight, or wasted (cancelled by /cancel, restart).",
+    ["result"],
+)
+
+# --- Local answers --- #
+LOCAL_ANSWERS = Counter(
+    "local_answers_total",
+    "Refinement questions by kind, answered locally from the plan or passed on to OpenAI (fallback).",
+    ["kind", "result"],
+)
+
+# --- Telegram --- #
+TELEGRAM_REQUEST_LATENCY = Histogram(
+    "telegram_request_seconds",
+    "Latency of Bot API requests (HTTP round trip, without scheduling).",
+    ["method", "status"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10),
+)
+TELEGRAM_SCHEDULER_WAIT = Histogram(
+    "telegram_scheduler_wait_seconds",
+    "Time Bot API requests wait in the outbound scheduler before being sent.",
+    ["priority"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30),
+)
+
+# --- Conversation --- #
+CONVERSATION_STATE_DURATION = Histogram(
+    "conversation_state_seconds",
+    "Time a conversation spent in a state, from entering it to the update that left it.",
+    ["state"],
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+CONVERSATION_HANDLER_LATENCY = Histogram(
+    "conversation_handler_seconds",
+    "Time the bot took to handle an update, by the state it arrived in.",
+    ["state"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60),
+)
+ACTIVE_CONVERSATIONS = Gauge("conversations_active", "Conversations currently in progress.")
+
+
+def start_metrics_server(port: int) -> None:
+    """Exposes all metrics on http://0.0.0.0:<port>/metrics."""
+    start_http_server(port)
+    logger.info(f"Metrics served on port {port}.")
@@ -0,0 +1,230 @@
+"""Scheduling of outbound Bot API requests within Telegram's flood limits."""
+
+import asyncio
+import itertools
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Coroutine, Deque, Dict, List, Optional, Set, Union
+
+from loguru import logger
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from ai_gym_bro.metrics import TELEGRAM_SCHEDULER_WAIT
+from ai_gym_bro.services.rate_limiter import TokenBucket
+
+# Values of the "priority" rate limit argument, lower is served first
+PRIORITY_INTERACTIVE = 0  # Direct replies the user is waiting for (default)
+PRIORITY_BULK = 1  # Plan chunks, streaming edits and other long deliveries
+_PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BULK: "bulk"}
+
+_MIN_DELAY = 1e-6
+_PRUNE_AT = 1024  # Idle chat buckets are dropped once this many are tracked
+
+ChatId = Union[int, str]
+
+
+def bulk_request_kwargs(bot: Any, retry: bool = True) -> Dict[str, Any]:
+    """Bot method kwargs marking a request as bulk, if the bot uses the scheduler.
+
+    With `retry=False` a throttled request fails with `RetryAfter` instead of being retried.
+    """
+    if not isinstance(getattr(bot, "rate_limiter", None), OutboundScheduler):
+        return {}
+    return {"rate_limit_args": {"priority": PRIORITY_BULK, "retry": retry}}
+
+
+@dataclass(order=True)
+class _Request:
+    priority: int
+    seq: int
+    granted: "asyncio.Future[None]" = field(compare=False)
+
+
+class OutboundScheduler(BaseRateLimiter[Dict[str, Any]]):
+    """Rate limiter for the bot that paces every request addressed to a chat.
+
+    Each chat has a FIFO queue, so its messages arrive in order and only one of its
+    requests is in flight at a time. A dispatcher grants the queue heads one by one,
+    interactive requests before bulk ones (then by arrival), within a global rate and a
+    per-chat rate with a small burst. A `RetryAfter` pauses the chat and the request is
+    retried at the head of its queue, so nothing is dropped.
+
+    Requests can pass `rate_limit_args={"priority": PRIORITY_BULK}` and
+    `{"retry": False}` (for droppable requests such as intermediate streaming edits).
+    Requests without a `chat_id` (e.g. `answerCallbackQuery`) are not queued.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: int = 3,
+        max_retries: int = 5,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.chat_rate = chat_rate
+        self.chat_burst = max(chat_burst, 1)
+        self.max_retries = max_retries
+        self._clock = clock
+        self._global = TokenBucket(global_rate, clock, period=1.0)
+        self._chat_buckets: Dict[ChatId, TokenBucket] = {}
+        self._queues: Dict[ChatId, Deque[_Request]] = {}
+        self._in_flight: Set[ChatId] = set()
+        self._paused_until: Dict[ChatId, float] = {}
+        self._seq = itertools.count()
+        self._wake: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    async def initialize(self) -> None:
+        """Starts the dispatcher."""
+        if self._dispatcher is None:
+            self._wake = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch_loop(), name="outbound-scheduler")
+
+    async def shutdown(self) -> None:
+        """Stops the dispatcher."""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+
+    @property
+    def queued(self) -> int:
+        """Number of requests waiting for their turn."""
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def process_request(  # noqa: PLR0913
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Dict[str, Any]],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            return await callback(*args, **kwargs)
+        await self.initialize()
+
+        options = rate_limit_args or {}
+        priority = options.get("priority", PRIORITY_INTERACTIVE)
+        retry = options.get("retry", True)
+        seq = next(self._seq)
+        for attempt in range(self.max_retries + 1):
+            # A retried request keeps its place at the head of the chat's queue
+            request = _Request(priority, seq, asyncio.get_running_loop().create_future())
+            queued_at = time.monotonic()
+            await self._wait_turn(chat_id, request, front=attempt > 0)
+            TELEGRAM_SCHEDULER_WAIT.labels(_PRIORITY_NAMES.get(priority, str(priority))).observe(
+                time.monotonic() - queued_at
+            )
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self._paused_until[chat_id] = self._clock() + e.retry_after
+                if not retry or attempt == self.max_retries:
+                    raise
+                logger.warning(f"Telegram flood limit for chat {chat_id} ({endpoint}), retrying in {e.retry_after}s")
+            finally:
+                self._in_flight.discard(chat_id)
+                self._wake.set()
+        raise AssertionError("unreachable")
+
+    async def _wait_turn(self, chat_id: ChatId, request: _Request, front: bool) -> None:
+        """Queues the request and waits until the dispatcher grants it."""
+        queue = self._queues.setdefault(chat_id, deque())
+        if front:
+            queue.appendleft(request)
+        else:
+            queue.append(request)
+        self._wake.set()
+        try:
+            await request.granted
+        except asyncio.CancelledError:
+            if request.granted.done() and not request.granted.cancelled():
+                self._in_flight.discard(chat_id)
+            elif request in queue:
+                queue.remove(request)
+                if not queue and self._queues.get(chat_id) is queue:
+                    del self._queues[chat_id]
+            self._wake.set()
+            raise
+
+    def _chat_bucket(self, chat_id: ChatId) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_burst, self._clock, period=self.chat_burst / self.chat_rate)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _drop_abandoned(self) -> None:
+        """Drops requests whose waiting task was cancelled but has not yet removed them from its queue."""
+        for chat_id in list(self._queues):
+            queue = self._queues[chat_id]
+            while queue and queue[0].granted.done():
+                queue.popleft()
+            if not queue:
+                del self._queues[chat_id]
+
+    def _grant_next(self) -> Optional[float]:
+        """Grants the best ready request; returns 0 if one was granted, else the seconds until one may be."""
+        self._drop_abandoned()
+        now = self._clock()
+        best: Optional[ChatId] = None
+        earliest: Optional[float] = None
+        for chat_id, queue in self._queues.items():
+            if not queue or chat_id in self._in_flight:
+                continue
+            wait = max(self._paused_until.get(chat_id, 0.0) - now, self._chat_bucket(chat_id).wait_time(1))
+            if wait > _MIN_DELAY:
+                earliest = wait if earliest is None else min(earliest, wait)
+            elif best is None or queue[0] < self._queues[best][0]:
+                best = chat_id
+        if best is None:
+            return earliest
+
+        # Not reserved while waiting: an interactive request arriving meanwhile goes first
+        global_wait = self._global.wait_time(1)
+        if global_wait > _MIN_DELAY:
+            return global_wait
+
+        queue = self._queues[best]
+        request = queue.popleft()
+        if not queue:
+            del self._queues[best]
+        self._global.consume(1)
+        self._chat_bucket(best).consume(1)
+        self._in_flight.add(best)
+        request.granted.set_result(None)
+        return 0.0
+
+    def _prune(self) -> None:
+        """Forgets chats that are idle with a full bucket."""
+        now = self._clock()
+        for chat_id in list(self._chat_buckets):
+            if chat_id in self._queues or chat_id in self._in_flight:
+                continue
+            if self._chat_buckets[chat_id].wait_time(self.chat_burst) <= _MIN_DELAY:
+                del self._chat_buckets[chat_id]
+        self._paused_until = {chat_id: until for chat_id, until in self._paused_until.items() if until > now}
+
+    async def _dispatch_loop(self) -> None:
+        while True:
+            self._wake.clear()
+            try:
+                delay = self._grant_next()
+            except Exception as e:
+                # A dead dispatcher would leave every chat-bound request waiting forever
+                logger.exception(f"Outbound scheduler failed to grant a request: {e}")
+                delay = None
+            if delay is not None and delay <= 0:
+                continue
+            if len(self._chat_buckets) > _PRUNE_AT:
+                self._prune()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except TimeoutError:
+                pass
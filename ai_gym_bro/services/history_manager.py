@@ -0,0 +1,99 @@
+"""Token-budgeted windowing and rolling summarization of the refinement history."""
+
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from ai_gym_bro.config import get_settings
+from ai_gym_bro.services.token_estimator import estimate_message_tokens
+
+Message = Dict[str, str]
+Turn = List[Message]
+# {"text": rolling summary, "turns": number of conversation turns it covers}
+HistorySummary = Dict[str, Any]
+Summarizer = Callable[[Optional[str], List[Message]], Awaitable[Optional[str]]]
+
+SUMMARY_PREFIX = "Краткое содержание предыдущего обсуждения плана:\n"
+
+
+def split_history(history: List[Message]) -> Tuple[List[Message], List[Turn]]:
+    """Splits a history into its pinned prefix and the conversation turns after it.
+
+    The prefix is everything up to and including the first assistant message, i.e. the
+    system prompts and the generated plan. Each turn starts with a user message and
+    holds the assistant replies that followed it.
+    """
+    first_answer = next((i for i, message in enumerate(history) if message["role"] == "assistant"), None)
+    prefix_end = first_answer + 1 if first_answer is not None else 0
+    turns: List[Turn] = []
+    for message in history[prefix_end:]:
+        if message["role"] == "user" or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return history[:prefix_end], turns
+
+
+class HistoryManager:
+    """Builds refinement prompts that stay within a token budget however long the chat runs.
+
+    A prompt is the pinned prefix (system prompts + plan), the rolling summary of older
+    turns, and at most `keep_turns` recent turns verbatim - fewer if they would exceed
+    `token_budget`. Turns that slide out of the verbatim window are folded into the
+    summary in batches of `summary_batch_turns`.
+    """
+
+    def __init__(self, token_budget: int, keep_turns: int, summary_batch_turns: int) -> None:
+        self.token_budget = token_budget
+        self.keep_turns = max(keep_turns, 1)
+        self.summary_batch_turns = max(summary_batch_turns, 1)
+
+    def build_messages(self, history: List[Message], summary: Optional[HistorySummary] = None) -> List[Message]:
+        """Returns the messages to send to the API for the latest turn of `history`."""
+        pinned, turns = split_history(history)
+        summarized = summary["turns"] if summary else 0
+        recent = turns[summarized:][-self.keep_turns :]
+
+        messages = list(pinned)
+        if summary and summary.get("text"):
+            messages.append({"role": "system", "content": SUMMARY_PREFIX + summary["text"]})
+
+        budget_left = self.token_budget - estimate_message_tokens(messages)
+        kept: List[Turn] = []
+        for turn in reversed(recent):
+            cost = estimate_message_tokens(turn)
+            if kept and cost > budget_left:
+                break  # The newest turn (the current request) is always kept
+            kept.insert(0, turn)
+            budget_left -= cost
+        return messages + [message for turn in kept for message in turn]
+
+    def turns_to_summarize(self, history: List[Message], summary: Optional[HistorySummary] = None) -> List[Turn]:
+        """Returns the turns outside the verbatim window not yet in the summary, once a full batch is ready."""
+        _, turns = split_history(history)
+        summarized = summary["turns"] if summary else 0
+        foldable = turns[summarized : max(len(turns) - self.keep_turns, summarized)]
+        return foldable if len(foldable) >= self.summary_batch_turns else []
+
+    async def fold(
+        self, history: List[Message], summary: Optional[HistorySummary], summarize: Summarizer
+    ) -> Optional[HistorySummary]:
+        """Folds the pending turns into a new summary; returns None if there is nothing to fold or it failed."""
+        turns = self.turns_to_summarize(history, summary)
+        if not turns:
+            return None
+        previous_text = summary.get("text") if summary else None
+        text = await summarize(previous_text, [message for turn in turns for message in turn])
+        if not text:
+            return None
+        return {"text": text, "turns": (summary["turns"] if summary else 0) + len(turns)}
+
+
+@lru_cache(maxsize=1)
+def get_history_manager() -> HistoryManager:
+    """Returns the history manager configured from settings."""
+    settings = get_settings()
+    return HistoryManager(
+        token_budget=settings.history_token_budget,
+        keep_turns=settings.history_keep_turns,
+        summary_batch_turns=settings.history_summary_batch_turns,
+    )
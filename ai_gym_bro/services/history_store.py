@@ -0,0 +1,64 @@
+"""Compact at-rest representation of chat histories.
+
+Histories live in `user_data` for the whole refinement session and are persisted per
+user, so they are stored compactly:
+
+* registered system prompts become `{"role": "system", "prompt_id": ...}`;
+* the assistant message holding the plan becomes `{"role": "assistant", "ref": "plan"}`
+  and is resolved from the single stored copy of the plan;
+* other long messages are zlib-compressed into `{"role": ..., "zlib": bytes}`.
+
+Plain `{"role", "content"}` entries are valid compact entries too, so histories saved
+before this format still expand correctly. The full message list is only rebuilt with
+`expand_history` right before it is sent to the API.
+"""
+
+import zlib
+from typing import Any, Dict, List, Optional
+
+from ai_gym_bro.services.prompts import find_prompt_id, get_prompt
+
+PLAN_REF = "plan"
+COMPRESS_MIN_CHARS = 1024  # Shorter messages are not worth the zlib overhead
+
+CompactEntry = Dict[str, Any]
+
+
+def compact_message(message: Dict[str, str], plan: Optional[str] = None) -> CompactEntry:
+    """Returns the compact form of a single chat message."""
+    role = message["role"]
+    content = message.get("content") or ""
+    if role == "system":
+        prompt_id = find_prompt_id(content)
+        if prompt_id:
+            return {"role": role, "prompt_id": prompt_id}
+    if role == "assistant" and plan is not None and content == plan:
+        return {"role": role, "ref": PLAN_REF}
+    if len(content) >= COMPRESS_MIN_CHARS:
+        return {"role": role, "zlib": zlib.compress(content.encode("utf-8"))}
+    return {"role": role, "content": content}
+
+
+def compact_history(history: List[Dict[str, str]], plan: Optional[str] = None) -> List[CompactEntry]:
+    """Returns the compact form of a full message list."""
+    return [compact_message(message, plan) for message in history]
+
+
+def expand_message(entry: CompactEntry, plan: Optional[str] = None) -> Dict[str, str]:
+    """Rebuilds the full chat message of a compact entry."""
+    if "prompt_id" in entry:
+        content = get_prompt(entry["prompt_id"])
+    elif entry.get("ref") == PLAN_REF:
+        if plan is None:
+            raise ValueError("History references the plan, but no plan was given")
+        content = plan
+    elif "zlib" in entry:
+        content = zlib.decompress(entry["zlib"]).decode("utf-8")
+    else:
+        content = entry.get("content") or ""
+    return {"role": entry["role"], "content": content}
+
+
+def expand_history(history: List[CompactEntry], plan: Optional[str] = None) -> List[Dict[str, str]]:
+    """Rebuilds the full message list of a compact history."""
+    return [expand_message(entry, plan) for entry in history]
@@ -0,0 +1,98 @@
+"""Single-flight registry of the users' OpenAI-backed generations.
+
+Every generation a user triggers (a plan, a refinement, plan weeks) runs as a task keyed
+by the user and a fingerprint of the request. A trigger whose request is already in
+flight joins that task instead of starting a second call, and `/cancel` or a restart
+cancels the user's tasks, so a dropped conversation does not keep spending tokens and
+concurrency slots.
+"""
+
+import asyncio
+import hashlib
+import json
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+from loguru import logger
+
+from ai_gym_bro.metrics import GENERATION_CALLS
+
+T = TypeVar("T")
+
+
+class CallCancelledError(Exception):
+    """The generation was cancelled (by `/cancel` or a restart) before it finished."""
+
+
+def fingerprint(*parts: Any) -> str:
+    """Short stable key of a request, from its JSON-serializable parts."""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+class InflightCalls:
+    """Generation tasks in flight by user and request fingerprint."""
+
+    def __init__(self) -> None:
+        self._by_user: Dict[int, Dict[str, asyncio.Task]] = {}
+
+    def in_flight(self, user_id: int, key: str) -> bool:
+        """True while the user's generation for `key` is running."""
+        task = self._by_user.get(user_id, {}).get(key)
+        return task is not None and not task.done()
+
+    def start(self, user_id: int, key: str, factory: Callable[[], Awaitable[T]]) -> "asyncio.Task[T]":
+        """Starts `factory()` as the user's generation for `key`, or returns the one already in flight."""
+        calls = self._by_user.setdefault(user_id, {})
+        task = calls.get(key)
+        if task is not None and not task.done():
+            GENERATION_CALLS.labels("coalesced").inc()
+            logger.debug(f"User {user_id}: joined the generation {key} in flight")
+            return task
+        task = asyncio.create_task(factory(), name=f"generation-{user_id}-{key}")
+        calls[key] = task
+        task.add_done_callback(lambda done: self._forget(user_id, key, done))
+        GENERATION_CALLS.labels("started").inc()
+        return task
+
+    async def run(self, user_id: int, key: str, factory: Callable[[], Awaitable[T]]) -> T:
+        """Runs or joins the user's generation for `key` and returns its result.
+
+        Raises `CallCancelledError` if the generation is cancelled. Cancelling the caller does
+        not cancel the generation, which other callers may be waiting for.
+        """
+        task = self.start(user_id, key, factory)
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled() and not asyncio.current_task().cancelling():
+                raise CallCancelledError(f"Generation {key} of user {user_id} was cancelled") from None
+            raise
+
+    def cancel(self, user_id: int) -> int:
+        """Cancels the user's generations in flight; returns how many were cancelled."""
+        tasks = [task for task in self._by_user.pop(user_id, {}).values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            GENERATION_CALLS.labels("wasted").inc(len(tasks))
+            logger.info(f"Cancelled {len(tasks)} generations of user {user_id}")
+        return len(tasks)
+
+    def cancel_all(self) -> None:
+        """Cancels every generation in flight, on shutdown."""
+        for user_id in list(self._by_user):
+            self.cancel(user_id)
+
+    def _forget(self, user_id: int, key: str, task: asyncio.Task) -> None:
+        calls = self._by_user.get(user_id)
+        if calls is not None and calls.get(key) is task:
+            del calls[key]
+            if not calls:
+                del self._by_user[user_id]
+
+
+@lru_cache(maxsize=1)
+def get_inflight_calls() -> InflightCalls:
+    """Returns the process-wide registry of generations in flight."""
+    return InflightCalls()
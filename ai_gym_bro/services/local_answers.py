@@ -0,0 +1,159 @@
+"""Answers to deterministic plan questions from the stored plan, without calling OpenAI.
+
+Questions such as "сколько кг это на 3 неделе?" or "что у меня в день 2?" only need
+the plan and the bench press 1RM from the profile. A keyword classifier recognizes
+three kinds:
+
+* weight: kilograms for the bench press exercises of the plan, from their % of the
+  1RM, rounded to what can be loaded with the smallest plates (optionally for one week);
+* day: a training day ("день 2"); the plan has no calendar, so weekdays are left to
+  the model;
+* week: every day of the plan with the loads of one week.
+
+Anything it is not sure about (advice, changes, other lifts, unknown days) gets no local
+answer, so the question goes to the model as before.
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from ai_gym_bro.metrics import LOCAL_ANSWERS
+from ai_gym_bro.services.plan_model import SECTION_TITLES, Day, Exercise, Plan, parse_plan
+
+PLATE_STEP_KG = 2.5  # Two 1.25 kg plates
+MAX_QUESTION_CHARS = 120
+
+_ORDINALS = {"перв": 1, "втор": 2, "трет": 3, "четверт": 4, "пят": 5, "шест": 6, "седьм": 7}
+# "3 неделе", "3-й неделе", "третьей неделе", "неделя №3"; the same for days
+_ORDINAL = rf"\b({'|'.join(_ORDINALS)})(?:ый|ой|ий|ая|ья|ую|ью|ое|ье|ей|ьей|ого|ом|ым)"
+_COUNT = rf"(?:(\d+)(?:-?(?:й|я|ю|ей|ой|ий))?|{_ORDINAL})\s+"
+_WEEK = re.compile(rf"{_COUNT}недел|недел\w*\s*№?\s*(\d+)")
+_DAY = re.compile(rf"{_COUNT}(?:день|дня|дне)\b|\bд(?:ень|ня|не)\s*№?\s*(\d+)")
+_WEIGHT = re.compile(r"\bкг\b|килограм|\bвес(?:а|е|ом|у)?\b")
+_OTHER_LIFTS = re.compile(r"присед|тяг|станов|выпад|подтяг|армейск|стоя|сидя|ног|гантел")
+# Advice, changes and explanations need the model, and so do weekdays: the plan has no calendar
+_OPEN_ENDED = re.compile(
+    r"почему|зачем|можно ли|стоит ли|заме|поменя|вместо|измени|болит|бол[ьи]|травм|совет|лучше|правильн|техник|как "
+    r"|понедельник|вторник|\bсред[ауы]\b|четверг|пятниц|суббот|воскресен"
+)
+
+
+def round_to_plates(kg: float, step: float = PLATE_STEP_KG) -> float:
+    return round(kg / step) * step
+
+
+def _format_kg(kg: float) -> str:
+    return f"{kg:g}"
+
+
+def _is_bench(exercise: Exercise) -> bool:
+    name = exercise.name.casefold()
+    return "жим" in name and "леж" in name
+
+
+def _number(match: Optional[re.Match]) -> Optional[int]:
+    if not match:
+        return None
+    digits, ordinal, digits_after = match.groups()
+    if ordinal:
+        return _ORDINALS[ordinal]
+    return int(digits or digits_after)
+
+
+@lru_cache(maxsize=256)
+def _parsed(plan_text: str) -> Plan:
+    return parse_plan(plan_text)
+
+
+def classify(question: str) -> Tuple[Optional[str], Dict[str, int]]:
+    """Returns the question kind ("weight", "day", "week" or None) and the week/day it names."""
+    text = " ".join(question.casefold().replace("ё", "е").split())
+    if len(text) > MAX_QUESTION_CHARS or _OPEN_ENDED.search(text):
+        return None, {}
+    slots: Dict[str, int] = {}
+    week, day = _number(_WEEK.search(text)), _number(_DAY.search(text))
+    if week:
+        slots["week"] = week
+    if day:
+        slots["day"] = day
+    if _WEIGHT.search(text):
+        return (None, {}) if _OTHER_LIFTS.search(text) else ("weight", slots)
+    if day:
+        return "day", slots
+    if week:
+        return "week", slots
+    return None, {}
+
+
+def _exercise_line(exercise: Exercise, week: Optional[int], one_rm: Optional[float]) -> List[str]:
+    if week is None:
+        return exercise.render()
+    load = exercise.week(week)
+    if load is None:
+        return [f"{exercise.name} — {exercise.note}" if exercise.note else exercise.name]
+    line = f"{exercise.name} — {load.sets}×{load.reps}"
+    if load.pct:
+        line += f"×{load.pct:g}%"
+        if one_rm and _is_bench(exercise):
+            line += f" (≈{_format_kg(round_to_plates(one_rm * load.pct / 100))} кг)"
+    return [line]
+
+
+def render_day(day: Day, week: Optional[int] = None, one_rm: Optional[float] = None) -> str:
+    """Renders one training day, with the loads of `week` only when given."""
+    title = f"**День {day.number}" + (f" — {day.title}" if day.title else "") + "**"
+    if week:
+        title += f" (неделя {week})"
+    blocks = [title]
+    for section in day.sections:
+        lines = [f"**{SECTION_TITLES[section.kind]}:**"]
+        for exercise in section.exercises:
+            lines.extend(_exercise_line(exercise, week, one_rm))
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+def _weight_answer(plan: Plan, slots: Dict[str, int], one_rm: Optional[float]) -> Optional[str]:
+    week, day_number = slots.get("week"), slots.get("day")
+    if not one_rm or (week and week > plan.week_count):
+        return None
+    lines = [f"Ваш 1ПМ в жиме лежа: {_format_kg(one_rm)} кг, веса округлены до {PLATE_STEP_KG:g} кг."]
+    answered = False
+    for day, _, exercise in plan.exercises():
+        if not _is_bench(exercise) or day_number not in (None, day.number):
+            continue
+        loads = [(number, exercise.week(number)) for number in ([week] if week else range(1, plan.week_count + 1))]
+        loads = [(number, load) for number, load in loads if load and load.pct]
+        if not loads:
+            continue
+        lines.append(f"**День {day.number}, {exercise.name}:**")
+        for number, load in loads:
+            kg = _format_kg(round_to_plates(one_rm * load.pct / 100))
+            lines.append(f"- Неделя {number}: {load.pct:g}% → **{kg} кг**, {load.sets}×{load.reps}")
+        answered = True
+    return "\n".join(lines) if answered else None
+
+
+def _day_answer(plan: Plan, slots: Dict[str, int], one_rm: Optional[float]) -> Optional[str]:
+    week = slots.get("week")
+    if week and week > plan.week_count:
+        return None
+    day = next((day for day in plan.days if day.number == slots["day"]), None)
+    return render_day(day, week, one_rm) if day else None
+
+
+def answer_locally(question: str, plan_text: Optional[str], one_rm: Optional[float]) -> Optional[str]:
+    """Answers the question from the plan if it is one of the deterministic kinds, else returns None."""
+    kind, slots = classify(question)
+    plan = _parsed(plan_text) if kind and plan_text else None
+    answer = None
+    if plan is not None and plan.days:
+        if kind == "weight":
+            answer = _weight_answer(plan, slots, one_rm)
+        elif kind == "day":
+            answer = _day_answer(plan, slots, one_rm)
+        elif kind == "week" and slots["week"] <= plan.week_count:
+            answer = "\n\n".join(render_day(day, slots["week"], one_rm) for day in plan.days)
+    LOCAL_ANSWERS.labels(kind or "other", "answered" if answer else "fallback").inc()
+    return answer
@@ -1,102 +1,119 @@
 """Service layer for interacting with OpenAI API."""
 
-import os
 import asyncio
-from typing import Any, Dict, List, Optional, Tuple
+import os
+import time
+from datetime import UTC, datetime
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
-from dotenv import load_dotenv
+import httpx
 from loguru import logger
-from langfuse.openai import AsyncOpenAI
-from openai import OpenAIError
+from openai import AsyncOpenAI, OpenAIError
+
+from ai_gym_bro.config import get_settings
+from ai_gym_bro.logging_config import log_payload
+from ai_gym_bro.metrics import OPENAI_FIRST_TOKEN, OPENAI_IN_FLIGHT, OPENAI_TOKENS, PLAN_FANOUT, PLAN_TEMPLATES
+from ai_gym_bro.services.history_manager import HistorySummary, get_history_manager
+from ai_gym_bro.services.history_store import CompactEntry, compact_history, compact_message, expand_history
+from ai_gym_bro.services.plan_cache import get_plan_cache, make_cache_key
+from ai_gym_bro.services.plan_fanout import (
+    DaySpec,
+    SplitError,
+    check_consistency,
+    merge_days,
+    parse_split,
+    split_outline,
+)
+from ai_gym_bro.services.plan_model import render_plan
+from ai_gym_bro.services.plan_patch import PatchError, PlanModification, apply_patch, number_lines, parse_patch
+from ai_gym_bro.services.plan_template import build_template_plan
+from ai_gym_bro.services.plan_weeks import WeekLoadsError, add_week_loads, week_request
+from ai_gym_bro.services.profile import has_injuries
+from ai_gym_bro.services.prompts import (
+    FIRST_WEEK_PROMPT_ID,
+    PLAN_GENERATION_PROMPT_ID,
+    SYSTEM_PROMPT_FIRST_WEEK,
+    SYSTEM_PROMPT_MODIFICATION,
+    SYSTEM_PROMPT_NEXT_WEEKS,
+    SYSTEM_PROMPT_PERSONALIZATION,
+    SYSTEM_PROMPT_PLAN_DAY,
+    SYSTEM_PROMPT_PLAN_GENERATION,
+    SYSTEM_PROMPT_PLAN_SPLIT,
+    SYSTEM_PROMPT_SUMMARY,
+)
+from ai_gym_bro.services.rate_limiter import get_rate_limiter, model_headers, record_openai_response
+from ai_gym_bro.services.resilience import get_resilient_caller
+from ai_gym_bro.services.token_estimator import estimate_message_tokens
+from ai_gym_bro.services.tracing import trace_generation
 
 # --- Constants --- #
 MODEL_NAME = "gpt-4.1"
 TEMPERATURE = 0.7  # Adjust for creativity vs determinism
 
 MAX_TOKENS_PLAN = 2500  # Adjust as needed for plan length
-MAX_TOKENS_REFINEMENT = 2500 # Adjust as needed for refinement responses
-
-# --- Load API Key --- #
-load_dotenv(override=True)  # Ensure environment variables are loaded
-API_KEY = os.getenv("OPENAI_API_KEY")
-if not API_KEY:
-    logger.critical("OPENAI_API_KEY environment variable not found!")
-    # Decide how to handle this - exit, raise error, or run in limited mode?
-    # For now, we'll log a critical error. The functions below will fail.
-    # raise ValueError("Missing OPENAI_API_KEY")
-
-# --- Initialize Async Client --- #
-# Initialize only if API_KEY is present
-aclient = AsyncOpenAI(api_key=API_KEY) if API_KEY else None
-
-# --- System Prompts (Consider moving to config/YAML later) --- #
-SYSTEM_PROMPT_PLAN_GENERATION = f"""
-You think in English but output entirely in Russian.
-
-**Программа на 5 недель с периодизацией**  
-- **Beginner/Intermediate:** 3 дня в неделю  
-- **Advanced:** 5 дней в неделю  
-
-**Структура каждого тренировочного дня (Markdown):**
-
-**Разминка:**  
-Упражнение 1 — подходы×повторы  
-Упражнение 2 — подходы×повторы  
-…
-
-**Основная часть:**  
-Упражнение 1 — подходы×повторы×интенсивность (Неделя 1 / Неделя 2 / … / Неделя 5)  
-Упражнение 2 — подходы×повторы×интенсивность (Неделя 1 / Неделя 2 / … / Неделя 5)  
-…
-
-**Вспомогательные упражнения:**  
-Упражнение 1 — подходы×повторы  
-Упражнение 2 — подходы×повторы  
-…
-
-**Инструкции:** 
-1. Анализируйте возраст, рост, вес, опыт, уровень (1RM) и травмы только для оценки уровня — в плане используйте **только проценты**.
-2. По цели:
-   - **Набор мышечной массы:** 8–12 повторений, умеренные веса (65-75% от 1RM), больше базовых упражнений.
-   - **Уменьшение жировой массы:** 12–15 повторений, умеренные веса (60-70% от 1RM), больше кардио и суперсетов.
-3. Для каждого упражнения дайте таблицу или маркированный список:
-   - Неделя 1: X % × Y подходов × Z повторений
-   - …
-   - Неделя 5: X % × Y подходов × Z повторений
-4. Учитывайте травмы и предлагайте альтернативы.
-5. Тон — профессиональный, мотивирующий, без вступлений/заключений.
-"""
+MAX_TOKENS_REFINEMENT = 2500  # Adjust as needed for refinement responses
+MAX_TOKENS_MODIFICATION = 800  # A patch names only the changed lines
+MAX_TOKENS_PERSONALIZATION = 800  # A patch adapting the template plan to injuries
+MAX_TOKENS_SPLIT = 400  # Fan-out: the days and their main lifts, as JSON
+MAX_TOKENS_DAY = 900  # Fan-out: one training day
+MAX_TOKENS_WEEK = 500  # Lazy weeks: the loads of one week, as JSON
 
+SUMMARY_MODEL_NAME = "gpt-4.1-mini"  # Cheap model for folding old refinement turns
+MAX_TOKENS_SUMMARY = 400
 
-SYSTEM_PROMPT_REFINEMENT = f"""
-You are an expert Strength & Conditioning ассистент, отвечаете на вопросы и вносите правки в уже сгенерированный план.
+# Called with every content delta while a plan is streamed
+PlanDeltaCallback = Callable[[str], Awaitable[None]]
 
-Вам дано:
-- История переписки и текущий план (на русском, в Markdown).
-- Последний запрос пользователя.
+# --- Client --- #
+# Built by the first `get_client()` (from the application's `post_init`), so importing this
+# module does not read the environment or construct anything
+
+
+@lru_cache(maxsize=1)
+def get_client() -> Optional[AsyncOpenAI]:
+    """Returns the process-wide OpenAI client, built on first call, or None without OPENAI_API_KEY.
+
+    Always the plain client: Langfuse tracing is done per call by `trace_generation`
+    (see services/tracing.py), for the sampled share of calls only.
+    """
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        logger.critical("OPENAI_API_KEY environment variable not found!")
+        return None
+
+    # With rate limiting on, every response passes its rate limit headers to the limiter of its model
+    http_client = (
+        httpx.AsyncClient(event_hooks={"response": [record_openai_response]})
+        if get_settings().openai_rate_limit_enabled
+        else None
+    )
+    # Retries are done by the resilience layer (see `_create_completion`), not by the client
+    return AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+
+async def close_client() -> None:
+    """Closes the client's connections, if it was built; `get_client()` builds a new one afterwards."""
+    client = get_client() if get_client.cache_info().currsize else None
+    get_client.cache_clear()
+    if client is not None:
+        await client.close()
 
-**Действуйте так:**
-1. Опирайтесь только на историю и последний запрос.
-2. Если пользователь спрашивает — отвечайте конкретно, ссылаясь на разделы плана.
-3. Если просит изменить — предложите безопасные правки (конкретные упражнения/подходы).
-4. Тон — поддерживающий и профессиональный.
-"""
 
 # --- Service Functions --- #
 
 
-async def generate_plan(user_data: Dict[str, Any]) -> Optional[Tuple[str, List[Dict[str, str]]]]:
-    """
-    Generates a workout plan using the OpenAI API.
-    Returns the plan string and the initial list of messages for history.
-    """
-    if not aclient:
-        logger.error("OpenAI client not initialized. Cannot generate plan.")
-        # Return a tuple indicating error, and empty history
-        return ("Error: OpenAI client not configured.", [])
+async def _wait_for_rate_limit(model: str, messages: List[Dict[str, str]], max_tokens: int) -> None:
+    """Waits for the model's rate limiter to admit a request of this size."""
+    if not get_settings().openai_rate_limit_enabled:
+        return
+    waited = await get_rate_limiter(model).acquire(estimate_message_tokens(messages) + max_tokens)
+    if waited > 1:
+        logger.info(f"Waited {waited:.1f}s for the OpenAI rate limit ({model}).")
 
-    logger.info(f"Requesting plan generation for user data: {user_data}")
 
+def build_plan_messages(user_data: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Builds the initial prompt messages (system prompt + user profile) for plan generation."""
     # Format user data into a message for the prompt
     user_profile_summary = f"""
     При создании плана строго следуйте данным пользователя:
@@ -108,44 +125,348 @@ async def generate_plan(user_data: Dict[str, Any]) -> Optional[Tuple[str, List[D
     - Травмы/ограничения: {user_data.get("injuries", "None specified")}
     - Цель: {user_data.get("goal", "N/A")}
 """
-
-    # initial_messages will be part of the history
-    initial_messages = [
+    return [
         {"role": "system", "content": SYSTEM_PROMPT_PLAN_GENERATION},
         {"role": "system", "content": user_profile_summary},
     ]
 
+
+def _plan_cache_key(user_data: Dict[str, Any]) -> Optional[str]:
+    """Returns the plan cache key for a profile, or None if caching is off or the profile opts out."""
+    settings = get_settings()
+    if not settings.plan_cache_enabled:
+        return None
+    prompt_id = PLAN_GENERATION_PROMPT_ID
+    if settings.plan_lazy_weeks:
+        prompt_id += f"+{FIRST_WEEK_PROMPT_ID}"  # Week 1 only: not interchangeable with full plans
+    return make_cache_key(user_data, f"{prompt_id}:{MODEL_NAME}")
+
+
+async def _create_completion(  # noqa: PLR0913
+    operation: str,
+    model: str,
+    messages: List[Dict[str, str]],
+    max_tokens: int,
+    temperature: float = TEMPERATURE,
+    timeout: float = 120,
+    hedge: bool = True,
+    response_format: Optional[Dict[str, str]] = None,
+) -> Any:
+    """Sends a non-streaming completion through the rate limiter and the retry/hedging/breaker layer."""
+    extra = {"response_format": response_format} if response_format else {}
+
+    async def request() -> Any:
+        await _wait_for_rate_limit(model, messages, max_tokens)
+        started = time.monotonic()
+        with trace_generation(operation, model, messages, temperature=temperature, max_tokens=max_tokens) as trace:
+            with OPENAI_IN_FLIGHT.labels(operation).track_inprogress():
+                response = await get_client().chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    timeout=timeout,
+                    extra_headers=model_headers(model),
+                    **extra,
+                )
+            if trace:
+                trace.output = response.choices[0].message.content
+                trace.usage = response.usage
+        _record_response(operation, response, time.monotonic() - started)
+        return response
+
+    return await get_resilient_caller().call(operation, request, hedge=hedge)
+
+
+def _record_response(operation: str, response: Any, latency: float) -> None:
+    """Observes the latency and token usage of a completion and logs them as structured fields."""
+    OPENAI_FIRST_TOKEN.labels(operation).observe(latency)
+    usage = getattr(response, "usage", None)
+    prompt_tokens = (usage.prompt_tokens or 0) if usage is not None else 0
+    completion_tokens = (usage.completion_tokens or 0) if usage is not None else 0
+    OPENAI_TOKENS.labels(operation, "prompt").inc(prompt_tokens)
+    OPENAI_TOKENS.labels(operation, "completion").inc(completion_tokens)
+    logger.bind(
+        operation=operation,
+        latency=round(latency, 3),
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+    ).info("OpenAI {} answered in {:.2f}s", operation, latency)
+
+
+async def _complete_plan(messages: List[Dict[str, str]]) -> Optional[str]:
+    """Requests the whole plan in a single, non-streaming completion."""
+    response = await _create_completion("generate_plan", MODEL_NAME, messages, MAX_TOKENS_PLAN)
+    log_payload("OpenAI response", lambda: response)
+    return response.choices[0].message.content
+
+
+async def _stream_plan(messages: List[Dict[str, str]], on_delta: PlanDeltaCallback) -> Optional[str]:
+    """Requests the plan with `stream=True`, forwarding every delta and returning the assembled text."""
+    parts: List[str] = []
+
+    async def request() -> str:
+        await _wait_for_rate_limit(MODEL_NAME, messages, MAX_TOKENS_PLAN)
+        started = time.monotonic()
+        # Streamed responses carry no `usage` in this client version, so no token counts here
+        with (
+            trace_generation(
+                operation, MODEL_NAME, messages, temperature=TEMPERATURE, max_tokens=MAX_TOKENS_PLAN
+            ) as trace,
+            OPENAI_IN_FLIGHT.labels(operation).track_inprogress(),
+        ):
+            stream = await get_client().chat.completions.create(
+                model=MODEL_NAME,
+                messages=messages,
+                temperature=TEMPERATURE,
+                max_tokens=MAX_TOKENS_PLAN,
+                timeout=120,
+                stream=True,
+                extra_headers=model_headers(MODEL_NAME),
+            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not parts:
+                        OPENAI_FIRST_TOKEN.labels(operation).observe(time.monotonic() - started)
+                        if trace:
+                            trace.completion_start_time = datetime.now(UTC)
+                    parts.append(delta)
+                    await on_delta(delta)
+            if trace:
+                trace.output = "".join(parts)
+        latency = time.monotonic() - started
+        logger.bind(operation=operation, latency=round(latency, 3), chunks=len(parts)).info(
+            "OpenAI {} streamed in {:.2f}s", operation, latency
+        )
+        return "".join(parts)
+
+    operation = "generate_plan_stream"
+    # Not hedged, and only retried while nothing has been shown to the user yet
+    return await get_resilient_caller().call(operation, request, hedge=False, retryable=lambda error: not parts)
+
+
+async def _fanout_plan(messages: List[Dict[str, str]]) -> Optional[str]:
+    """Fixes the split with a short call, then writes the days concurrently and merges them (see plan_fanout.py).
+
+    Returns None if a call fails, the split is invalid or the merged days are inconsistent,
+    so the plan is generated in one completion instead.
+    """
+    semaphore = asyncio.Semaphore(max(get_settings().plan_fanout_concurrency, 1))
+
+    async def write_day(day: DaySpec, outline: str) -> str:
+        day_messages = [
+            *messages,
+            {"role": "system", "content": SYSTEM_PROMPT_PLAN_DAY},
+            {"role": "system", "content": f"Разбивка:\n{outline}\n\nНапишите День {day.number} — {day.title}."},
+        ]
+        async with semaphore:
+            response = await _create_completion("generate_plan_day", MODEL_NAME, day_messages, MAX_TOKENS_DAY)
+        return response.choices[0].message.content or ""
+
+    tasks: List[asyncio.Task] = []
+    try:
+        response = await _create_completion(
+            "plan_split",
+            MODEL_NAME,
+            [*messages, {"role": "system", "content": SYSTEM_PROMPT_PLAN_SPLIT}],
+            MAX_TOKENS_SPLIT,
+            temperature=0.2,
+            response_format={"type": "json_object"},
+        )
+        days = parse_split(response.choices[0].message.content)
+        outline = split_outline(days)
+        tasks = [asyncio.create_task(write_day(day, outline)) for day in days]
+        texts = await asyncio.gather(*tasks)
+    except (OpenAIError, SplitError) as e:
+        for task in tasks:
+            task.cancel()  # One failed day fails the fan-out, the others are not needed
+        logger.warning(f"Fan-out plan generation failed, generating the plan in one completion: {e}")
+        PLAN_FANOUT.labels("failed").inc()
+        return None
+
+    plan = merge_days(days, texts)
+    problems = check_consistency(plan, days)
+    if problems:
+        logger.warning("Fan-out plan days are inconsistent, generating the plan in one completion: {}", problems)
+        PLAN_FANOUT.labels("inconsistent").inc()
+        return None
+    PLAN_FANOUT.labels("merged").inc()
+    logger.info("Plan generated day by day ({} days)", len(days))
+    return plan
+
+
+async def _plan_from_template(user_data: Dict[str, Any], profile_message: Dict[str, str]) -> Optional[str]:
+    """Builds the plan from the local template, adapted to the user's injuries by a short patch request.
+
+    Returns None when the template rules do not cover the profile or the adaptation fails,
+    so the plan is generated in full instead.
+    """
+    template = build_template_plan(user_data)
+    if template is None:
+        return None
+    plan = render_plan(template)
+    if not has_injuries(user_data.get("injuries")):
+        PLAN_TEMPLATES.labels("template").inc()
+        logger.info("Plan built from the template ({} days), no OpenAI request needed", len(template.days))
+        return plan
+
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT_PERSONALIZATION},
+        profile_message,
+        {"role": "user", "content": number_lines(plan)},
+    ]
     try:
-        response = await aclient.chat.completions.create(
-            model=MODEL_NAME,
-            messages=initial_messages,  # Use initial_messages here
-            temperature=TEMPERATURE,
-            max_tokens=MAX_TOKENS_PLAN,
-            timeout=120,
+        response = await _create_completion(
+            "personalize_plan",
+            MODEL_NAME,
+            messages,
+            MAX_TOKENS_PERSONALIZATION,
+            temperature=0.2,
+            response_format={"type": "json_object"},
         )
-        plan_content = response.choices[0].message.content
+        log_payload("OpenAI response", lambda: response)
+        modification = apply_patch(plan, parse_patch(response.choices[0].message.content, plan.count("\n") + 1))
+    except (OpenAIError, PatchError) as e:
+        logger.warning(f"Template personalization failed, generating the plan in full: {e}")
+        PLAN_TEMPLATES.labels("fallback").inc()
+        return None
+    PLAN_TEMPLATES.labels("personalized").inc()
+    logger.info("Template plan adapted to injuries")
+    return f"{modification.summary}\n\n{modification.plan}"
+
+
+async def _ready_plan(
+    plan: str, messages: List[Dict[str, str]], on_delta: Optional[PlanDeltaCallback]
+) -> Tuple[str, List[CompactEntry]]:
+    """Returns a plan that needs no completion (template, cache) with its history, sending it to `on_delta` at once."""
+    if on_delta is not None:
+        await on_delta(plan)
+    return plan, compact_history([*messages, {"role": "assistant", "content": plan}], plan)
+
+
+async def _request_plan(
+    messages: List[Dict[str, str]], on_delta: Optional[PlanDeltaCallback], fanout: bool
+) -> Optional[str]:
+    """Generates the plan by day (if `fanout`), else in one completion, streamed if `on_delta` is given."""
+    plan_content = await _fanout_plan(messages) if fanout else None
+    if plan_content is not None:
+        if on_delta is not None:
+            await on_delta(plan_content)
+        return plan_content
+    if on_delta is None:
+        return await _complete_plan(messages)
+    return await _stream_plan(messages, on_delta)
+
+
+async def generate_plan(
+    user_data: Dict[str, Any], on_delta: Optional[PlanDeltaCallback] = None
+) -> Optional[Tuple[str, List[Dict[str, str]]]]:
+    """
+    Generates a workout plan using the OpenAI API.
+    Returns the plan string and the initial list of messages for history, in the compact
+    form of `history_store` (prompts by id, the plan as a reference to the plan string).
+
+    When `on_delta` is given the completion is streamed and the callback receives
+    every content delta as it arrives; the returned plan is still the full text.
+    With PLAN_TEMPLATE_ENABLED the plan is built from the local template when the
+    profile allows it (see `_plan_from_template`) and sent to `on_delta` at once; with
+    PLAN_FANOUT_ENABLED it is generated day by day (see `_fanout_plan`), likewise.
+    With PLAN_LAZY_WEEKS a generated plan has the loads of week 1 only (see `generate_weeks`).
+    """
+    if not get_client():
+        logger.error("OpenAI client not initialized. Cannot generate plan.")
+        # Return a tuple indicating error, and empty history
+        return ("Error: OpenAI client not configured.", [])
+
+    logger.info("Requesting plan generation (goal: {})", user_data.get("goal", "N/A"))
+    log_payload("Profile for plan generation", lambda: user_data)
+
+    # initial_messages will be part of the history
+    initial_messages = build_plan_messages(user_data)
+
+    if get_settings().plan_template_enabled:
+        template_plan = await _plan_from_template(user_data, initial_messages[1])
+        if template_plan:
+            return await _ready_plan(template_plan, initial_messages, on_delta)
+
+    lazy_weeks = get_settings().plan_lazy_weeks
+    if lazy_weeks:
+        # Week 1 only, the other weeks come from `generate_weeks` on demand
+        initial_messages.append({"role": "system", "content": SYSTEM_PROMPT_FIRST_WEEK})
+
+    cache_key = _plan_cache_key(user_data)
+    cached_plan = await get_plan_cache().get(cache_key) if cache_key else None
+    if cached_plan:
+        logger.info(f"Plan served from cache (hit rate {get_plan_cache().hit_rate:.0%}).")
+        return await _ready_plan(cached_plan, initial_messages, on_delta)
+
+    try:
+        fanout = get_settings().plan_fanout_enabled and not lazy_weeks
+        plan_content = await _request_plan(initial_messages, on_delta, fanout)
         logger.info("Plan generated successfully by OpenAI.")
-        logger.debug(f"OpenAI Response: {response}")
 
         if plan_content:
             plan_str = plan_content.strip()
+            if cache_key:
+                await get_plan_cache().put(cache_key, plan_str)
             # Append assistant's response to the messages for history
-            history_for_refinement = initial_messages + [{"role": "assistant", "content": plan_str}]
-            return plan_str, history_for_refinement
-        else:
-            return None, []  # Return None for plan and empty history
+            history_for_refinement = [*initial_messages, {"role": "assistant", "content": plan_str}]
+            return plan_str, compact_history(history_for_refinement, plan_str)
 
     except OpenAIError as e:
         logger.error(f"OpenAI API error during plan generation: {e}")
-        return None, []
     except Exception as e:
         logger.exception(f"Unexpected error during plan generation: {e}")
-        return None, []
+    return None, []  # Return None for plan and empty history
+
+
+async def generate_weeks(user_data: Dict[str, Any], plan: str, weeks_done: int, upto: int) -> Optional[str]:
+    """Generates the loads of weeks `weeks_done + 1`..`upto` of a lazy plan; returns the plan with them.
+
+    The model sees the profile and the plan and answers with the main lifts' loads as JSON,
+    merged into the plan locally (see plan_weeks.py). Returns None if the request fails or
+    the loads do not fit the plan.
+    """
+    if not get_client():
+        logger.error("OpenAI client not initialized. Cannot generate plan weeks.")
+        return None
+
+    messages = [
+        *build_plan_messages(user_data),
+        {"role": "assistant", "content": plan},
+        {"role": "system", "content": SYSTEM_PROMPT_NEXT_WEEKS},
+        {"role": "user", "content": week_request(plan, weeks_done, upto)},
+    ]
+    logger.info("Requesting plan weeks {}-{}", weeks_done + 1, upto)
+    try:
+        response = await _create_completion(
+            "generate_weeks",
+            MODEL_NAME,
+            messages,
+            MAX_TOKENS_WEEK * (upto - weeks_done),
+            temperature=0.2,
+            response_format={"type": "json_object"},
+        )
+        log_payload("OpenAI response", lambda: response)
+        return add_week_loads(plan, weeks_done, upto, response.choices[0].message.content)
+    except (OpenAIError, WeekLoadsError) as e:
+        logger.error(f"Generating plan weeks {weeks_done + 1}-{upto} failed: {e}")
+        return None
+
 
+async def refine_plan(
+    history: List[CompactEntry], summary: Optional[HistorySummary] = None, plan: Optional[str] = None
+) -> Optional[str]:
+    """Refines or answers questions about a plan using the OpenAI API and history.
 
-async def refine_plan(history: List[Dict[str, str]]) -> Optional[str]:
-    """Refines or answers questions about a plan using the OpenAI API and history."""
-    if not aclient:
+    `history` is the compact stored history (see `history_store`); `plan` resolves its plan
+    reference. Only a token-budgeted window is sent: system prompts and plan, the rolling
+    `summary` of older turns, and the most recent turns verbatim.
+    """
+    if not get_client():
         logger.error("OpenAI client not initialized. Cannot refine plan.")
         return "Error: OpenAI client not configured."
 
@@ -154,35 +475,114 @@ async def refine_plan(history: List[Dict[str, str]]) -> Optional[str]:
         logger.error("History is empty or last message is not from user for refinement.")
         return "Error: Invalid history state for refinement."
 
-    logger.info(f"Requesting plan refinement. Last user request: {history[-1]['content']}")
-    logger.debug(f"Full history sent to OpenAI for refinement: {history}")
-
-    # Construct messages for the API call - system prompt must be first
-    # messages_for_api = history + [{"role": "system", "content": SYSTEM_PROMPT_REFINEMENT}]
+    messages = get_history_manager().build_messages(expand_history(history, plan), summary)
+    logger.opt(lazy=True).info(
+        "Requesting plan refinement ({}/{} messages, ~{} tokens)",
+        lambda: len(messages),
+        lambda: len(history),
+        lambda: estimate_message_tokens(messages),
+    )
+    log_payload("Messages sent to OpenAI for refinement", lambda: messages)
 
     try:
-        response = await aclient.chat.completions.create(
-            model=MODEL_NAME,
-            messages=history,
-            temperature=TEMPERATURE,
-            max_tokens=MAX_TOKENS_REFINEMENT,
-            timeout=120,
-        )
+        response = await _create_completion("refine_plan", MODEL_NAME, messages, MAX_TOKENS_REFINEMENT)
         refinement_response = response.choices[0].message.content
         logger.info("Plan refinement/answer generated successfully by OpenAI.")
-        logger.debug(f"OpenAI Response: {response}")
+        log_payload("OpenAI response", lambda: response)
 
         refinement_response = refinement_response.strip() if refinement_response else None
 
         if refinement_response:
-            history.append({"role": "assistant", "content": refinement_response})
+            history.append(compact_message({"role": "assistant", "content": refinement_response}))
             return refinement_response, history
         else:
             return None, history
 
     except OpenAIError as e:
         logger.error(f"OpenAI API error during plan refinement: {e}")
-        return None
+        return None, history
     except Exception as e:
         logger.exception(f"Unexpected error during plan refinement: {e}")
+        return None, history
+
+
+async def modify_plan(
+    history: List[CompactEntry], summary: Optional[HistorySummary], plan: str
+) -> Tuple[Optional[PlanModification], List[CompactEntry]]:
+    """Asks for the requested change as a structured patch and applies it to `plan`.
+
+    Like `refine_plan`, `history` ends with the user's request; the model sees the plan with
+    numbered lines and answers with a JSON patch instead of the rewritten plan. Raises
+    `PatchError` if the patch is invalid, so the caller can fall back to `refine_plan`.
+    """
+    if not get_client():
+        logger.error("OpenAI client not initialized. Cannot modify plan.")
+        return None, history
+
+    messages = get_history_manager().build_messages(expand_history(history, plan), summary)
+    messages = [
+        {"role": "assistant", "content": number_lines(plan)}
+        if message["role"] == "assistant" and message["content"] == plan
+        else message
+        for message in messages
+    ]
+    messages.insert(-1, {"role": "system", "content": SYSTEM_PROMPT_MODIFICATION})
+    log_payload("Messages sent to OpenAI for modification", lambda: messages)
+
+    try:
+        response = await _create_completion(
+            "modify_plan",
+            MODEL_NAME,
+            messages,
+            MAX_TOKENS_MODIFICATION,
+            temperature=0.2,
+            response_format={"type": "json_object"},
+        )
+    except OpenAIError as e:
+        logger.error(f"OpenAI API error during plan modification: {e}")
+        return None, history
+    log_payload("OpenAI response", lambda: response)
+
+    patch = parse_patch(response.choices[0].message.content, plan.count("\n") + 1)
+    modification = apply_patch(plan, patch)
+    logger.info(
+        "Plan modified by {} operations, {} sections changed", len(patch.ops), len(modification.changed_sections)
+    )
+    # The plan itself is stored once and referenced from the history, so only the summary is added
+    history.append(compact_message({"role": "assistant", "content": patch.summary}))
+    return modification, history
+
+
+async def summarize_history(previous_summary: Optional[str], messages: List[Dict[str, str]]) -> Optional[str]:
+    """Folds refinement messages (and the previous summary, if any) into a short summary."""
+    if not get_client():
+        logger.error("OpenAI client not initialized. Cannot summarize history.")
+        return None
+
+    transcript = "\n\n".join(f"{message['role']}: {message['content']}" for message in messages)
+    if previous_summary:
+        transcript = f"Предыдущее краткое содержание:\n{previous_summary}\n\nНовый фрагмент:\n{transcript}"
+
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT_SUMMARY},
+        {"role": "user", "content": transcript},
+    ]
+    try:
+        # Runs in the background, so a slow summary is not worth a hedged request
+        response = await _create_completion(
+            "summarize_history",
+            SUMMARY_MODEL_NAME,
+            messages,
+            MAX_TOKENS_SUMMARY,
+            temperature=0.2,
+            timeout=60,
+            hedge=False,
+        )
+        summary = response.choices[0].message.content
+        return summary.strip() if summary else None
+    except OpenAIError as e:
+        logger.error(f"OpenAI API error during history summarization: {e}")
+        return None
+    except Exception as e:
+        logger.exception(f"Unexpected error during history summarization: {e}")
         return None
@@ -0,0 +1,157 @@
+"""Cache of generated plans keyed on a normalized, bucketed user profile."""
+
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from loguru import logger
+
+from ai_gym_bro.config import get_settings
+from ai_gym_bro.services.profile import (
+    experience_level,
+    has_injuries,
+    normalize_text,
+    parse_height_cm,
+    parse_number,
+    parse_weight_kg,
+)
+
+# Bucket widths: profiles falling into the same buckets share a plan
+AGE_BUCKET_YEARS = 5
+HEIGHT_BUCKET_CM = 5
+WEIGHT_BUCKET_KG = 5
+BENCH_BUCKET_KG = 10
+
+
+def _bucket(value: Optional[float], width: int, raw: Any) -> str:
+    """Returns the bucket of a parsed number, or the normalized raw answer if it did not parse."""
+    if value is None:
+        return normalize_text(raw)
+    return str(int(value // width * width))
+
+
+def make_cache_key(user_data: Dict[str, Any], prompt_version: str) -> Optional[str]:
+    """Builds the cache key of a profile, or None if the profile must not share plans.
+
+    Profiles with injuries (or without an injuries answer) are never cached: the free
+    text drives personal substitutions.
+    """
+    injuries = user_data.get("injuries")
+    if injuries is None or has_injuries(injuries):
+        return None
+    parts = (
+        prompt_version,
+        normalize_text(user_data.get("goal")),
+        experience_level(user_data.get("experience")) or normalize_text(user_data.get("experience")),
+        _bucket(parse_number(user_data.get("age")), AGE_BUCKET_YEARS, user_data.get("age")),
+        _bucket(parse_height_cm(user_data.get("height")), HEIGHT_BUCKET_CM, user_data.get("height")),
+        _bucket(parse_weight_kg(user_data.get("weight")), WEIGHT_BUCKET_KG, user_data.get("weight")),
+        _bucket(parse_weight_kg(user_data.get("bench")), BENCH_BUCKET_KG, user_data.get("bench")),
+    )
+    return "|".join(parts)
+
+
+class _DiskTier:
+    """SQLite table of cached plans that survives restarts."""
+
+    def __init__(self, path: Path) -> None:
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS plans"
+            " (cache_key TEXT PRIMARY KEY, plan TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def get(self, key: str, now: float) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT plan, expires_at FROM plans WHERE cache_key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def put(self, key: str, plan: str, expires_at: float) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO plans (cache_key, plan, expires_at) VALUES (?, ?, ?)", (key, plan, expires_at)
+            )
+            self._connection.execute("DELETE FROM plans WHERE expires_at <= ?", (time.time(),))
+
+
+class PlanCache:
+    """In-memory LRU cache of plans with per-entry TTL and an optional on-disk tier.
+
+    Memory hits are served without I/O; memory misses fall through to the disk tier
+    (if configured) and are promoted back into memory.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl_seconds: float = 86400,
+        disk_path: Optional[Path] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: OrderedDict[str, Tuple[str, float]] = OrderedDict()  # key -> (plan, expires_at)
+        self._disk = _DiskTier(disk_path) if disk_path else None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of lookups served from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _remember(self, key: str, plan: str, expires_at: float) -> None:
+        self._entries[key] = (plan, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[str]:
+        """Returns the cached plan for a key, or None on a miss or expired entry."""
+        now = self._clock()
+        entry = self._entries.get(key)
+        if entry and entry[1] <= now:
+            del self._entries[key]
+            entry = None
+        if entry is None and self._disk:
+            entry = await asyncio.to_thread(self._disk.get, key, now)
+            if entry:
+                self._remember(key, *entry)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    async def put(self, key: str, plan: str) -> None:
+        """Stores a plan under a key for `ttl_seconds`."""
+        expires_at = self._clock() + self.ttl_seconds
+        self._remember(key, plan, expires_at)
+        if self._disk:
+            await asyncio.to_thread(self._disk.put, key, plan, expires_at)
+
+
+@lru_cache(maxsize=1)
+def get_plan_cache() -> PlanCache:
+    """Returns the process-wide plan cache configured from settings."""
+    settings = get_settings()
+    disk_path = Path(settings.plan_cache_path) if settings.plan_cache_path else None
+    logger.info(
+        f"Plan cache: {settings.plan_cache_max_entries} entries, TTL {settings.plan_cache_ttl}s, disk tier {disk_path}"
+    )
+    return PlanCache(settings.plan_cache_max_entries, settings.plan_cache_ttl, disk_path)
@@ -0,0 +1,114 @@
+"""Plan generation fanned out by training day.
+
+A single completion writes the whole plan token by token, so its latency grows with the
+plan's length. In fan-out mode a short planning call first fixes the split as JSON:
+
+    {"days": [{"title": "Присед и жим", "focus": "Ноги, грудь",
+               "main": ["Приседания со штангой", "Жим штанги лежа"]}, ...]}
+
+then every day is written by its own completion, concurrently (see
+`openai_service._fanout_plan`), and the days are merged into one plan in the usual
+Markdown. Wall time follows the longest day rather than the whole plan.
+`check_consistency` verifies the merged plan before it is used: every day of the split
+present with its main lifts, and the same number of weekly loads on every day.
+"""
+
+import json
+import re
+from dataclasses import dataclass
+from typing import List, Tuple
+
+from ai_gym_bro.services.plan_model import MAIN, parse_plan
+
+MAX_DAYS = 7
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+_DAY_HEADING = re.compile(r"^\s*(?:#{1,6}\s*)?\**\s*(?:День|Day)\s*\d+", re.IGNORECASE)
+
+
+class SplitError(ValueError):
+    """The planning call's split is malformed."""
+
+
+@dataclass(frozen=True)
+class DaySpec:
+    number: int
+    title: str
+    focus: str
+    main: Tuple[str, ...]  # Main lifts, by name
+
+
+def parse_split(text: str) -> List[DaySpec]:
+    """Parses and validates the planning call's JSON split."""
+    match = _JSON_OBJECT.search(text or "")
+    try:
+        raw = json.loads(match.group(0)) if match else None
+    except json.JSONDecodeError as e:
+        raise SplitError(f"Split is not valid JSON: {e}") from e
+    days = raw.get("days") if isinstance(raw, dict) else None
+    if not isinstance(days, list) or not 1 <= len(days) <= MAX_DAYS:
+        raise SplitError(f"Split must be an object with a `days` list of 1..{MAX_DAYS} days")
+
+    specs: List[DaySpec] = []
+    for number, day in enumerate(days, start=1):
+        title = day.get("title") if isinstance(day, dict) else None
+        main = day.get("main", []) if isinstance(day, dict) else None
+        if not isinstance(title, str) or not title.strip():
+            raise SplitError(f"Day {number} has no title")
+        if not isinstance(main, list) or not all(isinstance(name, str) and name.strip() for name in main):
+            raise SplitError(f"Day {number}: `main` must be a list of exercise names")
+        focus = day.get("focus")
+        specs.append(
+            DaySpec(number, title.strip(), focus.strip() if isinstance(focus, str) else "", tuple(map(str.strip, main)))
+        )
+    return specs
+
+
+def split_outline(days: List[DaySpec]) -> str:
+    """The whole split, as given to every day's completion so the days fit together."""
+    lines = []
+    for day in days:
+        line = f"День {day.number} — {day.title}"
+        if day.focus:
+            line += f" ({day.focus})"
+        if day.main:
+            line += f": {', '.join(day.main)}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def merge_days(days: List[DaySpec], texts: List[str]) -> str:
+    """Joins the days' Markdown under canonical day headings, in split order."""
+    blocks = []
+    for day, text in zip(days, texts, strict=True):
+        lines = (text or "").strip().split("\n")
+        if lines and _DAY_HEADING.match(lines[0]):
+            lines = lines[1:]  # The model's own heading is replaced by the split's one
+        blocks.append(f"### День {day.number} — {day.title}\n\n" + "\n".join(lines).strip())
+    return "\n\n".join(blocks)
+
+
+def check_consistency(plan_text: str, days: List[DaySpec]) -> List[str]:
+    """Returns the problems of a merged plan against its split; empty if consistent."""
+    plan = parse_plan(plan_text)
+    problems: List[str] = []
+    if [day.number for day in plan.days] != [day.number for day in days]:
+        problems.append(f"Expected days {[day.number for day in days]}, got {[day.number for day in plan.days]}")
+        return problems
+
+    week_counts = {}
+    for spec, day in zip(days, plan.days, strict=True):
+        section = day.section(MAIN)
+        if section is None or not section.exercises:
+            problems.append(f"Day {spec.number} has no main part")
+            continue
+        names = [exercise.name.casefold() for exercise in section.exercises]
+        for lift in spec.main:
+            if not any(lift.casefold() in name or name in lift.casefold() for name in names):
+                problems.append(f"Day {spec.number} is missing the main lift {lift!r} of the split")
+        for exercise in section.exercises:
+            if exercise.weeks > 1:  # A single load is the same every week
+                week_counts.setdefault(exercise.weeks, []).append(f"{spec.number}: {exercise.name}")
+    if len(week_counts) > 1:
+        problems.append(f"Main lifts differ in their number of weeks: {week_counts}")
+    return problems
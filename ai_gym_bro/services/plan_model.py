@@ -0,0 +1,307 @@
+"""Typed model of a generated plan, parsed from and rendered back to its Markdown.
+
+`SYSTEM_PROMPT_PLAN_GENERATION` fixes the plan's structure: training days, each with a
+warm-up, a main part and accessory work, and per-exercise loads for weeks 1-5. The
+parser turns the Markdown into days -> sections -> exercises, where an exercise keeps
+its loads (intensity %, sets, reps) in one flat float array instead of strings.
+
+Recognized exercise forms (bullets, numbering and bold markers are ignored):
+
+    Жим лежа — 4×8×70% (70/72/75/77/65)      sets×reps×% with the % of every week
+    Жим лежа                                  one line per week below the name,
+    - Неделя 1: 70 % × 4 подходов × 8 повторений   or a | Неделя | % | Подходы | Повторы | table
+    Планка — 3×30 (удержание в секундах)      sets×reps, same every week; the rest is a note
+    Бег на дорожке — 5 минут                  no loads, only a note
+
+In strict mode any other line, and a main-part exercise without weekly loads, raises
+`PlanParseError`; in lenient mode other lines are kept as notes of their day (or of the
+plan, before the first day) and rendered after the sections.
+`render_plan(parse_plan(text))` gives back `text` for plans in the canonical form
+`render_plan` writes, and `parse_plan(render_plan(plan)) == plan` for any parsed plan.
+"""
+
+import re
+from array import array
+from dataclasses import dataclass, field
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+WARMUP, MAIN, ACCESSORY = "warmup", "main", "accessory"
+SECTION_TITLES = {WARMUP: "Разминка", MAIN: "Основная часть", ACCESSORY: "Вспомогательные упражнения"}
+LOAD_FIELDS = 4  # pct, sets, reps_lo, reps_hi per week
+
+_NUMBER = r"\d+(?:[.,]\d+)?"
+_TIMES = r"\s*[×xх*]\s*"
+_REPS = r"(?P<lo>\d+)(?:\s*[–-]\s*(?P<hi>\d+))?"
+_DAY = re.compile(r"^(?:#{1,6}\s*)?\**\s*(?:День|Day)\s*(?P<number>\d+)\s*[:.—–-]?\s*(?P<title>.*?)[\s*:]*$", re.I)
+_SECTION = re.compile(r"^(?:#{1,6}\s*)?\**\s*(?P<title>разминка|основная часть|вспомогательн\w*)", re.I)
+_MARKERS = re.compile(r"^\s*(?:[-*+•]\s+|\d+[.)]\s+)?")
+_WEEK = re.compile(r"^Неделя\s*(?P<week>\d+)\s*[:—–-]\s*(?P<load>.+)$", re.I)
+_WEEK_LOAD = re.compile(
+    rf"(?P<pct>{_NUMBER})\s*%{_TIMES}(?P<sets>\d+)\s*(?:подход\w*)?{_TIMES}{_REPS}\s*(?:повтор\w*)?\s*(?P<note>.*)$",
+    re.I,
+)
+_TABLE_ROW = re.compile(
+    rf"^\|\s*(?:Неделя\s*)?(?P<week>\d+)\s*\|\s*(?P<pct>{_NUMBER})\s*%?\s*\|\s*(?P<sets>\d+)\s*\|\s*{_REPS}\s*\|", re.I
+)
+_TABLE_OTHER = re.compile(r"^\|.*\|$")  # Header and rule rows
+_EXERCISE = re.compile(
+    rf"^(?P<name>.+?)\s+[—–-]\s+(?P<sets>\d+){_TIMES}{_REPS}"
+    rf"(?:{_TIMES}(?P<pct>{_NUMBER})\s*%)?"
+    rf"(?:\s*\(\s*(?P<weeks>{_NUMBER}(?:\s*/\s*{_NUMBER})+)\s*%?\s*\))?"
+    r"\s*(?P<note>.*)$"
+)
+_NAME_NOTE = re.compile(r"^(?P<name>.+?)\s+[—–-]\s+(?P<note>.+)$")  # "Бег — 5 минут"
+_RULE = re.compile(r"^\s*(?:-{3,}|\*{3,}|_{3,})\s*$")
+
+
+class PlanParseError(ValueError):
+    """A line of the plan does not fit the plan structure (strict mode)."""
+
+    def __init__(self, line_number: int, line: str, reason: str) -> None:
+        super().__init__(f"Line {line_number}: {reason}: {line!r}")
+        self.line_number = line_number
+
+
+class WeekLoad(NamedTuple):
+    pct: float  # 0 when no intensity is given
+    sets: int
+    reps_lo: int
+    reps_hi: int
+
+    @property
+    def reps(self) -> str:
+        return str(self.reps_lo) if self.reps_hi == self.reps_lo else f"{self.reps_lo}–{self.reps_hi}"
+
+
+def _float(text: str) -> float:
+    return float(text.replace(",", "."))
+
+
+def _format_number(value: float) -> str:
+    return f"{value:g}"
+
+
+@dataclass(slots=True)
+class Exercise:
+    """An exercise and its loads: one entry per week, or a single entry for every week."""
+
+    name: str
+    loads: array = field(default_factory=lambda: array("f"))
+    note: str = ""
+
+    @property
+    def weeks(self) -> int:
+        return len(self.loads) // LOAD_FIELDS
+
+    def add_week(self, pct: float, sets: int, reps_lo: int, reps_hi: Optional[int] = None) -> None:
+        self.loads.extend((pct, sets, reps_lo, reps_lo if reps_hi is None else reps_hi))
+
+    def week(self, number: int) -> Optional[WeekLoad]:
+        """Returns the load of week `number` (1-based), or None if the plan does not say."""
+        if self.weeks == 1:
+            number = 1
+        if not 1 <= number <= self.weeks:
+            return None
+        pct, sets, reps_lo, reps_hi = self.loads[(number - 1) * LOAD_FIELDS : number * LOAD_FIELDS]
+        return WeekLoad(pct, int(sets), int(reps_lo), int(reps_hi))
+
+    def render(self) -> List[str]:
+        loads = [self.week(number) for number in range(1, self.weeks + 1)]
+        first = loads[0] if loads else None
+        if first and all((load.sets, load.reps) == (first.sets, first.reps) for load in loads):
+            line = f"{self.name} — {first.sets}×{first.reps}"
+            if first.pct:
+                line += f"×{_format_number(first.pct)}%"
+            if len(loads) > 1:
+                line += f" ({'/'.join(_format_number(load.pct) for load in loads)})"
+            return [f"{line} {self.note}" if self.note else line]
+        # Without loads, or loads changing sets/reps by week: the name (and note), then a line per week
+        return [f"{self.name} — {self.note}" if self.note else self.name] + [
+            f"- Неделя {number}: {_format_number(load.pct)}% × {load.sets} подходов × {load.reps} повторений"
+            for number, load in enumerate(loads, start=1)
+        ]
+
+
+@dataclass(slots=True)
+class Section:
+    kind: str  # WARMUP, MAIN or ACCESSORY
+    exercises: List[Exercise] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class Day:
+    number: int
+    title: str = ""
+    sections: List[Section] = field(default_factory=list)
+    notes: List[str] = field(default_factory=list)
+
+    def section(self, kind: str) -> Optional[Section]:
+        return next((section for section in self.sections if section.kind == kind), None)
+
+
+@dataclass(slots=True)
+class Plan:
+    days: List[Day] = field(default_factory=list)
+    notes: List[str] = field(default_factory=list)  # Lines before the first day
+
+    @property
+    def week_count(self) -> int:
+        return max((exercise.weeks for _, _, exercise in self.exercises()), default=0)
+
+    def exercises(self) -> List[Tuple[Day, Section, Exercise]]:
+        return [
+            (day, section, exercise) for day in self.days for section in day.sections for exercise in section.exercises
+        ]
+
+    def find(self, name: str) -> List[Tuple[Day, Section, Exercise]]:
+        """Returns the exercises whose name contains `name`, case-insensitively."""
+        needle = name.casefold()
+        return [entry for entry in self.exercises() if needle in entry[2].name.casefold()]
+
+    def to_compact(self) -> Tuple[Any, ...]:
+        """Returns the plan as nested tuples of strings, ints and bytes, e.g. for persistence."""
+        return (
+            tuple(self.notes),
+            tuple(
+                (
+                    day.number,
+                    day.title,
+                    tuple(day.notes),
+                    tuple(
+                        (section.kind, tuple((ex.name, ex.loads.tobytes(), ex.note) for ex in section.exercises))
+                        for section in day.sections
+                    ),
+                )
+                for day in self.days
+            ),
+        )
+
+    @classmethod
+    def from_compact(cls, data: Tuple[Any, ...]) -> "Plan":
+        notes, days = data
+        plan = cls(notes=list(notes))
+        for number, title, day_notes, sections in days:
+            day = Day(number, title, notes=list(day_notes))
+            for kind, exercises in sections:
+                section = Section(kind)
+                for name, loads, note in exercises:
+                    loads_array = array("f")
+                    loads_array.frombytes(loads)
+                    section.exercises.append(Exercise(name, loads_array, note))
+                day.sections.append(section)
+            plan.days.append(day)
+        return plan
+
+
+def _strip_markup(line: str) -> str:
+    """Drops list markers and bold/italic markers around the line, and a trailing colon."""
+    text = _MARKERS.sub("", line.strip(), count=1)
+    return text.strip("*_ ").rstrip(":").strip("*_ ")
+
+
+def _section_kind(title: str) -> str:
+    title = title.lower()
+    if title.startswith("разминка"):
+        return WARMUP
+    return MAIN if title.startswith("основная") else ACCESSORY
+
+
+def _parse_exercise_line(text: str) -> Optional[Exercise]:
+    match = _EXERCISE.match(text)
+    if not match:
+        return None
+    exercise = Exercise(match["name"].strip("*_ "), note=match["note"].strip())
+    sets, lo, hi = int(match["sets"]), int(match["lo"]), int(match["hi"] or match["lo"])
+    if match["weeks"]:
+        for pct in match["weeks"].split("/"):
+            exercise.add_week(_float(pct), sets, lo, hi)
+    else:
+        exercise.add_week(_float(match["pct"]) if match["pct"] else 0.0, sets, lo, hi)
+    return exercise
+
+
+def _add_week_load(exercise: Exercise, week: Optional[re.Match], row: Optional[re.Match]) -> bool:
+    """Adds the load of a week line or table row to the exercise; False if the load is not understood."""
+    load = _WEEK_LOAD.match(week["load"]) if week else row
+    if load is None:
+        return False
+    exercise.add_week(_float(load["pct"]), int(load["sets"]), int(load["lo"]), int(load["hi"] or load["lo"]))
+    return True
+
+
+def parse_plan(text: str, strict: bool = False) -> Plan:
+    """Parses a plan's Markdown; see the module docstring for the accepted forms."""
+    plan = Plan()
+    day: Optional[Day] = None
+    section: Optional[Section] = None
+    pending: Optional[Exercise] = None  # An exercise name waiting for its week lines
+    pending_line = (0, "")
+
+    def keep(line_number: int, line: str, reason: str) -> None:
+        if strict:
+            raise PlanParseError(line_number, line, reason)
+        (day.notes if day else plan.notes).append(line.strip())
+
+    def settle_pending() -> None:
+        """Keeps an exercise whose weeks did not follow if it has a free-text prescription."""
+        nonlocal pending
+        if pending is not None and not pending.weeks:
+            if not pending.note:
+                section.exercises.remove(pending)
+                keep(*pending_line, "text in a section that is not an exercise")
+            elif strict and section.kind == MAIN:
+                raise PlanParseError(*pending_line, "main exercise without weekly loads")
+        pending = None
+
+    for line_number, line in enumerate(text.split("\n"), start=1):
+        if not line.strip() or _RULE.match(line):
+            continue
+        text_only = _strip_markup(line)
+
+        week = _WEEK.match(text_only)
+        row = _TABLE_ROW.match(line.strip())
+        if pending is not None and (week or row):
+            if not _add_week_load(pending, week, row):
+                keep(line_number, line, "week load not understood")
+            continue
+        if pending is not None and _TABLE_OTHER.match(line.strip()):
+            continue
+
+        settle_pending()
+        if match := _DAY.match(line.strip()):
+            day = Day(int(match["number"]), match["title"].strip("*_ —–-:"))
+            plan.days.append(day)
+            section = None
+        elif day is not None and (match := _SECTION.match(line.strip())) and len(text_only) <= 40:
+            section = Section(_section_kind(match["title"]))
+            day.sections.append(section)
+        elif section is None:
+            keep(line_number, line, "text outside of a day section")
+        elif exercise := _parse_exercise_line(text_only):
+            section.exercises.append(exercise)
+        else:
+            # The name of an exercise whose weeks follow, or one with a free-text prescription
+            name_note = _NAME_NOTE.match(text_only)
+            pending = Exercise(name_note["name"], note=name_note["note"]) if name_note else Exercise(text_only)
+            pending_line = (line_number, line)
+            section.exercises.append(pending)
+    settle_pending()
+    return plan
+
+
+def render_plan(plan: Plan) -> str:
+    """Renders the plan in the canonical Markdown form."""
+    blocks: List[str] = []
+    if plan.notes:
+        blocks.append("\n".join(plan.notes))
+    for day in plan.days:
+        lines = [f"### День {day.number}" + (f" — {day.title}" if day.title else "")]
+        blocks.append("\n".join(lines))
+        for section in day.sections:
+            lines = [f"**{SECTION_TITLES[section.kind]}:**"]
+            for exercise in section.exercises:
+                lines.extend(exercise.render())
+            blocks.append("\n".join(lines))
+        if day.notes:
+            blocks.append("\n".join(day.notes))
+    return "\n\n".join(blocks)
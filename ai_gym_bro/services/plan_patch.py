@@ -0,0 +1,165 @@
+"""Compact structured patches to a stored plan, applied locally instead of regenerating it.
+
+For a modification the model sees the plan with numbered lines and answers with a JSON
+patch instead of re-emitting the plan:
+
+    {"summary": "Жим штанги заменен жимом гантелей из-за плеча",
+     "ops": [{"op": "replace", "line": 12, "text": "Жим гантелей — 4×10×65% (65/70/75/70/65)"},
+             {"op": "insert_after", "line": 12, "text": "Face pull — 3×15"},
+             {"op": "delete", "line": 14},
+             {"op": "substitute", "find": "Жим штанги лежа", "text": "Жим гантелей лежа"}]}
+
+Line numbers refer to the plan as sent. The patch is validated as a whole before
+anything is applied, and only the plan sections it touched are shown to the user again.
+"""
+
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+LINE_OPS = ("replace", "insert_after", "delete")
+SUBSTITUTE_OP = "substitute"
+MAX_OPS = 50
+
+# Sections start at Markdown headers and at bold day titles ("**День 1 — ...**")
+_SECTION_START = re.compile(r"^\s{0,3}(#{1,6}\s|\*\*\s*(День|Day)\s*\d)", re.IGNORECASE)
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+
+class PatchError(ValueError):
+    """The model's patch is malformed or does not fit the plan."""
+
+
+@dataclass(frozen=True)
+class PatchOp:
+    op: str
+    line: int = 0  # 1-based, for the line operations
+    text: str = ""
+    find: str = ""  # For `substitute`
+
+
+@dataclass(frozen=True)
+class PlanPatch:
+    summary: str
+    ops: Tuple[PatchOp, ...]
+
+
+@dataclass(frozen=True)
+class PlanModification:
+    """A patched plan and what to show the user: the summary and the changed sections."""
+
+    plan: str
+    summary: str
+    changed_sections: Tuple[str, ...]
+
+    def render(self) -> str:
+        return "\n\n".join((self.summary, *self.changed_sections)).strip()
+
+
+def number_lines(plan: str) -> str:
+    """Returns the plan with 1-based line numbers, as the patch refers to them."""
+    return "\n".join(f"{number}| {line}" for number, line in enumerate(plan.split("\n"), start=1))
+
+
+def _field(raw: Dict[str, Any], name: str, index: int) -> str:
+    value = raw.get(name)
+    if not isinstance(value, str) or not value.strip():
+        raise PatchError(f"Operation {index}: `{name}` must be a non-empty string")
+    return value
+
+
+def parse_patch(text: str, line_count: int) -> PlanPatch:
+    """Parses and validates the model's JSON patch against a plan of `line_count` lines."""
+    match = _JSON_OBJECT.search(text or "")  # Tolerates a ```json fence around the object
+    try:
+        raw = json.loads(match.group(0)) if match else None
+    except json.JSONDecodeError as e:
+        raise PatchError(f"Patch is not valid JSON: {e}") from e
+    if not isinstance(raw, dict) or not isinstance(raw.get("ops", []), list):
+        raise PatchError("Patch must be an object with an `ops` list")
+    summary = raw.get("summary")
+    if not isinstance(summary, str) or not summary.strip():
+        raise PatchError("Patch has no summary")
+    if len(raw.get("ops", [])) > MAX_OPS:
+        raise PatchError(f"Patch has more than {MAX_OPS} operations")
+
+    ops: List[PatchOp] = []
+    edited_lines: Set[int] = set()
+    for index, item in enumerate(raw.get("ops", []), start=1):
+        if not isinstance(item, dict):
+            raise PatchError(f"Operation {index} is not an object")
+        op = item.get("op")
+        if op == SUBSTITUTE_OP:
+            ops.append(PatchOp(op, find=_field(item, "find", index), text=str(item.get("text") or "")))
+            continue
+        if op not in LINE_OPS:
+            raise PatchError(f"Operation {index}: unknown op {op!r}")
+        line = item.get("line")
+        if not isinstance(line, int) or isinstance(line, bool) or not 1 <= line <= line_count:
+            raise PatchError(f"Operation {index}: line {line!r} is not in 1..{line_count}")
+        if op != "insert_after":
+            if line in edited_lines:
+                raise PatchError(f"Operation {index}: line {line} is replaced or deleted twice")
+            edited_lines.add(line)
+        ops.append(PatchOp(op, line, "" if op == "delete" else _field(item, "text", index)))
+    return PlanPatch(summary.strip(), tuple(ops))
+
+
+def split_sections(lines: List[str]) -> List[Tuple[int, int]]:
+    """Returns the (start, end) line ranges of the plan's sections."""
+    starts = [index for index, line in enumerate(lines) if _SECTION_START.match(line)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    return list(zip(starts, starts[1:] + [len(lines)], strict=True))
+
+
+def _substitute(lines: List[str], patch: PlanPatch) -> List[str]:
+    """Applies the patch's substitutions to every line; raises PatchError if one finds nothing."""
+    for op in patch.ops:
+        if op.op == SUBSTITUTE_OP and not any(op.find in line for line in lines):
+            raise PatchError(f"Substitution target not found in the plan: {op.find!r}")
+    substituted = list(lines)
+    for op in patch.ops:
+        if op.op == SUBSTITUTE_OP:
+            substituted = [line.replace(op.find, op.text) for line in substituted]
+    return substituted
+
+
+def apply_patch(plan: str, patch: PlanPatch) -> PlanModification:
+    """Applies a validated patch to the plan; raises PatchError if a substitution finds nothing."""
+    lines = plan.split("\n")
+    changed: Set[int] = set()  # Indices into the new lines
+    substituted = _substitute(lines, patch)
+
+    by_line: Dict[int, List[PatchOp]] = {}
+    for op in patch.ops:
+        if op.op != SUBSTITUTE_OP:
+            by_line.setdefault(op.line - 1, []).append(op)
+
+    new_lines: List[str] = []
+    for index, line in enumerate(substituted):
+        ops = by_line.get(index, [])
+        edit: Optional[PatchOp] = next((op for op in ops if op.op != "insert_after"), None)
+        if edit is None:
+            if line != lines[index]:
+                changed.add(len(new_lines))
+            new_lines.append(line)
+        elif edit.op == "replace":
+            for new_line in edit.text.split("\n"):
+                changed.add(len(new_lines))
+                new_lines.append(new_line)
+        else:  # delete: the section that lost the line has changed
+            changed.add(max(len(new_lines) - 1, 0))
+        for op in ops:
+            if op.op == "insert_after":
+                for new_line in op.text.split("\n"):
+                    changed.add(len(new_lines))
+                    new_lines.append(new_line)
+
+    sections = [
+        "\n".join(new_lines[start:end]).strip()
+        for start, end in split_sections(new_lines)
+        if any(start <= index < end for index in changed)
+    ]
+    return PlanModification("\n".join(new_lines), patch.summary, tuple(section for section in sections if section))
@@ -0,0 +1,127 @@
+"""Bounded background queue for plan generation jobs."""
+
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Awaitable, Callable, Deque, List, Optional
+
+from loguru import logger
+
+from ai_gym_bro.config import get_settings
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at its maximum depth."""
+
+
+@dataclass(eq=False)
+class PlanJob:
+    """A unit of work for the pool: generate one user's plan and deliver it."""
+
+    user_id: int
+    run: Callable[[], Awaitable[None]]
+    enqueued_at: float = field(default_factory=time.monotonic)
+    cancelled: bool = False  # Skipped by the worker instead of run
+
+
+class PlanJobQueue:
+    """FIFO job queue served by a fixed pool of workers.
+
+    At most `workers` jobs run at once, which caps concurrent OpenAI generations, and at
+    most `max_depth` jobs wait; beyond that `submit` raises `QueueFullError` so callers
+    can push back instead of piling up requests that would all time out.
+    """
+
+    def __init__(self, workers: int, max_depth: int) -> None:
+        self.workers = max(workers, 1)
+        self.max_depth = max(max_depth, 1)
+        self._queue: Optional[asyncio.Queue[PlanJob]] = None
+        self._waiting: Deque[PlanJob] = deque()  # Mirror of the queue, for position lookups
+        self._tasks: List[asyncio.Task] = []
+        self.busy = 0
+
+    @property
+    def running(self) -> bool:
+        """True while the worker pool is started."""
+        return bool(self._tasks)
+
+    @property
+    def depth(self) -> int:
+        """Number of jobs waiting for a worker."""
+        return sum(not job.cancelled for job in self._waiting)
+
+    @property
+    def idle_workers(self) -> int:
+        """Number of workers not running a job."""
+        return self.workers - self.busy
+
+    async def start(self) -> None:
+        """Starts the worker pool."""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_depth)
+        self._tasks = [asyncio.create_task(self._worker(i), name=f"plan-worker-{i}") for i in range(self.workers)]
+        logger.info(f"Plan queue started: {self.workers} workers, max depth {self.max_depth}")
+
+    async def stop(self) -> None:
+        """Cancels the workers; jobs still waiting are dropped."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._waiting:
+            logger.warning(f"Plan queue stopped with {len(self._waiting)} jobs still waiting")
+        self._waiting.clear()
+
+    def submit(self, job: PlanJob) -> int:
+        """Enqueues a job and returns its 1-based position among waiting jobs."""
+        if self._queue is None or self._queue.full():
+            raise QueueFullError(f"Plan queue is full ({self.max_depth} jobs waiting)")
+        self._queue.put_nowait(job)
+        self._waiting.append(job)
+        return self.depth
+
+    def position(self, user_id: int) -> Optional[int]:
+        """Returns the 1-based queue position of the user's waiting job, or None if not waiting."""
+        live = (job for job in self._waiting if not job.cancelled)
+        for index, job in enumerate(live, start=1):
+            if job.user_id == user_id:
+                return index
+        return None
+
+    def cancel(self, user_id: int) -> int:
+        """Cancels the user's waiting jobs; returns how many were cancelled."""
+        jobs = [job for job in self._waiting if job.user_id == user_id and not job.cancelled]
+        for job in jobs:
+            job.cancelled = True
+        return len(jobs)
+
+    async def _worker(self, number: int) -> None:
+        while True:
+            job = await self._queue.get()
+            self._waiting.popleft()  # FIFO: the job taken is always the oldest waiting one
+            if job.cancelled:
+                logger.debug(f"Worker {number} skipped cancelled job of user {job.user_id}")
+                self._queue.task_done()
+                continue
+            self.busy += 1
+            logger.debug(
+                f"Worker {number} picked job of user {job.user_id} "
+                f"after {time.monotonic() - job.enqueued_at:.1f}s in queue"
+            )
+            try:
+                await job.run()
+            except Exception as e:
+                logger.exception(f"Plan job of user {job.user_id} failed: {e}")
+            finally:
+                self.busy -= 1
+                self._queue.task_done()
+
+
+@lru_cache(maxsize=1)
+def get_plan_queue() -> PlanJobQueue:
+    """Returns the process-wide plan queue configured from settings."""
+    settings = get_settings()
+    return PlanJobQueue(settings.plan_queue_workers, settings.plan_queue_max_depth)
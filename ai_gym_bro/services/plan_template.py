@@ -0,0 +1,121 @@
+"""Rule-based plan skeletons, built locally from the rules of `SYSTEM_PROMPT_PLAN_GENERATION`.
+
+The generation prompt already fixes most of a plan: 3 training days for beginner and
+intermediate lifters and 5 for advanced ones, 8-12 reps at 65-75% of the 1RM for muscle
+gain, 12-15 reps at 60-70% with more cardio and supersets for fat loss, and a 5-week
+wave. `build_template_plan` applies these rules to an exercise catalog and returns a
+`Plan` in a few milliseconds; the model is then only asked to adapt it to injuries (see
+`openai_service.generate_plan`), or not at all.
+
+Profiles the rules do not cover (unclear experience, another goal) get no template and
+are written by the model as before.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from ai_gym_bro.handlers.common import FAT_LOSS, MUSCLE_GAIN
+from ai_gym_bro.services.plan_model import ACCESSORY, MAIN, WARMUP, Day, Exercise, Plan, Section
+from ai_gym_bro.services.profile import EXPERIENCE_ADVANCED, experience_level
+
+# (pct, sets, reps) per week: four building weeks and a deload
+WAVES: Dict[str, Tuple[Tuple[float, int, int], ...]] = {
+    MUSCLE_GAIN: ((65, 4, 12), (67.5, 4, 10), (70, 4, 10), (75, 4, 8), (65, 3, 10)),
+    FAT_LOSS: ((60, 3, 15), (62.5, 3, 15), (65, 4, 12), (70, 4, 12), (60, 3, 15)),
+}
+SECONDARY_SETS = 1  # The second main lift of a day runs at the same % with this many sets less
+# (sets, reps_lo, reps_hi) of the accessory work
+ACCESSORY_LOADS = {MUSCLE_GAIN: (3, 10, 12), FAT_LOSS: (3, 12, 15)}
+
+# Exercise catalog by movement
+CATALOG: Dict[str, str] = {
+    "squat": "Приседания со штангой",
+    "front_squat": "Фронтальные приседания",
+    "bench": "Жим штанги лежа",
+    "incline_bench": "Жим штанги лежа на наклонной скамье",
+    "close_grip_bench": "Жим лежа узким хватом",
+    "deadlift": "Становая тяга",
+    "romanian_deadlift": "Румынская тяга",
+    "overhead_press": "Жим штанги стоя",
+    "row": "Тяга штанги в наклоне",
+    "lat_pulldown": "Тяга верхнего блока",
+    "dumbbell_row": "Тяга гантели в наклоне",
+    "lunge": "Выпады с гантелями",
+    "leg_press": "Жим ногами",
+    "leg_curl": "Сгибания ног в тренажере",
+    "lateral_raise": "Махи гантелями в стороны",
+    "face_pull": "Тяга каната к лицу",
+    "biceps_curl": "Сгибания рук со штангой",
+    "triceps_pushdown": "Разгибания рук на блоке",
+    "plank": "Планка",
+    "hanging_leg_raise": "Подъемы ног в висе",
+}
+WARMUP_DRILLS = (("Кардио (велотренажер или гребля)", "5 минут"), ("Суставная разминка", "5 минут"))
+CARDIO = ("Кардио в умеренном темпе", "15–20 минут")
+SUPERSET_NOTE = "(суперсет с предыдущим упражнением)"
+
+# Per day: title, main lifts (the first one with the wave's full sets), accessories
+DAYS: Dict[int, Tuple[Tuple[str, Tuple[str, ...], Tuple[str, ...]], ...]] = {
+    3: (
+        ("Присед и жим", ("squat", "bench"), ("dumbbell_row", "lateral_raise", "plank")),
+        ("Тяга и жим стоя", ("deadlift", "overhead_press"), ("lat_pulldown", "biceps_curl", "hanging_leg_raise")),
+        ("Жим и ноги", ("bench", "front_squat"), ("row", "triceps_pushdown", "face_pull")),
+    ),
+    5: (
+        ("Присед", ("squat", "leg_press"), ("leg_curl", "plank")),
+        ("Жим лежа", ("bench", "incline_bench"), ("dumbbell_row", "triceps_pushdown")),
+        ("Тяга", ("deadlift", "row"), ("lat_pulldown", "hanging_leg_raise")),
+        ("Жим стоя", ("overhead_press", "close_grip_bench"), ("lateral_raise", "face_pull")),
+        ("Ноги и спина", ("front_squat", "romanian_deadlift"), ("lunge", "biceps_curl")),
+    ),
+}
+
+
+def training_days(user_data: Dict[str, Any]) -> Optional[int]:
+    """3 days a week for beginner and intermediate lifters, 5 for advanced ones, None if unclear."""
+    level = experience_level(user_data.get("experience"))
+    if level is None:
+        return None
+    return 5 if level == EXPERIENCE_ADVANCED else 3
+
+
+def _main_lift(movement: str, goal: str, fewer_sets: int) -> Exercise:
+    exercise = Exercise(CATALOG[movement])
+    for pct, sets, reps in WAVES[goal]:
+        exercise.add_week(pct, max(sets - fewer_sets, 2), reps)
+    return exercise
+
+
+def _day(number: int, title: str, main: Tuple[str, ...], accessories: Tuple[str, ...], goal: str) -> Day:
+    warmup = Section(WARMUP, [Exercise(name, note=note) for name, note in WARMUP_DRILLS])
+    # Light sets of the day's first lift complete the warm-up
+    warmup.exercises.append(Exercise(f"{CATALOG[main[0]]} с пустым грифом или легким весом"))
+    warmup.exercises[-1].add_week(0, 2, 10)
+
+    main_section = Section(
+        MAIN, [_main_lift(movement, goal, SECONDARY_SETS if index else 0) for index, movement in enumerate(main)]
+    )
+
+    sets, reps_lo, reps_hi = ACCESSORY_LOADS[goal]
+    accessory_section = Section(ACCESSORY)
+    for index, movement in enumerate(accessories):
+        # Fat loss pairs every second accessory with the one before it
+        note = SUPERSET_NOTE if goal == FAT_LOSS and index % 2 else ""
+        exercise = Exercise(CATALOG[movement], note=note)
+        exercise.add_week(0, sets, reps_lo, reps_hi)
+        accessory_section.exercises.append(exercise)
+    if goal == FAT_LOSS:
+        accessory_section.exercises.append(Exercise(CARDIO[0], note=CARDIO[1]))
+    return Day(number, title, [warmup, main_section, accessory_section])
+
+
+def build_template_plan(user_data: Dict[str, Any]) -> Optional[Plan]:
+    """Builds the 5-week plan for the profile's level and goal, or None if the rules do not cover it."""
+    goal = user_data.get("goal")
+    day_count = training_days(user_data)
+    if goal not in WAVES or day_count is None:
+        return None
+    days: List[Day] = [
+        _day(number, title, main, accessories, goal)
+        for number, (title, main, accessories) in enumerate(DAYS[day_count], start=1)
+    ]
+    return Plan(days)
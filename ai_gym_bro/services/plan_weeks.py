@@ -0,0 +1,100 @@
+"""Plans generated week by week: the first response has the split and week 1 only.
+
+Most users start with week 1 and many never come back for the rest, so in lazy mode the
+plan is first written with the week 1 load of every main lift. The loads of later weeks
+are asked for on demand (`/week N`), as JSON:
+
+    {"loads": [{"week": 2, "day": 1, "exercise": "Жим штанги лежа", "pct": 70, "sets": 4, "reps": "8"}, ...]}
+
+and merged into the stored plan, which is then rendered in the canonical form of
+`plan_model`, so the finished weeks stay in the plan for later questions.
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from ai_gym_bro.services.local_answers import render_day
+from ai_gym_bro.services.plan_model import MAIN, Day, Exercise, Plan, parse_plan, render_plan
+
+TOTAL_WEEKS = 5
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+_REPS = re.compile(r"^\s*(\d+)\s*(?:[–-]\s*(\d+))?\s*$")
+
+
+class WeekLoadsError(ValueError):
+    """The model's week loads are malformed or do not cover the plan's main lifts."""
+
+
+def weeks_in_plan(plan_text: str) -> int:
+    """Number of weeks the plan has loads for."""
+    return parse_plan(plan_text).week_count
+
+
+def pending_lifts(plan: Plan, weeks_done: int) -> List[Tuple[Day, Exercise]]:
+    """The main lifts with an intensity that have loads for the first `weeks_done` weeks only."""
+    return [
+        (day, exercise)
+        for day in plan.days
+        for exercise in (day.section(MAIN).exercises if day.section(MAIN) else [])
+        if exercise.weeks == weeks_done and exercise.week(1).pct  # Without % a load is the same every week
+    ]
+
+
+def week_request(plan_text: str, weeks_done: int, upto: int) -> str:
+    """The request for the next weeks' loads, naming every main lift to fill."""
+    weeks = f"недели {weeks_done + 1}" if upto == weeks_done + 1 else f"недель {weeks_done + 1}–{upto}"
+    lifts = "\n".join(
+        f"- День {day.number}: {exercise.name}" for day, exercise in pending_lifts(parse_plan(plan_text), weeks_done)
+    )
+    return f"Составьте нагрузки {weeks} для основных упражнений:\n{lifts}"
+
+
+def _entry_key(entry: Any) -> Optional[Tuple[int, int, str]]:
+    if not isinstance(entry, dict):
+        return None
+    week, day, name = entry.get("week"), entry.get("day"), entry.get("exercise")
+    if not isinstance(week, int) or not isinstance(day, int) or not isinstance(name, str):
+        return None
+    return week, day, name.strip().casefold()
+
+
+def _find(entries: Dict[Tuple[int, int, str], Dict[str, Any]], week: int, day: int, name: str) -> Dict[str, Any]:
+    name = name.casefold()
+    for (entry_week, entry_day, entry_name), entry in entries.items():
+        if (entry_week, entry_day) == (week, day) and (entry_name in name or name in entry_name):
+            return entry
+    raise WeekLoadsError(f"No load for week {week}, day {day}: {name!r}")
+
+
+def add_week_loads(plan_text: str, weeks_done: int, upto: int, text: str) -> str:
+    """Adds the loads of weeks `weeks_done + 1`..`upto` from the model's JSON to the plan; returns the new plan."""
+    match = _JSON_OBJECT.search(text or "")
+    try:
+        raw = json.loads(match.group(0)) if match else None
+    except json.JSONDecodeError as e:
+        raise WeekLoadsError(f"Week loads are not valid JSON: {e}") from e
+    loads = raw.get("loads") if isinstance(raw, dict) else None
+    if not isinstance(loads, list):
+        raise WeekLoadsError("Week loads must be an object with a `loads` list")
+    entries = {key: entry for entry in loads if (key := _entry_key(entry)) is not None}
+
+    plan = parse_plan(plan_text)
+    lifts = pending_lifts(plan, weeks_done)
+    if not lifts:
+        raise WeekLoadsError(f"The plan has no main lifts with {weeks_done} weeks of loads")
+    for week in range(weeks_done + 1, upto + 1):
+        for day, exercise in lifts:
+            entry = _find(entries, week, day.number, exercise.name)
+            reps = _REPS.match(str(entry.get("reps", "")))
+            pct, sets = entry.get("pct"), entry.get("sets")
+            if not reps or not isinstance(pct, int | float) or not isinstance(sets, int):
+                raise WeekLoadsError(f"Invalid load for week {week}, day {day.number}: {entry}")
+            exercise.add_week(float(pct), sets, int(reps.group(1)), int(reps.group(2) or reps.group(1)))
+    return render_plan(plan)
+
+
+def render_week(plan_text: str, week: int, one_rm: Optional[float] = None) -> str:
+    """Every day of the plan with the loads of one week (and kilograms for the bench press)."""
+    return "\n\n".join(render_day(day, week, one_rm) for day in parse_plan(plan_text).days)
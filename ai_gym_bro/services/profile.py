@@ -0,0 +1,89 @@
+"""Normalization of the free-text profile answers collected by the workflow."""
+
+import re
+from typing import Any, Dict, Optional
+
+EXPERIENCE_BEGINNER = "beginner"
+EXPERIENCE_INTERMEDIATE = "intermediate"
+EXPERIENCE_ADVANCED = "advanced"
+
+_EXPERIENCE_KEYWORDS = (
+    (EXPERIENCE_ADVANCED, ("продвин", "advanced", "опытн", "профи", "высок")),
+    (EXPERIENCE_INTERMEDIATE, ("средн", "intermediate", "любител")),
+    (EXPERIENCE_BEGINNER, ("начина", "новичок", "нович", "beginner", "нет опыта", "низк")),
+)
+_NO_INJURY_ANSWERS = {"", "нет", "не", "нету", "no", "none", "nope", "-", "—", "нет травм", "травм нет", "никаких"}
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+_POUNDS = re.compile(r"\b(lb|lbs|фунт)", re.IGNORECASE)
+POUND_IN_KG = 0.4536
+# "5'10", "5 ft 10 in", "6 футов", "5 футов 10 дюймов"
+_INCH_UNIT = r"(?:\"|''|\u2033|in\b|inch\w*|дюйм\w*)"
+_FEET = re.compile(
+    rf"(\d+(?:[.,]\d+)?)\s*(?:'|\u2032|ft\b|feet|foot|фут\w*)\s*(?:(\d+(?:[.,]\d+)?)\s*{_INCH_UNIT}?)?", re.IGNORECASE
+)
+_INCHES = re.compile(rf"(\d+(?:[.,]\d+)?)\s*{_INCH_UNIT}", re.IGNORECASE)
+FOOT_IN_CM = 30.48
+INCH_IN_CM = 2.54
+HEIGHT_RANGE_CM = (100, 250)
+
+
+def normalize_text(value: Any) -> str:
+    """Lowercases and collapses whitespace and trailing punctuation of an answer."""
+    return " ".join(str(value or "").lower().split()).strip(" .!")
+
+
+def parse_number(value: Any) -> Optional[float]:
+    """Returns the first number in an answer such as "100 кг" or "1,75", or None."""
+    match = _NUMBER.search(str(value or ""))
+    return float(match.group().replace(",", ".")) if match else None
+
+
+def parse_weight_kg(value: Any) -> Optional[float]:
+    """Parses a body weight or lift answer in kilograms, converting pounds when mentioned."""
+    number = parse_number(value)
+    if number is None:
+        return None
+    return number * POUND_IN_KG if _POUNDS.search(str(value)) else number
+
+
+def _to_float(number: Optional[str]) -> float:
+    return float(number.replace(",", ".")) if number else 0.0
+
+
+def parse_height_cm(value: Any) -> Optional[float]:
+    """Parses a height answer in centimetres, accepting metres ("1.8") and feet/inches ("5'10").
+
+    Returns None for a height outside of `HEIGHT_RANGE_CM`, so the answer is used as typed.
+    """
+    text = str(value or "")
+    feet, inches = _FEET.search(text), _INCHES.search(text)
+    if feet:
+        height = _to_float(feet.group(1)) * FOOT_IN_CM + _to_float(feet.group(2)) * INCH_IN_CM
+    elif inches:
+        height = _to_float(inches.group(1)) * INCH_IN_CM
+    else:
+        number = parse_number(text)
+        if number is None:
+            return None
+        height = number * 100 if number < 3 else number
+    low, high = HEIGHT_RANGE_CM
+    return height if low <= height <= high else None
+
+
+def experience_level(value: Any) -> Optional[str]:
+    """Maps an experience answer to beginner/intermediate/advanced, or None if unclear."""
+    text = normalize_text(value)
+    for level, keywords in _EXPERIENCE_KEYWORDS:
+        if any(keyword in text for keyword in keywords):
+            return level
+    return None
+
+
+def has_injuries(value: Any) -> bool:
+    """True unless the injuries answer is an explicit "no"."""
+    return normalize_text(value) not in _NO_INJURY_ANSWERS
+
+
+def bench_max_kg(user_data: Dict[str, Any]) -> Optional[float]:
+    """Returns the bench press 1RM (or best set) from the profile, in kilograms."""
+    return parse_weight_kg(user_data.get("bench"))
@@ -0,0 +1,163 @@
+"""Client-side rate limiting of OpenAI requests.
+
+Every call first reserves one request and its estimated tokens (prompt estimate plus
+`max_tokens`, which is also what OpenAI counts against the TPM limit) from two token
+buckets refilling at the per-minute limits. Callers wait in a FIFO queue until both
+buckets can cover them. The buckets are kept in line with OpenAI's own accounting
+through the `x-ratelimit-*` response headers, and a 429 pauses all callers for its
+`retry-after`. Requests name their model in the `MODEL_HEADER` header, so a response is
+matched to its limiter without parsing the prompt again.
+"""
+
+import asyncio
+import re
+import time
+from functools import cache
+from typing import Awaitable, Callable, Dict, Mapping, Optional
+
+import httpx
+from loguru import logger
+
+from ai_gym_bro.config import get_settings
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+_MIN_DELAY = 1e-6  # Shorter waits are float noise from the refill arithmetic
+MODEL_HEADER = "X-Rate-Limit-Model"
+
+
+def parse_reset_seconds(value: Optional[str]) -> Optional[float]:
+    """Parses OpenAI reset durations such as "1s", "6m0s" or "20ms" into seconds."""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _UNIT_SECONDS[unit] for number, unit in parts)
+
+
+def _header_float(headers: Mapping[str, str], name: str) -> Optional[float]:
+    try:
+        return float(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Bucket holding up to `capacity` units that refills completely once per `period` seconds."""
+
+    def __init__(self, capacity: float, clock: Callable[[], float] = time.monotonic, period: float = 60.0) -> None:
+        self.capacity = capacity
+        self.level = capacity
+        self.period = period
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.capacity / self.period)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (requests above capacity wait for a full bucket)."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(missing, 0.0) * self.period / self.capacity
+
+    def consume(self, amount: float) -> None:
+        """Takes `amount` units; the level may go negative, delaying the following callers."""
+        self._refill()
+        self.level -= amount
+
+    def sync(self, capacity: float, remaining: Optional[float]) -> None:
+        """Adopts the server-side limit, and its remaining allowance if lower than ours."""
+        self._refill()
+        self.capacity = capacity
+        if remaining is not None:
+            self.level = min(self.level, remaining)
+        self.level = min(self.level, capacity)
+
+
+class OpenAIRateLimiter:
+    """Requests-per-minute and tokens-per-minute limiter for one model.
+
+    `headroom` keeps throughput just under the limits: only that share of each limit is
+    used, so small estimate errors do not turn into 429s.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        headroom: float = 0.95,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ) -> None:
+        self.headroom = headroom
+        self.requests = TokenBucket(requests_per_minute * headroom, clock)
+        self.tokens = TokenBucket(tokens_per_minute * headroom, clock)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = asyncio.Lock()  # Waiters acquire it in arrival order, which keeps the queue fair
+        self._paused_until = 0.0
+
+    async def acquire(self, tokens: float) -> float:
+        """Waits until one request of `tokens` tokens fits the limits, reserves it, and returns the wait."""
+        started = self._clock()
+        async with self._lock:
+            while True:
+                delay = max(
+                    self.requests.wait_time(1),
+                    self.tokens.wait_time(tokens),
+                    self._paused_until - self._clock(),
+                )
+                if delay <= _MIN_DELAY:
+                    break
+                await self._sleep(delay)
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+        return self._clock() - started
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        """Adjusts both buckets to the `x-ratelimit-*` headers of an OpenAI response."""
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            limit = _header_float(headers, f"x-ratelimit-limit-{kind}")
+            if not limit:
+                continue
+            remaining = _header_float(headers, f"x-ratelimit-remaining-{kind}")
+            margin = limit * (1 - self.headroom)
+            bucket.sync(limit * self.headroom, None if remaining is None else remaining - margin)
+
+    def pause(self, seconds: float) -> None:
+        """Holds back every caller for `seconds` (after a 429)."""
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+
+@cache
+def get_rate_limiter(model: str) -> OpenAIRateLimiter:
+    """Returns the process-wide limiter of a model (OpenAI limits are per model)."""
+    settings = get_settings()
+    return OpenAIRateLimiter(
+        settings.openai_requests_per_minute, settings.openai_tokens_per_minute, settings.openai_rate_limit_headroom
+    )
+
+
+def model_headers(model: str) -> Dict[str, str]:
+    """Request headers naming the limiter of a request's model, for `record_openai_response`."""
+    return {MODEL_HEADER: model}
+
+
+async def record_openai_response(response: httpx.Response) -> None:
+    """httpx response hook feeding the rate limit headers of every OpenAI response to its limiter."""
+    model = response.request.headers.get(MODEL_HEADER)
+    if not model:
+        return
+    limiter = get_rate_limiter(model)
+    limiter.update_from_headers(response.headers)
+    if response.status_code == 429:
+        resets = [
+            parse_reset_seconds(response.headers.get(f"x-ratelimit-reset-{kind}")) for kind in ("requests", "tokens")
+        ]
+        retry_after = _header_float(response.headers, "retry-after") or max(filter(None, resets), default=1.0)
+        logger.warning(f"OpenAI rate limit hit for {model}, pausing requests for {retry_after:.1f}s")
+        limiter.pause(retry_after)
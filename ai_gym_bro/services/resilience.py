@@ -0,0 +1,245 @@
+"""Retries, hedged requests and a circuit breaker around OpenAI calls."""
+
+import asyncio
+import random
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Awaitable, Callable, Deque, Optional, TypeVar
+
+from loguru import logger
+from openai import APIConnectionError, APIStatusError, APITimeoutError, OpenAIError
+
+from ai_gym_bro.config import get_settings
+from ai_gym_bro.metrics import (
+    OPENAI_CIRCUIT_REJECTIONS,
+    OPENAI_CIRCUIT_STATE,
+    OPENAI_HEDGES,
+    OPENAI_LATENCY,
+    OPENAI_REQUESTS,
+    OPENAI_RETRIES,
+)
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_HALF_OPEN = "half_open"
+CIRCUIT_OPEN = "open"
+_CIRCUIT_STATE_VALUES = {CIRCUIT_CLOSED: 0, CIRCUIT_HALF_OPEN: 1, CIRCUIT_OPEN: 2}
+
+
+class CircuitOpenError(OpenAIError):
+    """Raised instead of calling OpenAI while the circuit is open."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """True for errors a new attempt may fix: timeouts, connection errors, 429 and 5xx."""
+    if isinstance(error, APITimeoutError | APIConnectionError):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code in RETRYABLE_STATUS_CODES
+
+
+def backoff_delay(attempt: int, base: float, cap: float, rng: Callable[[], float] = random.random) -> float:
+    """Full-jitter exponential backoff: a random delay up to `base * 2**attempt`, capped."""
+    return min(cap, base * 2**attempt) * rng()
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and fails fast for `reset_timeout` seconds.
+
+    After the timeout one trial call is let through (half-open): success closes the
+    circuit, failure opens it again. A call that ends without a verdict on the upstream
+    (a client error, a cancellation) only frees the trial slot with `release`.
+    """
+
+    def __init__(
+        self, failure_threshold: int, reset_timeout: float, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.warning(f"OpenAI circuit breaker: {self.state} -> {state}")
+        self.state = state
+        OPENAI_CIRCUIT_STATE.set(_CIRCUIT_STATE_VALUES[state])
+
+    def allow(self) -> bool:
+        """Returns whether a call may go through now."""
+        if self.state == CIRCUIT_OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._set_state(CIRCUIT_HALF_OPEN)
+        if self.state == CIRCUIT_HALF_OPEN:
+            if self._trial_running:
+                return False
+            self._trial_running = True
+        return self.state != CIRCUIT_OPEN
+
+    def release(self) -> None:
+        """Ends a call that says nothing about upstream health, leaving the state as it is."""
+        self._trial_running = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._trial_running = False
+        self._set_state(CIRCUIT_CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_running = False
+        if self.state == CIRCUIT_HALF_OPEN or self.failures >= self.failure_threshold:
+            self._opened_at = self._clock()
+            self._set_state(CIRCUIT_OPEN)
+
+
+class LatencyTracker:
+    """Rolling window of recent call latencies."""
+
+    def __init__(self, window: int = 200) -> None:
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Returns the q-quantile of the window, or None while it is empty."""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class ResilientCaller:
+    """Runs OpenAI calls with retries, optional hedging and a shared circuit breaker.
+
+    Hedging: once `hedge_min_samples` latencies are known, a call that has not finished
+    within the p95 latency gets a second, identical request; the first to succeed wins
+    and the other is cancelled.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        max_attempts: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        breaker: Optional[CircuitBreaker] = None,
+        hedge_enabled: bool = False,
+        hedge_min_samples: int = 20,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ) -> None:
+        self.max_attempts = max(max_attempts, 1)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker(failure_threshold=5, reset_timeout=30)
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies = LatencyTracker()
+        self._sleep = sleep
+
+    async def call(
+        self,
+        operation: str,
+        request: Callable[[], Awaitable[T]],
+        hedge: bool = True,
+        retryable: Callable[[BaseException], bool] = is_retryable,
+    ) -> T:
+        """Runs `request` until it succeeds, a non-retryable error occurs or attempts run out.
+
+        `operation` labels the metrics; `hedge=False` disables hedging for this call
+        (e.g. for streams, whose output is already on its way to the user).
+        """
+        started = time.monotonic()
+        for attempt in range(self.max_attempts):
+            if not self.breaker.allow():
+                OPENAI_CIRCUIT_REJECTIONS.labels(operation).inc()
+                OPENAI_REQUESTS.labels(operation, "rejected").inc()
+                raise CircuitOpenError("OpenAI circuit breaker is open, failing fast")
+            attempt_started = time.monotonic()
+            try:
+                if hedge and self.hedge_enabled:
+                    result = await self._hedged(operation, request)
+                else:
+                    result = await request()
+            except asyncio.CancelledError:
+                # Speculation losers, fan-out siblings, /cancel: a cancelled trial must not keep the circuit half-open
+                self.breaker.release()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    # Client errors (bad request, auth) say nothing about upstream health
+                    self.breaker.release()
+                    OPENAI_REQUESTS.labels(operation, "error").inc()
+                    raise
+                self.breaker.record_failure()
+                if not retryable(e) or attempt == self.max_attempts - 1:
+                    OPENAI_REQUESTS.labels(operation, "error").inc()
+                    raise
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                OPENAI_RETRIES.labels(operation, type(e).__name__).inc()
+                logger.warning(
+                    f"OpenAI {operation} attempt {attempt + 1} failed ({type(e).__name__}), retrying in {delay:.1f}s"
+                )
+                await self._sleep(delay)
+                continue
+            self.breaker.record_success()
+            self.latencies.record(time.monotonic() - attempt_started)
+            OPENAI_REQUESTS.labels(operation, "success").inc()
+            OPENAI_LATENCY.labels(operation).observe(time.monotonic() - started)
+            return result
+        raise AssertionError("unreachable")
+
+    async def _hedged(self, operation: str, request: Callable[[], Awaitable[T]]) -> T:
+        """Runs `request`, adding a second one if the first is slower than the p95 latency."""
+        threshold = self.latencies.quantile(0.95) if len(self.latencies) >= self.hedge_min_samples else None
+        primary = asyncio.ensure_future(request())
+        tasks = [primary]
+        try:
+            if threshold is None:
+                return await primary
+            done, _ = await asyncio.wait({primary}, timeout=threshold)
+            if done:
+                return primary.result()
+
+            hedge = asyncio.ensure_future(request())
+            tasks.append(hedge)
+            names = {primary: "primary", hedge: "hedge"}
+            pending = {primary, hedge}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        OPENAI_HEDGES.labels(operation, names[task]).inc()
+                        return task.result()
+                    error = error or task.exception()
+            OPENAI_HEDGES.labels(operation, "none").inc()
+            raise error
+        finally:
+            # asyncio.wait does not cancel what it waits on: a cancelled caller must not leave requests running
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+
+@lru_cache(maxsize=1)
+def get_resilient_caller() -> ResilientCaller:
+    """Returns the process-wide caller (one breaker for the OpenAI upstream)."""
+    settings = get_settings()
+    breaker = CircuitBreaker(settings.openai_circuit_failure_threshold, settings.openai_circuit_reset_timeout)
+    return ResilientCaller(
+        max_attempts=settings.openai_max_attempts,
+        backoff_base=settings.openai_backoff_base,
+        backoff_max=settings.openai_backoff_max,
+        breaker=breaker,
+        hedge_enabled=settings.openai_hedge_enabled,
+        hedge_min_samples=settings.openai_hedge_min_samples,
+    )
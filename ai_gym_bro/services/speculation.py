@@ -0,0 +1,159 @@
+"""Speculative plan generation while the user picks a goal.
+
+Once the injuries are stored the profile is complete except for the goal, which has
+only two options. With speculation on, the plans for both goals start right away; when
+the goal is picked the other generation is cancelled and the chosen one is handed over,
+finished or still in flight, so the user's time on the keyboard is not spent idle.
+
+Each speculation costs a second, discarded generation, so it only starts within a budget:
+at most `max_in_flight` speculative generations at once, and none while plan jobs are
+waiting in the queue.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+from ai_gym_bro.config import get_settings
+from ai_gym_bro.metrics import SPECULATIVE_PLANS
+from ai_gym_bro.services.plan_queue import get_plan_queue
+
+DeltaCallback = Callable[[str], Awaitable[None]]
+# Called with a goal and a delta callback, returns what `openai_service.generate_plan` returns
+GeneratePlan = Callable[[str, DeltaCallback], Awaitable[Tuple[Optional[str], List[Dict[str, str]]]]]
+
+
+class DeltaRelay:
+    """Keeps the deltas of a speculative plan and forwards them to a target attached later."""
+
+    def __init__(self) -> None:
+        self.parts: List[str] = []
+        self._target: Optional[DeltaCallback] = None
+
+    async def __call__(self, delta: str) -> None:
+        self.parts.append(delta)
+        if self._target is not None:
+            await self._target(delta)
+
+    async def attach(self, target: DeltaCallback) -> None:
+        """Replays the deltas received so far to `target`, then forwards the next ones."""
+        index = 0
+        while index < len(self.parts):  # More deltas may arrive while replaying
+            pending, index = "".join(self.parts[index:]), len(self.parts)
+            await target(pending)
+        self._target = target
+
+
+@dataclass(eq=False)
+class SpeculativePlan:
+    """One goal's plan generation, started before the goal was picked."""
+
+    task: asyncio.Task
+    relay: DeltaRelay
+
+    @property
+    def failed(self) -> bool:
+        """True once the generation ended without a plan: cancelled, raised, or returned no plan."""
+        task = self.task
+        return task.done() and (task.cancelled() or task.exception() is not None or not task.result()[0])
+
+    async def result(self, on_delta: Optional[DeltaCallback] = None) -> Tuple[Optional[str], List[Dict[str, str]]]:
+        """Waits for the plan, streaming its deltas (past and future) to `on_delta` if still in flight."""
+        if on_delta is not None and not self.task.done():
+            await self.relay.attach(on_delta)
+        return await self.task
+
+
+@dataclass(eq=False)
+class _Speculation:
+    profile: Dict[str, Any]
+    plans: Dict[str, SpeculativePlan]
+    started_at: float = field(default_factory=time.monotonic)
+
+
+class SpeculativePlans:
+    """Speculative plan generations by user, within a budget of concurrent generations."""
+
+    def __init__(self, max_in_flight: int, ttl: float) -> None:
+        self.max_in_flight = max_in_flight
+        self.ttl = ttl
+        self._by_user: Dict[int, _Speculation] = {}
+
+    @property
+    def in_flight(self) -> int:
+        """Number of speculative generations still running."""
+        return sum(
+            not plan.task.done() for speculation in self._by_user.values() for plan in speculation.plans.values()
+        )
+
+    def start(self, user_id: int, profile: Dict[str, Any], goals: Sequence[str], generate: GeneratePlan) -> bool:
+        """Starts generating the plan of every goal for the profile; returns False if over budget."""
+        self.cancel(user_id)
+        self._expire()
+        if self.in_flight + len(goals) > self.max_in_flight or get_plan_queue().depth > 0:
+            SPECULATIVE_PLANS.labels("skipped").inc()
+            logger.debug(f"Speculative plans for user {user_id} skipped: {self.in_flight} in flight")
+            return False
+        plans = {}
+        for goal in goals:
+            relay = DeltaRelay()
+            plans[goal] = SpeculativePlan(asyncio.create_task(generate(goal, relay), name=f"speculative-{goal}"), relay)
+        self._by_user[user_id] = _Speculation(dict(profile), plans)
+        SPECULATIVE_PLANS.labels("started").inc(len(goals))
+        logger.info(f"Speculative plans started for user {user_id} ({len(goals)} goals)")
+        return True
+
+    def take(self, user_id: int, profile: Dict[str, Any], goal: str) -> Optional[SpeculativePlan]:
+        """Hands over the plan of the picked goal and cancels the others.
+
+        Returns None if nothing was speculated for this exact profile and goal, or if that
+        generation failed (`generate_plan` reports errors as a None plan), so the plan is
+        generated normally. A generation still in flight may fail later: callers fall back
+        the same way when its result has no plan.
+        """
+        speculation = self._by_user.pop(user_id, None)
+        if speculation is None:
+            return None
+        winner = speculation.plans.pop(goal, None) if speculation.profile == profile else None
+        if winner is not None and winner.failed:
+            speculation.plans[goal] = winner
+            winner = None
+        self._discard(speculation)
+        if winner is not None:
+            SPECULATIVE_PLANS.labels("used").inc()
+        return winner
+
+    def cancel(self, user_id: int) -> None:
+        """Cancels the user's speculative generations, if any."""
+        speculation = self._by_user.pop(user_id, None)
+        if speculation is not None:
+            self._discard(speculation)
+
+    def cancel_all(self) -> None:
+        """Cancels every speculative generation, on shutdown."""
+        for user_id in list(self._by_user):
+            self.cancel(user_id)
+
+    def _expire(self) -> None:
+        """Drops the speculations of users who did not pick a goal within the TTL."""
+        now = time.monotonic()
+        for user_id, speculation in list(self._by_user.items()):
+            if now - speculation.started_at > self.ttl:
+                self.cancel(user_id)
+
+    @staticmethod
+    def _discard(speculation: _Speculation) -> None:
+        for plan in speculation.plans.values():
+            plan.task.cancel()
+            SPECULATIVE_PLANS.labels("wasted").inc()
+
+
+@lru_cache(maxsize=1)
+def get_speculative_plans() -> SpeculativePlans:
+    """Returns the process-wide speculative plans configured from settings."""
+    settings = get_settings()
+    return SpeculativePlans(settings.speculation_max_in_flight, settings.speculation_ttl)
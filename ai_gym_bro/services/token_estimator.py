@@ -0,0 +1,18 @@
+"""Cheap token count estimates for chat messages, without a tokenizer dependency."""
+
+from typing import Dict, Iterable
+
+# Mixed Russian/English Markdown averages roughly 3 characters per token for GPT-4 class models
+CHARS_PER_TOKEN = 3.0
+# Role, separators and priming the API adds around every message
+TOKENS_PER_MESSAGE = 4
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Estimates the number of tokens in a piece of text (rounded up)."""
+    return int(len(text) / CHARS_PER_TOKEN) + 1 if text else 0
+
+
+def estimate_message_tokens(messages: Iterable[Dict[str, str]]) -> int:
+    """Estimates the prompt tokens of a list of chat messages."""
+    return sum(estimate_text_tokens(message.get("content") or "") + TOKENS_PER_MESSAGE for message in messages)
@@ -0,0 +1,257 @@
+"""Sampled tracing of OpenAI calls to Langfuse, exported in batches off the request path.
+
+Calls are traced by `trace_generation` rather than by the `langfuse.openai` client wrapper,
+which traces every request. Whether a call is traced is decided up front from the sample
+rate of its operation, so unsampled calls (and every call with tracing off) cost a single
+lookup. A sampled call adds its events to a bounded in-memory buffer; a background task
+posts them in batches to the Langfuse ingestion API. When the buffer is full new events are
+dropped (and counted) instead of slowing down requests.
+"""
+
+import asyncio
+import os
+import random
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from functools import lru_cache
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+import httpx
+from loguru import logger
+
+from ai_gym_bro.config import get_settings
+from ai_gym_bro.metrics import TRACING_EVENTS
+
+DEFAULT_LANGFUSE_HOST = "https://cloud.langfuse.com"
+INGESTION_PATH = "/api/public/ingestion"
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parses per-operation sample rates such as `"refine_plan=0.1, summarize_history=0"`."""
+    rates: Dict[str, float] = {}
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        if not name.strip():
+            continue
+        try:
+            rates[name.strip()] = float(value)
+        except ValueError:
+            logger.warning(f"Ignoring invalid tracing sample rate: {item.strip()!r}")
+    return rates
+
+
+def _timestamp(moment: datetime) -> str:
+    return moment.isoformat().replace("+00:00", "Z")
+
+
+def _now() -> datetime:
+    return datetime.now(UTC)
+
+
+@dataclass
+class GenerationTrace:
+    """One traced completion; filled in by the caller while the request runs."""
+
+    operation: str
+    model: str
+    messages: List[Dict[str, str]]
+    model_parameters: Dict[str, Any] = field(default_factory=dict)
+    start_time: datetime = field(default_factory=_now)
+    end_time: Optional[datetime] = None
+    completion_start_time: Optional[datetime] = None
+    output: Optional[str] = None
+    usage: Optional[Any] = None  # `usage` of the OpenAI response
+    error: Optional[BaseException] = None
+
+    def to_events(self) -> List[Dict[str, Any]]:
+        """Builds the trace and generation events of the Langfuse ingestion API."""
+        trace_id = str(uuid.uuid4())
+        end_time = self.end_time or _now()
+        generation: Dict[str, Any] = {
+            "id": str(uuid.uuid4()),
+            "traceId": trace_id,
+            "name": self.operation,
+            "startTime": _timestamp(self.start_time),
+            "endTime": _timestamp(end_time),
+            "model": self.model,
+            "modelParameters": self.model_parameters,
+            "input": self.messages,
+            "output": self.output,
+            "level": "ERROR" if self.error else "DEFAULT",
+        }
+        if self.completion_start_time:
+            generation["completionStartTime"] = _timestamp(self.completion_start_time)
+        if self.error:
+            generation["statusMessage"] = f"{type(self.error).__name__}: {self.error}"
+        if self.usage is not None:
+            generation["usage"] = {
+                "input": self.usage.prompt_tokens,
+                "output": self.usage.completion_tokens,
+                "total": self.usage.total_tokens,
+                "unit": "TOKENS",
+            }
+        trace = {"id": trace_id, "name": self.operation, "timestamp": _timestamp(self.start_time)}
+        return [
+            {"id": str(uuid.uuid4()), "type": event_type, "timestamp": _timestamp(end_time), "body": body}
+            for event_type, body in (("trace-create", trace), ("generation-create", generation))
+        ]
+
+
+class TraceExporter:
+    """Bounded buffer of ingestion events, posted in batches by a background task."""
+
+    def __init__(  # noqa: PLR0913
+        self,
+        host: str,
+        public_key: str,
+        secret_key: str,
+        batch_size: int = 50,
+        flush_interval: float = 2.0,
+        buffer_size: int = 1000,
+        http_client: Optional[httpx.AsyncClient] = None,
+    ) -> None:
+        self.url = host.rstrip("/") + INGESTION_PATH
+        self._auth = (public_key, secret_key)
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._client = http_client
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered events not yet exported."""
+        return len(self._buffer)
+
+    def submit(self, events: List[Dict[str, Any]]) -> bool:
+        """Buffers the events of one trace; returns False if they were dropped because the buffer is full."""
+        if len(self._buffer) + len(events) > self.buffer_size:
+            TRACING_EVENTS.labels("dropped").inc(len(events))
+            return False
+        self._buffer.extend(events)
+        if self._wake is not None and len(self._buffer) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="trace-exporter")
+
+    async def stop(self) -> None:
+        """Stops the background task and exports what is left in the buffer."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            await self.flush()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def flush(self) -> None:
+        """Exports all buffered events, one batch at a time."""
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            await self._send(batch)
+
+    async def _send(self, batch: List[Dict[str, Any]]) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=10)
+        try:
+            response = await self._client.post(self.url, json={"batch": batch}, auth=self._auth)
+        except httpx.HTTPError as e:
+            logger.warning(f"Trace export failed ({type(e).__name__}), dropping {len(batch)} events")
+            TRACING_EVENTS.labels("dropped").inc(len(batch))
+            return
+        if response.status_code >= 400:
+            logger.warning(f"Trace export rejected with HTTP {response.status_code}, dropping {len(batch)} events")
+            TRACING_EVENTS.labels("dropped").inc(len(batch))
+            return
+        TRACING_EVENTS.labels("exported").inc(len(batch))
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+
+class Tracer:
+    """Samples operations and hands the traces of sampled calls to the exporter."""
+
+    def __init__(
+        self,
+        exporter: TraceExporter,
+        sample_rate: float = 1.0,
+        sample_rates: Optional[Dict[str, float]] = None,
+        rng: Callable[[], float] = random.random,
+    ) -> None:
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.sample_rates = sample_rates or {}
+        self._rng = rng
+
+    def sampled(self, operation: str) -> bool:
+        rate = self.sample_rates.get(operation, self.sample_rate)
+        return rate >= 1 or (rate > 0 and self._rng() < rate)
+
+    def record(self, trace: GenerationTrace) -> None:
+        self.exporter.submit(trace.to_events())
+
+
+@lru_cache(maxsize=1)
+def get_tracer() -> Optional[Tracer]:
+    """Returns the process-wide tracer, or None when tracing is off.
+
+    In "auto" mode tracing is on when the Langfuse keys (LANGFUSE_PUBLIC_KEY,
+    LANGFUSE_SECRET_KEY, optionally LANGFUSE_HOST) are set.
+    """
+    settings = get_settings()
+    public_key, secret_key = os.getenv("LANGFUSE_PUBLIC_KEY"), os.getenv("LANGFUSE_SECRET_KEY")
+    if settings.tracing_mode == "off" or (settings.tracing_mode == "auto" and not (public_key and secret_key)):
+        return None
+    if not (public_key and secret_key):
+        logger.error("Tracing is on but LANGFUSE_PUBLIC_KEY/LANGFUSE_SECRET_KEY are not set, disabling it.")
+        return None
+    exporter = TraceExporter(
+        os.getenv("LANGFUSE_HOST", DEFAULT_LANGFUSE_HOST),
+        public_key,
+        secret_key,
+        batch_size=settings.tracing_batch_size,
+        flush_interval=settings.tracing_flush_interval,
+        buffer_size=settings.tracing_buffer_size,
+    )
+    return Tracer(exporter, settings.tracing_sample_rate, parse_sample_rates(settings.tracing_sample_rates))
+
+
+@contextmanager
+def trace_generation(
+    operation: str, model: str, messages: List[Dict[str, str]], **model_parameters: Any
+) -> Iterator[Optional[GenerationTrace]]:
+    """Traces one completion if tracing is on and the operation is sampled.
+
+    Yields None otherwise; the caller fills in `output`, `usage` and
+    `completion_start_time` of the yielded trace. A raised error is recorded on the trace.
+    """
+    tracer = get_tracer()
+    if tracer is None or not tracer.sampled(operation):
+        yield None
+        return
+    trace = GenerationTrace(operation, model, messages, model_parameters)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.error = e
+        raise
+    finally:
+        trace.end_time = _now()
+        tracer.record(trace)
@@ -0,0 +1,66 @@
+"""Imports a PicklePersistence file into the SQLite persistence database.
+
+Usage:
+    python -m ai_gym_bro.storage.migrate_pickle [PICKLE_PATH] [SQLITE_PATH]
+"""
+
+import pickle
+import sys
+from pathlib import Path
+from typing import Any, Dict
+
+from loguru import logger
+
+from ai_gym_bro.storage.sqlite_persistence import SQLitePersistence
+
+PERSISTENCE_DIR = Path(__file__).resolve().parent.parent / "persistence"
+DEFAULT_PICKLE_PATH = PERSISTENCE_DIR / "bot_persistence.pkl"
+DEFAULT_SQLITE_PATH = PERSISTENCE_DIR / "bot_persistence.sqlite3"
+
+
+class _PersistenceUnpickler(pickle.Unpickler):
+    """Unpickler that tolerates the bot placeholders PicklePersistence writes for Bot instances."""
+
+    def persistent_load(self, pid: Any) -> None:
+        return None
+
+
+def load_pickle_persistence(pickle_path: Path) -> Dict[str, Any]:
+    """Loads a single-file PicklePersistence dump."""
+    with pickle_path.open("rb") as file:
+        return _PersistenceUnpickler(file).load()
+
+
+def migrate_pickle(pickle_path: Path, sqlite_path: Path) -> int:
+    """Copies users, chats, bot data and conversations from the pickle into SQLite.
+
+    Returns the number of migrated users.
+    """
+    data = load_pickle_persistence(pickle_path)
+    user_data = data.get("user_data") or {}
+    persistence = SQLitePersistence(sqlite_path)
+    try:
+        persistence.import_data(
+            user_data=user_data,
+            chat_data=data.get("chat_data") or {},
+            bot_data=data.get("bot_data"),
+            conversations=data.get("conversations"),
+        )
+    finally:
+        persistence.close()
+    logger.info(f"Migrated {len(user_data)} users from {pickle_path} to {sqlite_path}")
+    return len(user_data)
+
+
+def main() -> None:
+    """Command line entry point."""
+    pickle_path = Path(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PICKLE_PATH
+    sqlite_path = Path(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_SQLITE_PATH
+    if not pickle_path.exists():
+        logger.error(f"Pickle file not found: {pickle_path}")
+        sys.exit(1)
+    migrate_pickle(pickle_path, sqlite_path)
+
+
+if __name__ == "__main__":
+    main()
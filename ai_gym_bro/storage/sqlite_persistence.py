@@ -0,0 +1,249 @@
+"""Incremental SQLite-backed persistence for the Telegram application."""
+
+import asyncio
+import hashlib
+import json
+import pickle
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from loguru import logger
+from telegram.ext import BasePersistence, PersistenceInput
+
+ConversationKey = Tuple[int | str, ...]
+ConversationDict = Dict[ConversationKey, object]
+CDCData = Tuple[List[Tuple[str, float, Dict[str, Any]]], Dict[str, str]]  # Callback data cache contents
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS chat_data (chat_id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS singletons (name TEXT PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    conversation_key TEXT NOT NULL,
+    state BLOB NOT NULL,
+    PRIMARY KEY (name, conversation_key)
+);
+"""
+
+
+def _dumps(data: object) -> bytes:
+    return pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _digest(blob: bytes) -> bytes:
+    return hashlib.blake2b(blob, digest_size=16).digest()
+
+
+class SQLitePersistence(BasePersistence[Dict[Any, Any], Dict[Any, Any], Dict[Any, Any]]):
+    """Stores each user, chat and conversation key in its own SQLite row.
+
+    Unlike `PicklePersistence`, which re-pickles every user on each flush, only entries
+    whose pickled value changed since the last write are stored, so I/O depends on the
+    number of changed users, not the total. User and chat data are loaded lazily: the
+    application starts with empty dicts and `refresh_user_data`/`refresh_chat_data`
+    fill them from the database the first time a handler touches that user or chat.
+    The database runs in WAL mode; writes happen in a worker thread, serialized by a lock.
+    """
+
+    def __init__(
+        self,
+        filepath: str | Path,
+        store_data: Optional[PersistenceInput] = None,
+        update_interval: float = 60,
+    ) -> None:
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.filepath = Path(filepath)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.filepath, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+        # Digests of what is on disk, to skip writes of unchanged entries
+        self._user_digests: Dict[int, bytes] = {}
+        self._chat_digests: Dict[int, bytes] = {}
+        self._singleton_digests: Dict[str, bytes] = {}
+        self._loaded_users: Set[int] = set()
+        self._loaded_chats: Set[int] = set()
+        self._conversations: Dict[str, Dict[ConversationKey, object]] = {}
+
+    # --- Low-level helpers --- #
+
+    def _execute(self, sql: str, parameters: Iterable[Any] = ()) -> list:
+        with self._lock:
+            return self._connection.execute(sql, tuple(parameters)).fetchall()
+
+    async def _run(self, sql: str, parameters: Iterable[Any] = ()) -> list:
+        """Runs a statement in a worker thread so disk I/O never blocks the event loop."""
+        return await asyncio.to_thread(self._execute, sql, parameters)
+
+    async def _load_row(self, table: str, id_column: str, row_id: int) -> Optional[bytes]:
+        rows = await self._run(f"SELECT data FROM {table} WHERE {id_column} = ?", (row_id,))
+        return rows[0][0] if rows else None
+
+    async def _load_singleton(self, name: str) -> Optional[Any]:
+        rows = await self._run("SELECT data FROM singletons WHERE name = ?", (name,))
+        if not rows:
+            return None
+        self._singleton_digests[name] = _digest(rows[0][0])
+        return pickle.loads(rows[0][0])
+
+    async def _store_singleton(self, name: str, data: object) -> None:
+        blob = _dumps(data)
+        digest = _digest(blob)
+        if self._singleton_digests.get(name) == digest:
+            return
+        await self._run("INSERT OR REPLACE INTO singletons (name, data) VALUES (?, ?)", (name, blob))
+        self._singleton_digests[name] = digest
+
+    async def _store_entry(
+        self, table: str, id_column: str, row_id: int, data: object, digests: Dict[int, bytes]
+    ) -> None:
+        blob = _dumps(data)
+        digest = _digest(blob)
+        if digests.get(row_id) == digest:
+            return  # Unchanged since the last write
+        await self._run(f"INSERT OR REPLACE INTO {table} ({id_column}, data) VALUES (?, ?)", (row_id, blob))
+        digests[row_id] = digest
+
+    # --- Lazy loading --- #
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        """Returns an empty dict; users are loaded on first access by `refresh_user_data`."""
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        """Returns an empty dict; chats are loaded on first access by `refresh_chat_data`."""
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        """Fills the user's in-memory data from the database the first time the user is seen."""
+        if user_id in self._loaded_users:
+            return
+        blob = await self._load_row("user_data", "user_id", user_id)
+        if blob is not None and user_id not in self._loaded_users:
+            self._user_digests[user_id] = _digest(blob)
+            user_data.update(pickle.loads(blob))
+        self._loaded_users.add(user_id)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        """Fills the chat's in-memory data from the database the first time the chat is seen."""
+        if chat_id in self._loaded_chats:
+            return
+        blob = await self._load_row("chat_data", "chat_id", chat_id)
+        if blob is not None and chat_id not in self._loaded_chats:
+            self._chat_digests[chat_id] = _digest(blob)
+            chat_data.update(pickle.loads(blob))
+        self._loaded_chats.add(chat_id)
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        """Does nothing, bot data is loaded once at startup."""
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        """Returns the stored bot data or an empty dict."""
+        return await self._load_singleton("bot_data") or {}
+
+    async def get_callback_data(self) -> Optional[CDCData]:
+        """Returns the stored callback data cache or None."""
+        return await self._load_singleton("callback_data")
+
+    async def get_conversations(self, name: str) -> ConversationDict:
+        """Returns all stored states of a conversation handler (states are tiny, so this is eager)."""
+        rows = await self._run("SELECT conversation_key, state FROM conversations WHERE name = ?", (name,))
+        states = {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+        self._conversations[name] = dict(states)
+        return states
+
+    # --- Incremental writes --- #
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        """Writes the user's row if its content changed."""
+        self._loaded_users.add(user_id)
+        await self._store_entry("user_data", "user_id", user_id, data, self._user_digests)
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        """Writes the chat's row if its content changed."""
+        self._loaded_chats.add(chat_id)
+        await self._store_entry("chat_data", "chat_id", chat_id, data, self._chat_digests)
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        """Writes the bot data if it changed."""
+        await self._store_singleton("bot_data", data)
+
+    async def update_callback_data(self, data: CDCData) -> None:
+        """Writes the callback data cache if it changed."""
+        await self._store_singleton("callback_data", data)
+
+    async def update_conversation(self, name: str, key: ConversationKey, new_state: Optional[object]) -> None:
+        """Writes (or deletes, for `None`) the state of a single conversation key."""
+        states = self._conversations.setdefault(name, {})
+        if key in states and states[key] == new_state:
+            return
+        encoded_key = json.dumps(list(key))
+        if new_state is None:
+            states.pop(key, None)
+            await self._run("DELETE FROM conversations WHERE name = ? AND conversation_key = ?", (name, encoded_key))
+            return
+        states[key] = new_state
+        await self._run(
+            "INSERT OR REPLACE INTO conversations (name, conversation_key, state) VALUES (?, ?, ?)",
+            (name, encoded_key, _dumps(new_state)),
+        )
+
+    async def drop_user_data(self, user_id: int) -> None:
+        """Deletes the user's row."""
+        self._user_digests.pop(user_id, None)
+        await self._run("DELETE FROM user_data WHERE user_id = ?", (user_id,))
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        """Deletes the chat's row."""
+        self._chat_digests.pop(chat_id, None)
+        await self._run("DELETE FROM chat_data WHERE chat_id = ?", (chat_id,))
+
+    async def flush(self) -> None:
+        """Checkpoints the WAL into the main database file; rows are already written."""
+        await self._run("PRAGMA wal_checkpoint(TRUNCATE)")
+        logger.debug(f"SQLite persistence flushed: {self.filepath}")
+
+    def close(self) -> None:
+        """Closes the database connection."""
+        with self._lock:
+            self._connection.close()
+
+    # --- Bulk import (used by the pickle migration) --- #
+
+    def import_data(
+        self,
+        user_data: Dict[int, Any],
+        chat_data: Dict[int, Any],
+        bot_data: Optional[Dict[Any, Any]] = None,
+        conversations: Optional[Dict[str, ConversationDict]] = None,
+    ) -> None:
+        """Writes complete data sets in one transaction, replacing rows with the same keys."""
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN")
+            try:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)",
+                    ((user_id, _dumps(data)) for user_id, data in user_data.items()),
+                )
+                connection.executemany(
+                    "INSERT OR REPLACE INTO chat_data (chat_id, data) VALUES (?, ?)",
+                    ((chat_id, _dumps(data)) for chat_id, data in chat_data.items()),
+                )
+                if bot_data:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO singletons (name, data) VALUES (?, ?)", ("bot_data", _dumps(bot_data))
+                    )
+                for name, states in (conversations or {}).items():
+                    connection.executemany(
+                        "INSERT OR REPLACE INTO conversations (name, conversation_key, state) VALUES (?, ?, ?)",
+                        ((name, json.dumps(list(key)), _dumps(state)) for key, state in states.items()),
+                    )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
@@ -0,0 +1 @@
+"""Test doubles of the external services the bot talks to."""
@@ -0,0 +1,44 @@
+"""Local fake of the Langfuse ingestion API, collecting the exported trace events.
+
+Point the tracer (or the Langfuse SDK, via LANGFUSE_HOST) at `FakeLangfuse.url`. Every
+`POST /api/public/ingestion` batch is recorded and acknowledged like Langfuse does, with a
+207 listing each event as a success, after `delay` seconds and with `status` if set.
+"""
+
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from ai_gym_bro.testing.http_server import HTTPRequest, HTTPResponse, LocalHTTPServer
+
+
+class FakeLangfuse(LocalHTTPServer):
+    """`/api/public/ingestion` server on localhost."""
+
+    def __init__(
+        self, host: str = "127.0.0.1", port: int = 0, delay: float = 0.0, status: Optional[int] = None
+    ) -> None:
+        super().__init__(host, port)
+        self.delay = delay
+        self.status = status
+        self.batches: List[List[Dict[str, Any]]] = []
+        self.authorizations: List[str] = []
+
+    @property
+    def events(self) -> List[Dict[str, Any]]:
+        """All received events, in order."""
+        return [event for batch in self.batches for event in batch]
+
+    def events_of_type(self, event_type: str) -> List[Dict[str, Any]]:
+        return [event for event in self.events if event["type"] == event_type]
+
+    async def handle(self, request: HTTPRequest) -> HTTPResponse:
+        if request.path != "/api/public/ingestion":
+            return HTTPResponse.from_json({"message": "Unknown endpoint"}, 404)
+        await asyncio.sleep(self.delay)
+        if self.status is not None:
+            return HTTPResponse.from_json({"message": f"Fake error {self.status}"}, self.status)
+        batch = request.json().get("batch", [])
+        self.batches.append(batch)
+        self.authorizations.append(request.headers.get("authorization", ""))
+        successes = [{"id": event.get("id"), "status": 201} for event in batch]
+        return HTTPResponse.from_json({"successes": successes, "errors": []}, 207)
@@ -0,0 +1,116 @@
+"""Local fake of the OpenAI chat completions API for end-to-end tests.
+
+Point a client at `FakeOpenAI.base_url`. Replies are scripted with `FakeReply` (status,
+delay, content, headers); once the script runs out every request gets the reply of the
+`responder` (a function of the request payload) if given, else the default reply,
+delayed by the `latency` distribution and failed with a 500 at `error_rate` when given.
+Streaming requests (`stream=True`) are answered with server-sent events, one chunk per
+word, `chunk_delay` seconds apart.
+"""
+
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field, replace
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional
+
+from ai_gym_bro.testing.http_server import HTTPRequest, HTTPResponse, LocalHTTPServer
+
+
+@dataclass
+class FakeReply:
+    content: str = "Fake completion"
+    status: int = 200
+    delay: float = 0.0  # Seconds before the response (or the first stream chunk) is sent
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+class FakeOpenAI(LocalHTTPServer):
+    """Scriptable `/v1/chat/completions` server on localhost."""
+
+    def __init__(  # noqa: PLR0913
+        self,
+        default: Optional[FakeReply] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: Optional[Callable[[], float]] = None,
+        error_rate: float = 0.0,
+        chunk_delay: float = 0.0,
+        seed: Optional[int] = None,
+        responder: Optional[Callable[[Dict[str, Any]], FakeReply]] = None,
+    ) -> None:
+        super().__init__(host, port)
+        self.default = default or FakeReply()
+        self.responder = responder
+        self.latency = latency
+        self.error_rate = error_rate
+        self.chunk_delay = chunk_delay
+        self._rng = random.Random(seed)
+        self.requests: List[Dict[str, Any]] = []
+        self._script: Deque[FakeReply] = deque()
+        self._ids = itertools.count(1)
+
+    @property
+    def base_url(self) -> str:
+        """Value for the client's `base_url`."""
+        return f"{self.url}/v1"
+
+    def script(self, *replies: FakeReply) -> None:
+        """Queues replies for the next requests, in order."""
+        self._script.extend(replies)
+
+    async def handle(self, request: HTTPRequest) -> HTTPResponse:
+        if not request.path.endswith("/chat/completions"):
+            error = {"error": {"message": "Unknown endpoint", "type": "invalid_request_error"}}
+            return HTTPResponse.from_json(error, 404)
+        payload = request.json()
+        self.requests.append(payload)
+        if self._script:
+            reply = self._script.popleft()
+        elif self.responder is not None:
+            reply = self.responder(payload)
+        else:
+            reply = self.default
+            if self.latency is not None:
+                reply = replace(reply, delay=max(self.latency(), 0.0))
+            if self.error_rate and self._rng.random() < self.error_rate:
+                reply = replace(reply, status=500)
+        await asyncio.sleep(reply.delay)
+
+        if reply.status != 200:
+            error = {"error": {"message": f"Fake error {reply.status}", "type": "server_error", "code": None}}
+            return HTTPResponse.from_json(error, reply.status, reply.headers)
+        completion_id = f"chatcmpl-fake-{next(self._ids)}"
+        if payload.get("stream"):
+            headers = {"Content-Type": "text/event-stream", **reply.headers}
+            return HTTPResponse(headers=headers, stream=self._stream(completion_id, payload["model"], reply.content))
+        completion = {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload["model"],
+            "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": reply.content}, "finish_reason": "stop"}
+            ],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+        }
+        return HTTPResponse.from_json(completion, headers=reply.headers)
+
+    async def _stream(self, completion_id: str, model: str, content: str) -> AsyncIterator[bytes]:
+        words = content.split(" ")
+        for index, word in enumerate(words):
+            text = word if index == len(words) - 1 else word + " "
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n".encode()
+            if self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+        yield b"data: [DONE]\n\n"
@@ -0,0 +1,196 @@
+"""Local fake of the Telegram Bot API for end-to-end tests.
+
+The fake answers the Bot API calls the bot makes (point the bot at it by setting
+`TELEGRAM_API_URL` to its `url`), records them, and delivers updates either by POSTing them to the
+registered webhook or through `getUpdates` for polling mode.
+"""
+
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import httpx
+from loguru import logger
+
+from ai_gym_bro.testing.http_server import HTTPRequest, HTTPResponse, LocalHTTPServer
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "AI Gym Bro", "username": "ai_gym_bro_bot"}
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def _parse_body(content_type: str, body: bytes) -> Dict[str, Any]:
+    """Decodes Bot API parameters sent as JSON or as a form with JSON-encoded values."""
+    if not body:
+        return {}
+    if "application/json" in content_type:
+        return json.loads(body)
+    params: Dict[str, Any] = {}
+    for name, value in parse_qsl(body.decode("utf-8")):
+        try:
+            params[name] = json.loads(value)
+        except ValueError:
+            params[name] = value
+    return params
+
+
+class FakeTelegram(LocalHTTPServer):
+    """Minimal Bot API server on localhost.
+
+    Every call is recorded in `calls`, except `getUpdates` calls that delivered no update.
+    """
+
+    def __init__(self, token: str, host: str = "127.0.0.1", port: int = 0) -> None:
+        super().__init__(host, port)
+        self.token = token
+        self.calls: List[Tuple[str, Dict[str, Any]]] = []
+        self.webhook: Dict[str, Any] = {}
+        self.outbox: Dict[Any, List[Tuple[str, Dict[str, Any]]]] = defaultdict(list)  # chat_id -> bot output
+        self._pending_updates: List[Dict[str, Any]] = []
+        self._updates_available = asyncio.Event()
+        self._chat_events: Dict[Any, asyncio.Event] = defaultdict(asyncio.Event)
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._call_event = asyncio.Event()
+
+    # --- Updates ---
+
+    def make_message_update(self, user_id: int, text: str) -> Dict[str, Any]:
+        """Builds a private-chat text message update, marking a leading /command as such."""
+        message: Dict[str, Any] = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": next(self._update_ids), "message": message}
+
+    def make_callback_update(self, user_id: int, data: str, message_id: int = 0) -> Dict[str, Any]:
+        """Builds an inline keyboard button press update."""
+        return {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._update_ids)),
+                "chat_instance": str(user_id),
+                "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+                "data": data,
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": BOT_USER,
+                    "text": "...",
+                },
+            },
+        }
+
+    async def post_update(self, update: Dict[str, Any], secret_token: Optional[str] = None) -> int:
+        """POSTs an update to the registered webhook like Telegram does and returns the HTTP status.
+
+        The secret token registered with `setWebhook` is sent unless another one is given.
+        """
+        token = self.webhook.get("secret_token") if secret_token is None else secret_token
+        headers = {SECRET_TOKEN_HEADER: token} if token else {}
+        async with httpx.AsyncClient() as client:
+            response = await client.post(self.webhook["url"], json=update, headers=headers)
+        return response.status_code
+
+    def queue_update(self, update: Dict[str, Any]) -> None:
+        """Makes an update available to `getUpdates` (polling mode).
+
+        Like Telegram, the update gets its id when it is queued, so ids stay increasing even
+        if updates are built ahead of time.
+        """
+        update["update_id"] = next(self._update_ids)
+        self._pending_updates.append(update)
+        self._updates_available.set()
+
+    # --- Recorded calls ---
+
+    def calls_to(self, method: str) -> List[Dict[str, Any]]:
+        """Returns the parameters of every recorded call of a Bot API method."""
+        return [params for name, params in self.calls if name == method]
+
+    async def wait_for_calls(self, method: str, count: int = 1, timeout: float = 5.0) -> List[Dict[str, Any]]:
+        """Waits until `method` was called at least `count` times."""
+        async with asyncio.timeout(timeout):
+            while len(self.calls_to(method)) < count:
+                self._call_event.clear()
+                await self._call_event.wait()
+        return self.calls_to(method)
+
+    async def wait_for_chat(
+        self,
+        chat_id: Any,
+        predicate: Callable[[str, Dict[str, Any]], bool],
+        start: int = 0,
+        timeout: float = 30.0,
+    ) -> int:
+        """Waits for a message/edit sent to `chat_id` at or after index `start` of its outbox matching
+        `predicate(method, params)`, and returns its index."""
+        outbox = self.outbox[chat_id]
+        event = self._chat_events[chat_id]
+        async with asyncio.timeout(timeout):
+            while True:
+                for index in range(start, len(outbox)):
+                    if predicate(*outbox[index]):
+                        return index
+                start = len(outbox)
+                event.clear()
+                await event.wait()
+
+    # --- HTTP ---
+
+    async def handle(self, request: HTTPRequest) -> HTTPResponse:
+        method = request.path.rsplit("/", 1)[-1]
+        params = _parse_body(request.headers.get("content-type", ""), request.body)
+        return HTTPResponse.from_json({"ok": True, "result": await self._dispatch(method, params)})
+
+    async def _dispatch(self, method: str, params: Dict[str, Any]) -> Any:
+        """Records a Bot API call and returns its result."""
+        if method != "getUpdates":
+            logger.debug(f"Fake Telegram: {method} {params}")
+            self.calls.append((method, params))
+            self._call_event.set()
+            if "chat_id" in params:
+                self.outbox[params["chat_id"]].append((method, params))
+                self._chat_events[params["chat_id"]].set()
+
+        if method == "getMe":
+            return BOT_USER
+        if method == "setWebhook":
+            self.webhook = params
+            return True
+        if method == "deleteWebhook":
+            self.webhook = {}
+            return True
+        if method == "getUpdates":
+            offset = int(params.get("offset", 0))
+            self._pending_updates = [u for u in self._pending_updates if u["update_id"] >= offset]
+            if not self._pending_updates:
+                self._updates_available.clear()
+                try:
+                    async with asyncio.timeout(float(params.get("timeout", 0))):
+                        await self._updates_available.wait()
+                except TimeoutError:
+                    pass
+            delivered = self._pending_updates[: int(params.get("limit", 100))]
+            if delivered:  # Empty long polls are not recorded
+                self.calls.append((method, params))
+                self._call_event.set()
+            return delivered
+        if method in ("sendMessage", "editMessageText"):
+            return {
+                "message_id": params.get("message_id") or next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": params.get("chat_id"), "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        return True
@@ -0,0 +1,100 @@
+"""Concurrent update processing that keeps each user's conversation in order."""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+ConversationKey = Tuple[int, int]
+
+# Commands acted on as soon as they arrive, before the user's earlier updates finish
+ABORT_COMMANDS = ("/cancel", "/start")
+
+# Size of the base class's semaphore, which is not the limit here
+_UNBOUNDED = 2**31 - 1
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates of different users concurrently, one update at a time per user.
+
+    Updates sharing a (chat id, user id) pair - the key `ConversationHandler` uses with
+    its default `per_chat`/`per_user` settings - are serialized with a FIFO lock, so a
+    conversation never sees its own updates concurrently or out of order. Updates
+    without a chat or user (e.g. polls) are processed without a lock.
+
+    The global `max_concurrent_updates` limit is applied once it is an update's turn,
+    not by the base class: its semaphore is taken before `do_process_update`, so a
+    user's updates queued behind a long generation would each hold a slot and, once
+    they fill the semaphore, block every other user.
+
+    An abort command (`/cancel`, `/start`) would wait behind the generation it is meant to stop,
+    so `on_abort(user_id)` is called as soon as one arrives; the command itself is still
+    processed in order.
+    """
+
+    __slots__ = ("_limit", "_locks", "_on_abort", "_pending", "_slots")
+
+    def __init__(self, max_concurrent_updates: int, on_abort: Optional[Callable[[int], None]] = None):
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        self._limit = _UNBOUNDED  # The base class sizes its semaphore from `max_concurrent_updates`
+        super().__init__(_UNBOUNDED)
+        self._limit = max_concurrent_updates
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._locks: Dict[ConversationKey, asyncio.Lock] = {}
+        self._pending: Dict[ConversationKey, int] = {}  # Updates holding or waiting for each lock
+        self._on_abort = on_abort
+
+    @property
+    def max_concurrent_updates(self) -> int:
+        """The maximum number of updates processed at once, across all users."""
+        return self._limit
+
+    @staticmethod
+    def conversation_key(update: object) -> Optional[ConversationKey]:
+        """Returns the (chat id, user id) key of an update, or None if it has no such pair."""
+        if not isinstance(update, Update) or not update.effective_chat or not update.effective_user:
+            return None
+        return update.effective_chat.id, update.effective_user.id
+
+    @staticmethod
+    def is_abort(update: Update) -> bool:
+        """True for an abort command message."""
+        text = update.message.text if update.message else None
+        return bool(text) and text.split("@")[0].strip() in ABORT_COMMANDS
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """Awaits the coroutine while holding the lock of the update's conversation, then a global slot."""
+        key = self.conversation_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        if self._on_abort is not None and key in self._locks and self.is_abort(update):
+            self._on_abort(key[1])  # Unblocks the update in progress, e.g. a plan being generated
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._pending[key] = self._pending.get(key, 0) + 1
+        try:
+            async with lock, self._slots:  # Waiting for its turn does not hold a global slot
+                await coroutine
+        finally:
+            # Drop idle locks so the dicts only track users with updates in flight
+            self._pending[key] -= 1
+            if not self._pending[key]:
+                del self._pending[key]
+                del self._locks[key]
+
+    @property
+    def active_conversations(self) -> int:
+        """Number of conversations with at least one update being processed or waiting."""
+        return len(self._pending)
+
+    async def initialize(self) -> None:
+        """Nothing to set up, locks are created on demand."""
+
+    async def shutdown(self) -> None:
+        """Forgets all locks; the application has stopped feeding updates at this point."""
+        self._locks.clear()
+        self._pending.clear()
@@ -0,0 +1,123 @@
+"""Wall time of plan generation in one completion vs fanned out by training day.
+
+Runs `openai_service.generate_plan` against a local fake OpenAI whose answers take time in
+proportion to their length (`--chars-per-second`, as a model emitting tokens), for the
+5-day advanced template plan: first as one completion, then with PLAN_FANOUT_ENABLED (a
+split call, then every day at once, up to `--concurrency`). The fake runs on its own
+event loop in a background thread.
+
+    poetry run python -m benchmarks.bench_fanout [--runs 5] [--chars-per-second 400] [--concurrency 5]
+        [--json results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from loguru import logger
+
+from ai_gym_bro.config import get_settings
+from ai_gym_bro.handlers.common import MUSCLE_GAIN
+from ai_gym_bro.services import openai_service
+from ai_gym_bro.services.plan_model import MAIN, Plan, render_plan
+from ai_gym_bro.services.plan_template import build_template_plan
+from ai_gym_bro.services.prompts import SYSTEM_PROMPT_PLAN_SPLIT
+from ai_gym_bro.testing.fake_openai import FakeOpenAI, FakeReply
+from benchmarks.load_test import LoopThread
+
+MODES = ["single", "fanout"]
+PROFILE = {"experience": "продвинутый", "injuries": "нет", "goal": MUSCLE_GAIN}
+_DAY_REQUEST = re.compile(r"Напишите День (\d+)")
+
+
+def plan_responder(plan: Plan, chars_per_second: float) -> Callable[[Dict[str, Any]], FakeReply]:
+    """Answers the split, day and whole-plan requests for `plan`, slower the longer the answer."""
+    split = {
+        "days": [
+            {"title": day.title, "main": [exercise.name for exercise in day.section(MAIN).exercises]}
+            for day in plan.days
+        ]
+    }
+
+    def respond(payload: Dict[str, Any]) -> FakeReply:
+        last = payload["messages"][-1]["content"]
+        day_request = _DAY_REQUEST.search(last)
+        if last == SYSTEM_PROMPT_PLAN_SPLIT:
+            content = json.dumps(split, ensure_ascii=False)
+        elif day_request:
+            content = render_plan(Plan([plan.days[int(day_request.group(1)) - 1]]))
+        else:
+            content = render_plan(plan)
+        return FakeReply(content, delay=len(content) / chars_per_second)
+
+    return respond
+
+
+async def run_mode(mode: str, runs: int, fake: FakeOpenAI) -> Dict[str, Any]:
+    """Generates the plan `runs` times in `mode`; returns the wall times and requests per plan."""
+    os.environ["PLAN_FANOUT_ENABLED"] = "1" if mode == "fanout" else "0"
+    get_settings.cache_clear()
+    os.environ["OPENAI_BASE_URL"] = fake.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    fake.requests.clear()
+    wall_times: List[float] = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        plan, _ = await openai_service.generate_plan(dict(PROFILE))
+        wall_times.append(time.perf_counter() - started)
+        assert plan, f"No plan in {mode} mode"
+    await openai_service.close_client()
+    return {
+        "mean_s": statistics.mean(wall_times),
+        "min_s": min(wall_times),
+        "requests_per_plan": len(fake.requests) / runs,
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    plan = build_template_plan(PROFILE)
+    fake = FakeOpenAI(responder=plan_responder(plan, args.chars_per_second))
+    fakes = LoopThread()
+    await fakes.run(fake.start())
+    try:
+        return {mode: await run_mode(mode, args.runs, fake) for mode in MODES}
+    finally:
+        await fakes.run(fake.stop())
+        fakes.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--chars-per-second", type=float, default=400)
+    parser.add_argument("--concurrency", type=int, default=5, help="PLAN_FANOUT_CONCURRENCY")
+    parser.add_argument("--json", type=Path, help="Write the results to this file")
+    args = parser.parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    os.environ.update(
+        OPENAI_RATE_LIMIT_ENABLED="0",
+        PLAN_CACHE_ENABLED="0",
+        PLAN_TEMPLATE_ENABLED="0",
+        TRACING_MODE="off",
+        PLAN_FANOUT_CONCURRENCY=str(args.concurrency),
+    )
+
+    results = asyncio.run(run(args))
+
+    print(f"{'mode':<8} {'mean s':>7} {'min s':>7} {'requests':>9}   ({args.runs} plans)")
+    for mode, result in results.items():
+        print(f"{mode:<8} {result['mean_s']:>7.2f} {result['min_s']:>7.2f} {result['requests_per_plan']:>9.0f}")
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
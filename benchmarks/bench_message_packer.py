@@ -0,0 +1,60 @@
+"""Micro-benchmark of the message packer on large synthetic plans.
+
+Compares the number of Telegram messages against fixed 4000-char slicing and measures
+packing throughput.
+
+    poetry run python -m benchmarks.bench_message_packer [--weeks 12] [--repeat 50]
+"""
+
+import argparse
+import random
+import time
+
+from ai_gym_bro.handlers.message_packer import PACK_LIMIT, pack_message
+
+EXERCISES = ["Жим лежа", "Присед", "Становая тяга", "Подтягивания", "Жим стоя", "Тяга штанги в наклоне"]
+
+
+def make_plan(weeks: int, days: int = 4, seed: int = 0) -> str:
+    """Builds a plan shaped like the model's output: week/day headers, bullets, notes and a table."""
+    rng = random.Random(seed)
+    lines = ["# Персональный план тренировок", ""]
+    for week in range(1, weeks + 1):
+        lines += [f"## Неделя {week}", ""]
+        for day in range(1, days + 1):
+            lines.append(f"### День {day}: **{rng.choice(EXERCISES)}** & аксессуары")
+            for exercise in rng.sample(EXERCISES, 4):
+                sets, reps = rng.randint(3, 5), rng.randint(3, 10)
+                load, rpe = rng.randint(60, 85), rng.randint(6, 9)
+                lines.append(f"- {exercise}: {sets}x{reps} @ {load}% 1ПМ — *отдых* 2–3 мин, `RPE {rpe}`")
+            lines.append("Примечание: " + " ".join(["следите за техникой и темпом"] * rng.randint(1, 4)))
+            lines.append("")
+        lines += ["| Упражнение | Подходы | Повторы |", "|---|---|---|"]
+        lines += [f"| {exercise} | {rng.randint(3, 5)} | {rng.randint(3, 10)} |" for exercise in EXERCISES]
+        lines.append("")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weeks", type=int, nargs="+", default=[4, 12, 52])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'weeks':>6} {'chars':>8} {'sliced':>7} {'packed':>7} {'fill':>6} {'ms/plan':>8} {'MB/s':>6}")
+    for weeks in args.weeks:
+        plan = make_plan(weeks)
+        sliced = -(-len(plan) // 4000)
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            messages = pack_message(plan)
+        elapsed = (time.perf_counter() - started) / args.repeat
+        fill = sum(len(message) for message in messages) / (len(messages) * PACK_LIMIT)
+        print(
+            f"{weeks:>6} {len(plan):>8} {sliced:>7} {len(messages):>7} {fill:>6.0%} "
+            f"{elapsed * 1000:>8.2f} {len(plan) / elapsed / 1e6:>6.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
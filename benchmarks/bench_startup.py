@@ -0,0 +1,136 @@
+"""Cold-start benchmark: time from process start to the first polled and answered update.
+
+Starts the bot in a fresh interpreter (as the container does), in polling mode against a
+local fake Telegram that already holds a /start update, and measures from spawning the
+process until the update is fetched with getUpdates and until the bot answers it. With
+`--importtime` the child also runs with `-X importtime` and the import time is reported
+per top-level package.
+
+    poetry run python -m benchmarks.bench_startup [--runs 5] [--importtime] [--json results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List
+
+from loguru import logger
+
+from ai_gym_bro.testing.fake_telegram import FakeTelegram
+
+TOKEN = "123456:STARTUP"
+_IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def run_child(sqlite_path: str) -> None:
+    """Runs the bot like `main()` does, with persistence in `sqlite_path`."""
+    from ai_gym_bro import main
+    from ai_gym_bro.storage.sqlite_persistence import SQLitePersistence
+
+    application = main.build_application(TOKEN, SQLitePersistence(Path(sqlite_path)))
+    application.run_polling(allowed_updates=main.ALLOWED_UPDATES)
+
+
+def import_profile(stderr: str) -> Dict[str, float]:
+    """Sums the `-X importtime` self times (ms) per top-level package."""
+    totals: Dict[str, float] = defaultdict(float)
+    for line in stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            totals[match.group(4).split(".")[0]] += int(match.group(1)) / 1000
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+
+async def measure_once(importtime: bool) -> Dict[str, Any]:
+    """Starts the bot once and returns the startup timings in seconds."""
+    telegram = FakeTelegram(TOKEN)
+    await telegram.start()
+    telegram.queue_update(telegram.make_message_update(1, "/start"))
+    workdir = tempfile.TemporaryDirectory()
+    env = {
+        **os.environ,
+        "TELEGRAM_API_URL": telegram.url,
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-startup-benchmark"),
+        "LOG_FILE": "",
+        "LOG_LEVEL": "WARNING",
+    }
+    flags = ["-X", "importtime"] if importtime else []
+
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        *flags,
+        "-m",
+        "benchmarks.bench_startup",
+        "--child",
+        str(Path(workdir.name) / "bot.sqlite"),
+        env=env,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stderr = asyncio.ensure_future(process.stderr.read())  # Drained meanwhile, the child blocks on a full pipe
+    try:
+        await telegram.wait_for_calls("getUpdates", timeout=60)
+        polled = time.perf_counter() - started
+        await telegram.wait_for_calls("sendMessage", timeout=60)
+        answered = time.perf_counter() - started
+    finally:
+        if process.returncode is None:
+            process.terminate()
+        await process.wait()
+        await telegram.stop()
+        workdir.cleanup()
+    result: Dict[str, Any] = {"polled": polled, "answered": answered}
+    if importtime:
+        result["imports"] = import_profile((await stderr).decode("utf-8", "replace"))
+    else:
+        await stderr
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--importtime", action="store_true", help="Profile imports of the last run")
+    parser.add_argument("--top", type=int, default=12, help="Packages shown in the import profile")
+    parser.add_argument("--json", type=Path, help="Write the results to this file")
+    parser.add_argument("--child", metavar="SQLITE_PATH", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args.child)
+        return
+    logger.remove()  # The fake's per-call debug lines
+    logger.add(sys.stderr, level="WARNING")
+
+    runs: List[Dict[str, Any]] = []
+    for index in range(args.runs):
+        runs.append(asyncio.run(measure_once(args.importtime and index == args.runs - 1)))
+
+    result: Dict[str, Any] = {
+        stage: {"median": statistics.median(run[stage] for run in runs), "min": min(run[stage] for run in runs)}
+        for stage in ("polled", "answered")
+    }
+    print(f"{'stage':<10} {'median ms':>10} {'min ms':>8}   ({args.runs} runs)")
+    for stage in ("polled", "answered"):
+        print(f"{stage:<10} {result[stage]['median'] * 1000:>10.0f} {result[stage]['min'] * 1000:>8.0f}")
+
+    if args.importtime:
+        imports = runs[-1]["imports"]
+        result["imports"] = imports
+        print(f"\nimport time per package, total {sum(imports.values()):.0f} ms:")
+        for package, milliseconds in list(imports.items())[: args.top]:
+            print(f"  {package:<24} {milliseconds:>7.1f} ms")
+    if args.json:
+        args.json.write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Per-request overhead of tracing OpenAI calls, by tracing mode.
+
+Sends sequential completions through `openai_service._create_completion` (with rate
+limiting off) to a local fake OpenAI answering without delay, with the traces going to a
+local fake Langfuse collector. The fakes run on their own event loop in a background
+thread, so the CPU time reported is the bot loop's own (plus Langfuse SDK threads for the
+`wrapper` mode, measured as process time).
+
+Modes: `off` (TRACING_MODE=off), `sampled` (our tracer at `--sample-rate`), `full` (our
+tracer, every call) and `wrapper` (the `langfuse.openai.AsyncOpenAI` client the bot used
+before). The wrapper runs last: importing `langfuse.openai` patches the openai package
+for the rest of the process.
+
+    poetry run python -m benchmarks.bench_tracing [--requests 500] [--sample-rate 0.1] [--json results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+from unittest.mock import patch
+
+from loguru import logger
+from openai import AsyncOpenAI
+
+from ai_gym_bro.config import get_settings
+from ai_gym_bro.services import openai_service, tracing
+from ai_gym_bro.testing.fake_langfuse import FakeLangfuse
+from ai_gym_bro.testing.fake_openai import FakeOpenAI, FakeReply
+from benchmarks.load_test import LoopThread, percentile
+
+MODES = ["off", "sampled", "full", "wrapper"]
+MESSAGES = [
+    {"role": "system", "content": "Составь план тренировок."},
+    {"role": "user", "content": "Набор массы"},
+]
+
+
+def configure(mode: str, sample_rate: float, fake_openai: FakeOpenAI) -> AsyncOpenAI:
+    """Sets the tracing environment of `mode`, rebuilds the settings and tracer and returns the client to use."""
+    os.environ["TRACING_MODE"] = "off" if mode in ("off", "wrapper") else "on"
+    os.environ["TRACING_SAMPLE_RATE"] = str(sample_rate if mode == "sampled" else 1.0)
+    get_settings.cache_clear()
+    tracing.get_tracer.cache_clear()
+    client_class = AsyncOpenAI
+    if mode == "wrapper":
+        from langfuse import openai as langfuse_openai
+
+        client_class = langfuse_openai.AsyncOpenAI
+    return client_class(base_url=fake_openai.base_url, api_key="sk-bench", max_retries=0)
+
+
+async def run_mode(mode: str, requests: int, warmup: int, sample_rate: float, fakes: LoopThread) -> Dict[str, Any]:
+    """Runs `requests` sequential completions in `mode`; returns latency, CPU time and exported events."""
+    fake_openai, collector = FakeOpenAI(FakeReply("План: присед 4x6, жим 4x8.")), FakeLangfuse()
+    await fakes.run(fake_openai.start())
+    await fakes.run(collector.start())
+    os.environ["LANGFUSE_HOST"] = collector.url
+    client = configure(mode, sample_rate, fake_openai)
+    tracer = tracing.get_tracer()
+    if tracer:
+        await tracer.exporter.start()
+
+    with patch.object(openai_service, "get_client", return_value=client):
+        for _ in range(warmup):
+            await openai_service._create_completion("generate_plan", "gpt-4.1", MESSAGES, 100, hedge=False)
+        latencies: List[float] = []
+        cpu_started, thread_started = time.process_time(), time.thread_time()
+        for _ in range(requests):
+            started = time.perf_counter()
+            await openai_service._create_completion("generate_plan", "gpt-4.1", MESSAGES, 100, hedge=False)
+            latencies.append(time.perf_counter() - started)
+        thread_cpu, process_cpu = time.thread_time() - thread_started, time.process_time() - cpu_started
+
+    if tracer:
+        await tracer.exporter.stop()
+    if mode == "wrapper":
+        from langfuse.openai import openai as patched_openai
+
+        await asyncio.to_thread(patched_openai.flush_langfuse)
+    await client.close()
+    await fakes.run(fake_openai.stop())
+    await fakes.run(collector.stop())
+    return {
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "loop_cpu_us": thread_cpu / requests * 1e6,
+        "process_cpu_us": process_cpu / requests * 1e6,
+        "generations": len(collector.events_of_type("generation-create")),
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    fakes = LoopThread()
+    try:
+        return {mode: await run_mode(mode, args.requests, args.warmup, args.sample_rate, fakes) for mode in args.modes}
+    finally:
+        fakes.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--sample-rate", type=float, default=0.1, help="Sample rate of the `sampled` mode")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--json", type=Path, help="Write the results to this file")
+    args = parser.parse_args()
+    args.modes = [mode for mode in MODES if mode in args.modes]  # The wrapper patches openai, so it runs last
+    logger.remove()  # One line per call from the service, and the fakes' debug lines
+    logger.add(sys.stderr, level="WARNING")
+    os.environ.update(
+        OPENAI_RATE_LIMIT_ENABLED="0", LANGFUSE_PUBLIC_KEY="pk-lf-bench", LANGFUSE_SECRET_KEY="sk-lf-bench"
+    )
+
+    results = asyncio.run(run(args))
+
+    baseline = results.get("off")
+    print(
+        f"{'mode':<8} {'mean ms':>8} {'p50 ms':>7} {'p95 ms':>7} {'Δ mean':>8} {'loop cpu µs':>12} "
+        f"{'process cpu µs':>15} {'traced':>7}   ({args.requests} requests)"
+    )
+    for mode, result in results.items():
+        delta = f"{(result['mean_ms'] / baseline['mean_ms'] - 1) * 100:+.1f}%" if baseline else "-"
+        print(
+            f"{mode:<8} {result['mean_ms']:>8.2f} {result['p50_ms']:>7.2f} {result['p95_ms']:>7.2f} {delta:>8} "
+            f"{result['loop_cpu_us']:>12.0f} {result['process_cpu_us']:>15.0f} {result['generations']:>7}"
+        )
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
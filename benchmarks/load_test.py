@@ -0,0 +1,387 @@
+"""End-to-end load test of the conversation flow against local fakes of OpenAI and Telegram.
+
+N simulated users go through the whole workflow: /start, the six questions, the goal
+button, then a few refinement rounds. The bot runs in polling mode in this process, with
+its real handlers, persistence, queue and schedulers; the fakes and the simulated users
+run on a separate event loop in a background thread, so the reported event-loop lag is
+the bot's own.
+
+    poetry run python -m benchmarks.load_test [--users 100] [--refinements 2]
+        [--openai-latency 1.5] [--openai-sigma 0.5] [--error-rate 0.01]
+        [--json results.json] [--baseline previous.json]
+
+Each stage is timed from the user's update to the bot's answer (for the goal: to the
+refinement options after the plan). The fake has no quotas, so the OpenAI rate limits and
+the global Telegram rate default to high values here; set OPENAI_REQUESTS_PER_MINUTE,
+TELEGRAM_GLOBAL_RATE etc. to measure with production limits.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Coroutine, Dict, List, Optional, TypeVar
+
+from loguru import logger
+
+from ai_gym_bro.handlers.common import ASK_QUESTION_CALLBACK, FAT_LOSS, MUSCLE_GAIN
+from ai_gym_bro.testing.fake_openai import FakeOpenAI, FakeReply
+from ai_gym_bro.testing.fake_telegram import FakeTelegram
+
+T = TypeVar("T")
+
+TOKEN = "123456:LOADTEST"
+FIRST_USER_ID = 100_000
+
+NEXT_ACTION = "Что бы вы хотели сделать дальше?"
+QUESTIONS = [
+    ("age", "Понятно. Какой у вас рост"),
+    ("height", "Спасибо. А ваш текущий вес"),
+    ("weight", "Какой у вас уровень опыта"),
+    ("experience", "Какой у вас текущий предполагаемый максимум"),
+    ("bench", "Есть ли у вас какие-либо текущие травмы"),
+    ("injuries", "Наконец, какова ваша основная цель"),
+]
+PLAN_TEMPLATE = "## Неделя {week}\n\n### День 1\n- Присед 4x6\n- Жим лежа 4x8\n- Тяга 3x10\n"
+STAGES = ["start", *[name for name, _ in QUESTIONS], "goal_ack", "plan", "refine_choice", "refine"]
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0..100) of a non-empty list."""
+    ordered = sorted(samples)
+    return ordered[min(int(q / 100 * len(ordered)), len(ordered) - 1)]
+
+
+class StageError(Exception):
+    """The bot answered a stage with an error message."""
+
+
+class LoopThread:
+    """Event loop running in a daemon thread, for the fakes and the simulated users."""
+
+    def __init__(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="load-test-fakes", daemon=True)
+        self._thread.start()
+
+    async def run(self, coro: Coroutine[Any, Any, T]) -> T:
+        """Runs `coro` on the thread's loop and awaits its result from the calling loop."""
+        future: Future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        return await asyncio.wrap_future(future)
+
+    def close(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up a task sleeping `interval` seconds."""
+
+    def __init__(self, interval: float = 0.05) -> None:
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="loop-lag-monitor")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(time.perf_counter() - started - self.interval, 0.0))
+
+
+class SimulatedUser:
+    """Drives one chat through the workflow and records the duration of each stage."""
+
+    def __init__(  # noqa: PLR0913
+        self,
+        telegram: FakeTelegram,
+        user_id: int,
+        rng: random.Random,
+        refinements: int,
+        think_time: float,
+        timeout: float,
+        timings: Dict[str, List[float]],
+    ) -> None:
+        self.telegram = telegram
+        self.user_id = user_id
+        self.rng = rng
+        self.refinements = refinements
+        self.think_time = think_time
+        self.timeout = timeout
+        self.timings = timings
+        self._seen = 0  # Index in the chat's outbox after the last matched answer
+
+    async def _step(
+        self,
+        stage: str,
+        update: Optional[Dict[str, Any]],
+        predicate: Callable[[str, Dict[str, Any]], bool],
+        started: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Sends an update (if any) and waits for the answer matching `predicate`.
+
+        The stage is timed from `started` if given, else from sending the update.
+        """
+        if update is not None:
+            if self.think_time:
+                await asyncio.sleep(self.rng.uniform(0, 2 * self.think_time))
+            started = time.perf_counter()
+            self.telegram.queue_update(update)
+        index = await self.telegram.wait_for_chat(self.user_id, predicate, start=self._seen, timeout=self.timeout)
+        self.timings[stage].append(time.perf_counter() - started)
+        self._seen = index + 1
+        method, params = self.telegram.outbox[self.user_id][index]
+        return params
+
+    async def _text(self, stage: str, text: str, expected: str) -> None:
+        await self._step(
+            stage,
+            self.telegram.make_message_update(self.user_id, text),
+            lambda method, params: method == "sendMessage" and params.get("text", "").startswith(expected),
+        )
+
+    async def _keyboard_answer(
+        self, stage: str, update: Optional[Dict[str, Any]], started: Optional[float] = None
+    ) -> None:
+        """Waits for the next message with a keyboard; fails if it is not the refinement options."""
+        params = await self._step(
+            stage,
+            update,
+            lambda method, params: method == "sendMessage"
+            and ("reply_markup" in params or "/start" in params.get("text", "")),
+            started,
+        )
+        if params.get("text") != NEXT_ACTION:
+            raise StageError(f"{stage}: {params.get('text', '')[:80]}")
+
+    async def run(self) -> None:
+        rng = self.rng
+        answers = {
+            "age": str(rng.randint(16, 65)),
+            "height": f"{rng.randint(150, 205)} см",
+            "weight": f"{rng.randint(45, 130)} кг",
+            "experience": rng.choice(["начинающий", "средний", "продвинутый"]),
+            "bench": f"{rng.randint(30, 180)} кг",
+            "injuries": rng.choice(["Нет", "Нет", "Болит плечо", "Грыжа поясницы"]),
+        }
+        await self._text("start", "/start", "Сколько тебе лет?")
+        for name, expected in QUESTIONS:
+            await self._text(name, answers[name], expected)
+
+        await self._step(
+            "goal_ack",
+            self.telegram.make_callback_update(self.user_id, rng.choice([MUSCLE_GAIN, FAT_LOSS])),
+            lambda method, params: method == "editMessageText" and "Цель выбрана" in params.get("text", ""),
+        )
+        # Timed from the button press, which was just sent along with goal_ack
+        await self._keyboard_answer("plan", None, started=time.perf_counter() - self.timings["goal_ack"][-1])
+
+        for _ in range(self.refinements):
+            await self._step(
+                "refine_choice",
+                self.telegram.make_callback_update(self.user_id, ASK_QUESTION_CALLBACK),
+                lambda method, params: method == "editMessageText" and params.get("text", "").startswith("Хорошо"),
+            )
+            await self._keyboard_answer(
+                "refine", self.telegram.make_message_update(self.user_id, "Можно заменить присед на жим ногами?")
+            )
+
+
+def _point_at_fakes(openai: FakeOpenAI, telegram: FakeTelegram) -> None:
+    """Configures the bot, through its environment, to talk to the fakes without client-side limits."""
+    os.environ["OPENAI_BASE_URL"] = openai.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-load-test")
+    os.environ["TELEGRAM_API_URL"] = telegram.url
+    os.environ.setdefault("OPENAI_REQUESTS_PER_MINUTE", "1000000")
+    os.environ.setdefault("OPENAI_TOKENS_PER_MINUTE", "1000000000")
+    os.environ.setdefault("TELEGRAM_GLOBAL_RATE", "100000")
+
+
+async def run_load_test(args: argparse.Namespace) -> Dict[str, Any]:
+    fakes = LoopThread()
+    rng = random.Random(args.seed)
+    plan_text = "\n".join(PLAN_TEMPLATE.format(week=week) for week in range(1, args.plan_weeks + 1))
+    openai = FakeOpenAI(
+        FakeReply(content=plan_text),
+        latency=lambda: rng.lognormvariate(0, args.openai_sigma) * args.openai_latency,
+        error_rate=args.error_rate,
+        chunk_delay=args.chunk_delay,
+        seed=args.seed,
+    )
+    telegram = FakeTelegram(TOKEN)
+    await fakes.run(openai.start())
+    await fakes.run(telegram.start())
+    _point_at_fakes(openai, telegram)
+
+    # Imported once the environment points at the fakes: the OpenAI client is created on import
+    from ai_gym_bro import main
+    from ai_gym_bro.storage.sqlite_persistence import SQLitePersistence
+
+    workdir = tempfile.TemporaryDirectory()
+    persistence = SQLitePersistence(Path(workdir.name) / "bot.sqlite") if args.persistence == "sqlite" else None
+    application = main.build_application(TOKEN, persistence)
+    await application.initialize()
+    await application.start()
+    await main.post_init(application)
+    await application.updater.start_polling(poll_interval=0.0, timeout=10, allowed_updates=main.ALLOWED_UPDATES)
+
+    lag = LoopLagMonitor()
+    lag.start()
+    timings: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+
+    async def drive(user: SimulatedUser, delay: float) -> bool:
+        await asyncio.sleep(delay)
+        try:
+            await user.run()
+            return True
+        except StageError as e:
+            errors[str(e).split(":")[0]] += 1
+        except TimeoutError:
+            errors["timeout"] += 1
+        return False
+
+    async def drive_all() -> List[bool]:
+        users = [
+            SimulatedUser(
+                telegram,
+                FIRST_USER_ID + index,
+                random.Random(f"{args.seed}-{index}"),
+                args.refinements,
+                args.think_time,
+                args.timeout,
+                timings,
+            )
+            for index in range(args.users)
+        ]
+        return await asyncio.gather(*(drive(user, rng.uniform(0, args.ramp)) for user in users))
+
+    started = time.perf_counter()
+    try:
+        completed = sum(await fakes.run(drive_all()))
+        elapsed = time.perf_counter() - started
+    finally:
+        await lag.stop()
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+        await main.post_shutdown(application)
+        await fakes.run(telegram.stop())
+        await fakes.run(openai.stop())
+        fakes.close()
+        workdir.cleanup()
+
+    updates = sum(len(samples) for stage, samples in timings.items() if stage != "plan")
+    return {
+        "users": args.users,
+        "completed": completed,
+        "errors": dict(errors),
+        "seconds": elapsed,
+        "updates_per_second": updates / elapsed,
+        "conversations_per_minute": completed / elapsed * 60,
+        "openai_requests": len(openai.requests),
+        "telegram_calls": len(telegram.calls),
+        "stages": {
+            stage: {
+                "count": len(timings[stage]),
+                "p50": percentile(timings[stage], 50),
+                "p95": percentile(timings[stage], 95),
+                "p99": percentile(timings[stage], 99),
+                "max": max(timings[stage]),
+            }
+            for stage in STAGES
+            if timings[stage]
+        },
+        "loop_lag": {
+            "p50": percentile(lag.samples, 50),
+            "p99": percentile(lag.samples, 99),
+            "max": max(lag.samples),
+        }
+        if lag.samples
+        else {},
+    }
+
+
+def _change(current: float, previous: Optional[float]) -> str:
+    if not previous:
+        return ""
+    return f" ({(current - previous) / previous:+.0%})"
+
+
+def print_report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    """Prints the results, with the relative change against `baseline` when given."""
+    base = baseline or {}
+    print(
+        f"{result['completed']}/{result['users']} conversations completed in {result['seconds']:.1f}s, "
+        f"errors: {result['errors'] or 'none'}"
+    )
+    print(
+        f"throughput: {result['updates_per_second']:.1f} updates/s"
+        f"{_change(result['updates_per_second'], base.get('updates_per_second'))}, "
+        f"{result['conversations_per_minute']:.1f} conversations/min"
+        f"{_change(result['conversations_per_minute'], base.get('conversations_per_minute'))}"
+    )
+    print(f"OpenAI requests: {result['openai_requests']}, Telegram calls: {result['telegram_calls']}")
+    print()
+    print(f"{'stage':<14} {'count':>6} {'p50 ms':>14} {'p95 ms':>14} {'p99 ms':>14} {'max ms':>9}")
+    for stage, stats in result["stages"].items():
+        previous = base.get("stages", {}).get(stage, {})
+        columns = [
+            f"{stats[q] * 1000:.0f}{_change(stats[q], previous.get(q))}".rjust(14) for q in ("p50", "p95", "p99")
+        ]
+        print(f"{stage:<14} {stats['count']:>6} {' '.join(columns)} {stats['max'] * 1000:>9.0f}")
+    if result["loop_lag"]:
+        lag, previous = result["loop_lag"], base.get("loop_lag", {})
+        print()
+        print(
+            "event loop lag: "
+            + ", ".join(f"{q} {lag[q] * 1000:.1f} ms{_change(lag[q], previous.get(q))}" for q in ("p50", "p99", "max"))
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--refinements", type=int, default=2, help="Questions asked after the plan")
+    parser.add_argument("--ramp", type=float, default=5.0, help="Seconds over which users arrive")
+    parser.add_argument("--think-time", type=float, default=0.2, help="Mean pause of a user between steps")
+    parser.add_argument("--openai-latency", type=float, default=1.0, help="Median OpenAI response latency (s)")
+    parser.add_argument("--openai-sigma", type=float, default=0.5, help="Log-normal shape of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of OpenAI requests failing with 500")
+    parser.add_argument("--chunk-delay", type=float, default=0.005, help="Seconds between streamed chunks")
+    parser.add_argument("--plan-weeks", type=int, default=4, help="Length of the fake plan")
+    parser.add_argument("--persistence", choices=["sqlite", "none"], default="sqlite")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds a user waits for an answer")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="Write the results to this file")
+    parser.add_argument("--baseline", type=Path, help="Results of a previous run to compare against")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(lambda msg: print(msg, end=""), level=args.log_level)
+
+    result = asyncio.run(run_load_test(args))
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    print_report(result, baseline)
+    if args.json:
+        args.json.write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Tests for conversation_metrics.py"""
+
+import pytest
+from prometheus_client import REGISTRY
+from telegram import Update
+from telegram.ext import Application, CallbackContext, ConversationHandler, MessageHandler, filters
+
+from ai_gym_bro.handlers.common import ASK_AGE, ASK_HEIGHT
+from ai_gym_bro.handlers.conversation_metrics import InstrumentedConversationHandler
+
+
+def _sample(name, state):
+    return REGISTRY.get_sample_value(name, {"state": state}) or 0
+
+
+def _message_update(update_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 5, "type": "private"},
+            "from": {"id": 5, "is_bot": False, "first_name": "User"},
+            "text": text,
+        },
+    }
+
+
+@pytest.mark.asyncio
+async def test_state_durations_are_observed_on_transitions():
+    """Each update is timed by its state; state durations are observed only when the state changes."""
+
+    async def enter(update, context):
+        return ASK_AGE
+
+    async def stay(update, context):
+        return ASK_AGE
+
+    async def advance(update, context):
+        return ASK_HEIGHT
+
+    async def finish(update, context):
+        return ConversationHandler.END
+
+    application = Application.builder().token("123:TEST").build()
+    handler = InstrumentedConversationHandler(
+        entry_points=[MessageHandler(filters.Regex("^go$"), enter)],
+        states={
+            ASK_AGE: [
+                MessageHandler(filters.Regex("^again$"), stay),
+                MessageHandler(filters.Regex("^next$"), advance),
+            ],
+            ASK_HEIGHT: [MessageHandler(filters.TEXT, finish)],
+        },
+        fallbacks=[],
+    )
+
+    async def send(update_id, text):
+        update = Update.de_json(_message_update(update_id, text), application.bot)
+        context = CallbackContext.from_update(update, application)
+        await handler.handle_update(update, application, handler.check_update(update), context)
+
+    handled_before = _sample("conversation_handler_seconds_count", "ask_age")
+    age_before = _sample("conversation_state_seconds_count", "ask_age")
+    height_before = _sample("conversation_state_seconds_count", "ask_height")
+
+    for update_id, text in enumerate(["go", "again", "again", "next"], start=1):
+        await send(update_id, text)
+
+    assert _sample("conversation_handler_seconds_count", "ask_age") - handled_before == 3
+    assert _sample("conversation_state_seconds_count", "ask_age") - age_before == 1
+    assert REGISTRY.get_sample_value("conversations_active") == 1
+
+    await send(5, "done")
+
+    assert _sample("conversation_state_seconds_count", "ask_height") - height_before == 1
+    assert REGISTRY.get_sample_value("conversations_active") == 0
@@ -0,0 +1,67 @@
+"""Tests for message_packer.py"""
+
+from unittest.mock import AsyncMock
+
+import pytest
+from telegram.error import BadRequest
+
+from ai_gym_bro.handlers.message_packer import html_to_text, pack_message, send_packed
+
+
+def make_plan(weeks=6, days=4):
+    lines = []
+    for week in range(1, weeks + 1):
+        lines.append(f"## Неделя {week}")
+        for day in range(1, days + 1):
+            lines.append(f"### День {day}: **Грудь** & трицепс")
+            lines += [f"- Жим лежа: 4x{reps} @ {70 + reps}% — *отдых* 2 мин" for reps in range(3, 10)]
+            lines.append("")
+    return "\n".join(lines)
+
+
+def test_converts_markdown_to_telegram_html():
+    """Headers, bold, italics, code and bullets become HTML; special characters are escaped."""
+    [message] = pack_message("## План\n- **Жим** 5x5 <тяжело> & *медленно* `RPE 8`")
+
+    assert message == "<b>План</b>\n• <b>Жим</b> 5x5 &lt;тяжело&gt; &amp; <i>медленно</i> <code>RPE 8</code>"
+
+
+def test_tables_become_preformatted():
+    """Markdown tables are kept aligned in a <pre> block."""
+    [message] = pack_message("Итого:\n\n| A | B |\n|---|---|\n| 1 | 2 |")
+
+    assert message == "Итого:\n\n<pre>| A | B |\n|---|---|\n| 1 | 2 |</pre>"
+
+
+def test_messages_fill_limit_and_split_at_sections():
+    """Messages stay under the limit, are well filled and start at a day or week header."""
+    plan = make_plan()
+    messages = pack_message(plan, limit=1000)
+
+    assert all(len(message) <= 1000 for message in messages)
+    assert all(message.startswith("<b>") for message in messages)
+    assert len(messages) <= len(plan) // 1000 * 2  # Far fewer than one message per section
+    assert html_to_text("\n\n".join(messages)).count("Жим лежа") == plan.count("Жим лежа")
+
+
+def test_long_line_is_split_between_words_and_keeps_formatting():
+    """A single over-long line is cut at spaces and bold is closed/reopened around the cut."""
+    text = "**" + " ".join(["слово"] * 400) + "**"
+    messages = pack_message(text, limit=500)
+
+    assert len(messages) > 1
+    assert all(len(message) <= 500 for message in messages)
+    assert all(message.startswith("<b>") and message.endswith("</b>") for message in messages)
+    assert html_to_text(" ".join(messages)).split() == ["слово"] * 400
+
+
+@pytest.mark.asyncio
+async def test_send_packed_falls_back_to_plain_text():
+    """A chunk Telegram cannot parse is resent without markup."""
+    send = AsyncMock(side_effect=[BadRequest("Can't parse entities"), None])
+
+    count = await send_packed(send, "**Жим** & тяга")
+
+    assert count == 1
+    assert send.call_args_list[0].kwargs == {"text": "<b>Жим</b> &amp; тяга", "parse_mode": "HTML"}
+    assert send.call_args_list[1].kwargs == {"text": "Жим & тяга"}
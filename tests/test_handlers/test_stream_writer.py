@@ -0,0 +1,121 @@
+"""Tests for stream_writer.py"""
+
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from telegram.error import BadRequest, RetryAfter
+
+from ai_gym_bro.handlers.stream_writer import StreamingMessageWriter
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def mock_bot():
+    """Create a mock Bot whose send_message returns increasing message ids."""
+    bot = MagicMock()
+    bot.edit_message_text = AsyncMock()
+    sent_ids = iter(range(101, 200))
+    bot.send_message = AsyncMock(side_effect=lambda **kwargs: MagicMock(message_id=next(sent_ids)))
+    return bot
+
+
+@pytest.mark.asyncio
+async def test_edits_are_rate_limited(mock_bot):
+    """Deltas arriving within the edit interval are batched into one edit."""
+    clock = FakeClock()
+    writer = StreamingMessageWriter(mock_bot, chat_id=1, message_id=10, edit_interval=1.0, clock=clock)
+
+    await writer.append("Неделя 1")  # First delta is shown immediately
+    await writer.append(", день 1")
+    await writer.append(", жим")
+    assert mock_bot.edit_message_text.call_count == 1
+
+    clock.now = 1.5
+    await writer.append("!")
+    assert mock_bot.edit_message_text.call_count == 2
+    assert mock_bot.edit_message_text.call_args.kwargs["text"] == "Неделя 1, день 1, жим!"
+
+
+@pytest.mark.asyncio
+async def test_flush_shows_pending_text(mock_bot):
+    """flush() pushes text that was held back by the rate limit."""
+    clock = FakeClock()
+    writer = StreamingMessageWriter(mock_bot, chat_id=1, message_id=10, edit_interval=1.0, clock=clock)
+
+    await writer.append("a")
+    await writer.append("b")
+    await writer.flush()
+    await writer.flush()  # Nothing changed, no extra edit
+
+    assert mock_bot.edit_message_text.call_count == 2
+    assert mock_bot.edit_message_text.call_args.kwargs["text"] == "ab"
+    assert writer.has_output
+
+
+@pytest.mark.asyncio
+async def test_rolls_over_at_line_break_near_limit(mock_bot):
+    """Text past the limit is cut at the last line break and continued in a new message."""
+    clock = FakeClock()
+    writer = StreamingMessageWriter(mock_bot, chat_id=1, message_id=10, message_limit=20, clock=clock)
+
+    await writer.append("line one is long\nline two")
+    await writer.flush()
+
+    first_edit = mock_bot.edit_message_text.call_args_list[0].kwargs
+    assert first_edit == {"chat_id": 1, "message_id": 10, "text": "line one is long"}
+    mock_bot.send_message.assert_called_once_with(chat_id=1, text="line two")
+    assert writer.message_ids == [10, 101]
+
+
+@pytest.mark.asyncio
+async def test_throttled_intermediate_edit_is_skipped(mock_bot):
+    """A RetryAfter on a progressive edit does not abort the stream."""
+    mock_bot.edit_message_text.side_effect = [RetryAfter(3), None]
+    clock = FakeClock()
+    writer = StreamingMessageWriter(mock_bot, chat_id=1, message_id=10, clock=clock)
+
+    await writer.append("text")
+    await writer.flush()
+
+    assert mock_bot.edit_message_text.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_finalize_renders_the_streamed_markdown_as_html(mock_bot):
+    """The raw streamed text is replaced by the packed HTML, and messages the HTML no longer needs are deleted."""
+    mock_bot.delete_message = AsyncMock()
+    clock = FakeClock()
+    writer = StreamingMessageWriter(mock_bot, chat_id=1, message_id=10, message_limit=20, clock=clock)
+    plan = "### День 1\n**Жим** — 4×8"
+
+    await writer.append(plan)
+    await writer.finalize(plan)
+
+    final_edit = mock_bot.edit_message_text.call_args.kwargs
+    assert final_edit["message_id"] == 10 and final_edit["parse_mode"] == "HTML"
+    assert final_edit["text"] == "<b>День 1</b>\n<b>Жим</b> — 4×8"
+    mock_bot.delete_message.assert_called_once_with(chat_id=1, message_id=101)
+    assert writer.message_ids == [10]
+
+
+@pytest.mark.asyncio
+async def test_finalize_falls_back_to_plain_text(mock_bot):
+    """A page whose HTML Telegram rejects is shown as plain text."""
+    clock = FakeClock()
+    writer = StreamingMessageWriter(mock_bot, chat_id=1, message_id=10, clock=clock)
+    await writer.append("**Жим**")
+    mock_bot.edit_message_text.side_effect = [BadRequest("Can't parse entities"), None]
+
+    await writer.finalize("**Жим**")
+
+    plain = mock_bot.edit_message_text.call_args.kwargs
+    assert plain["text"] == "Жим" and plain["parse_mode"] is None
@@ -1,24 +1,43 @@
 """Tests for workflow_handler.py"""
 
-import pytest
+import asyncio
+from dataclasses import replace
+from datetime import datetime
 from unittest.mock import AsyncMock, MagicMock, patch
-from telegram import Update, CallbackQuery, Message, Chat, User
+
+import pytest
+from telegram import CallbackQuery, Chat, Message, MessageEntity, Update, User
 from telegram.ext import ContextTypes
-from ai_gym_bro.handlers.workflow_handler import (
-    received_goal,
-    process_refinement_input,
-    AWAITING_REFINEMENT_CHOICE,
-    ConversationHandler,
-)
+
+from ai_gym_bro.config import Settings
 from ai_gym_bro.handlers.common import (
+    FAT_LOSS,
+    GOAL_OPTIONS,
+    MUSCLE_GAIN,
     USER_DATA_GOAL,
-    USER_DATA_PLAN,
     USER_DATA_HISTORY,
+    USER_DATA_PLAN,
+    USER_DATA_PLAN_WEEKS,
     USER_DATA_REFINEMENT_TYPE,
-    POWERLIFTING,
-    ASK_QUESTION_CALLBACK,
-    MODIFY_PLAN_CALLBACK,
 )
+from ai_gym_bro.handlers.start_handler import start
+from ai_gym_bro.handlers.workflow_handler import (
+    AWAITING_REFINEMENT_CHOICE,
+    AWAITING_REFINEMENT_INPUT,
+    GENERATING_PLAN,
+    SELECT_GOAL,
+    ConversationHandler,
+    create_workflow_handler,
+    plan_in_progress,
+    process_refinement_input,
+    received_goal,
+    received_injuries,
+    show_week,
+)
+from ai_gym_bro.services.inflight import InflightCalls
+from ai_gym_bro.services.plan_patch import PatchError, PlanModification
+from ai_gym_bro.services.plan_queue import PlanJobQueue
+from ai_gym_bro.services.speculation import SpeculativePlans
 
 # Test data
 TEST_USER_DATA = {
@@ -29,9 +48,10 @@ TEST_USER_DATA = {
     "bench": "145",
     "deadlift": "200",
     "injuries": "no",
-    "goal": POWERLIFTING,
+    "goal": MUSCLE_GAIN,
 }
 
+
 @pytest.fixture
 def mock_update():
     """Create a mock Update object."""
@@ -42,6 +62,7 @@ def mock_update():
     update.effective_chat.id = 123456
     return update
 
+
 @pytest.fixture
 def mock_context():
     """Create a mock Context object."""
@@ -51,15 +72,17 @@ def mock_context():
     context.bot.send_message = AsyncMock()
     return context
 
+
 @pytest.fixture
 def mock_callback_query():
     """Create a mock CallbackQuery object."""
     query = MagicMock(spec=CallbackQuery)
-    query.data = POWERLIFTING
+    query.data = MUSCLE_GAIN
     query.answer = AsyncMock()
     query.edit_message_text = AsyncMock()
     return query
 
+
 @pytest.fixture
 def mock_message():
     """Create a mock Message object."""
@@ -68,77 +91,79 @@ def mock_message():
     message.reply_text = AsyncMock()
     return message
 
+
 @pytest.mark.asyncio
 async def test_received_goal_success(mock_update, mock_context, mock_callback_query):
     """Test successful goal selection and plan generation."""
     # Setup
     mock_update.callback_query = mock_callback_query
     mock_context.user_data.update(TEST_USER_DATA)
-    
+
     # Mock the openai_service response
     mock_plan = "Your personalized powerlifting plan:\nWeek 1: ..."
     mock_history = [{"role": "assistant", "content": mock_plan}]
-    
+
     with patch("ai_gym_bro.handlers.workflow_handler.openai_service.generate_plan") as mock_generate:
         mock_generate.return_value = (mock_plan, mock_history)
-        
+
         # Execute
         result = await received_goal(mock_update, mock_context)
-        
+
         # Verify
         assert result == AWAITING_REFINEMENT_CHOICE
-        assert mock_context.user_data[USER_DATA_GOAL] == POWERLIFTING
+        assert mock_context.user_data[USER_DATA_GOAL] == MUSCLE_GAIN
         assert mock_context.user_data[USER_DATA_PLAN] == mock_plan
         assert mock_context.user_data[USER_DATA_HISTORY] == mock_history
-        
+
         # Verify bot interactions
         mock_callback_query.answer.assert_called_once()
         mock_callback_query.edit_message_text.assert_called_once()
         assert mock_context.bot.send_message.call_count >= 2  # Plan message + options message
 
+
 @pytest.mark.asyncio
 async def test_received_goal_failure(mock_update, mock_context, mock_callback_query):
     """Test goal selection with failed plan generation."""
     # Setup
     mock_update.callback_query = mock_callback_query
     mock_context.user_data.update(TEST_USER_DATA)
-    
+
     # Mock the openai_service failure
     with patch("ai_gym_bro.handlers.workflow_handler.openai_service.generate_plan") as mock_generate:
         mock_generate.return_value = (None, None)
-        
+
         # Execute
         result = await received_goal(mock_update, mock_context)
-        
+
         # Verify
         assert result == ConversationHandler.END
         assert not mock_context.user_data  # Should be cleared on failure
         mock_context.bot.send_message.assert_called_once()
 
+
 @pytest.mark.asyncio
 async def test_process_refinement_input_success(mock_update, mock_context, mock_message):
     """Test successful refinement request processing."""
     # Setup
     mock_update.message = mock_message
-    mock_context.user_data.update({
-        USER_DATA_HISTORY: [{"role": "assistant", "content": "Initial plan"}],
-        USER_DATA_REFINEMENT_TYPE: "modify"
-    })
-    
+    mock_context.user_data.update(
+        {USER_DATA_HISTORY: [{"role": "assistant", "content": "Initial plan"}], USER_DATA_REFINEMENT_TYPE: "modify"}
+    )
+
     # Mock the openai_service response
     mock_response = "I've modified the plan to include more deadlift volume..."
     mock_new_history = [
         {"role": "assistant", "content": "Initial plan"},
         {"role": "user", "content": mock_message.text},
-        {"role": "assistant", "content": mock_response}
+        {"role": "assistant", "content": mock_response},
     ]
-    
+
     with patch("ai_gym_bro.handlers.workflow_handler.openai_service.refine_plan") as mock_refine:
         mock_refine.return_value = (mock_response, mock_new_history)
-        
+
         # Execute
         result = await process_refinement_input(mock_update, mock_context)
-        
+
         # Verify
         assert result == AWAITING_REFINEMENT_CHOICE
         assert mock_context.user_data[USER_DATA_HISTORY] == mock_new_history
@@ -148,43 +173,306 @@ async def test_process_refinement_input_success(mock_update, mock_context, mock_
         # 3. For "What would you like to do next?"
         assert mock_message.reply_text.call_count >= 3
 
+
 @pytest.mark.asyncio
 async def test_process_refinement_input_no_history(mock_update, mock_context, mock_message):
     """Test refinement request with missing history."""
     # Setup
     mock_update.message = mock_message
-    mock_context.user_data.update({
-        USER_DATA_REFINEMENT_TYPE: "modify"
-    })  # No history
-    
+    mock_context.user_data.update({USER_DATA_REFINEMENT_TYPE: "modify"})  # No history
+
     # Execute
     result = await process_refinement_input(mock_update, mock_context)
-    
+
     # Verify
     assert result == ConversationHandler.END
     assert not mock_context.user_data  # Should be cleared
     mock_message.reply_text.assert_called_once()
 
+
 @pytest.mark.asyncio
 async def test_process_refinement_input_failure(mock_update, mock_context, mock_message):
     """Test refinement request with failed processing."""
     # Setup
     mock_update.message = mock_message
-    mock_context.user_data.update({
-        USER_DATA_HISTORY: [{"role": "assistant", "content": "Initial plan"}],
-        USER_DATA_REFINEMENT_TYPE: "modify"
-    })
-    
+    mock_context.user_data.update(
+        {USER_DATA_HISTORY: [{"role": "assistant", "content": "Initial plan"}], USER_DATA_REFINEMENT_TYPE: "modify"}
+    )
+
     # Mock the openai_service failure
     with patch("ai_gym_bro.handlers.workflow_handler.openai_service.refine_plan") as mock_refine:
         mock_refine.return_value = (None, None)
-        
+
         # Execute
         result = await process_refinement_input(mock_update, mock_context)
-        
+
         # Verify
         assert result == AWAITING_REFINEMENT_CHOICE  # Should return to choice state
         # Check that reply_text was called at least twice:
         # 1. For "Got it. Thinking about your request... 🤔"
         # 2. For the error message with options
-        assert mock_message.reply_text.call_count >= 2 
\ No newline at end of file
+        assert mock_message.reply_text.call_count >= 2
+
+
+@pytest.mark.asyncio
+async def test_process_refinement_input_modify_applies_patch(mock_update, mock_context, mock_message):
+    """A modification updates the stored plan and sends only the summary and changed sections."""
+    mock_update.message = mock_message
+    mock_context.user_data.update(
+        {
+            USER_DATA_PLAN: "### День 1\nСтановая тяга — 3×5",
+            USER_DATA_HISTORY: [{"role": "assistant", "ref": "plan"}],
+            USER_DATA_REFINEMENT_TYPE: "modify",
+        }
+    )
+    modification = PlanModification(
+        "### День 1\nСтановая тяга — 5×5", "Объем тяги увеличен.", ("### День 1\nСтановая тяга — 5×5",)
+    )
+    new_history = [{"role": "assistant", "ref": "plan"}, {"role": "assistant", "content": "Объем тяги увеличен."}]
+
+    with (
+        patch("ai_gym_bro.handlers.workflow_handler.openai_service.modify_plan", new_callable=AsyncMock) as mock_modify,
+        patch("ai_gym_bro.handlers.workflow_handler.openai_service.refine_plan") as mock_refine,
+    ):
+        mock_modify.return_value = (modification, new_history)
+
+        result = await process_refinement_input(mock_update, mock_context)
+
+    assert result == AWAITING_REFINEMENT_CHOICE
+    assert mock_context.user_data[USER_DATA_PLAN] == "### День 1\nСтановая тяга — 5×5"
+    assert mock_context.user_data[USER_DATA_HISTORY] == new_history
+    sent = " ".join(str(call.kwargs.get("text", call.args)) for call in mock_message.reply_text.call_args_list)
+    assert "Объем тяги увеличен." in sent and "5×5" in sent
+    mock_refine.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_process_refinement_input_invalid_patch_falls_back(mock_update, mock_context, mock_message):
+    """An invalid patch leaves the plan as is and answers with a free-text refinement."""
+    mock_update.message = mock_message
+    mock_context.user_data.update(
+        {
+            USER_DATA_PLAN: "### День 1\nСтановая тяга — 3×5",
+            USER_DATA_HISTORY: [{"role": "assistant", "ref": "plan"}],
+            USER_DATA_REFINEMENT_TYPE: "modify",
+        }
+    )
+
+    with (
+        patch("ai_gym_bro.handlers.workflow_handler.openai_service.modify_plan", new_callable=AsyncMock) as mock_modify,
+        patch("ai_gym_bro.handlers.workflow_handler.openai_service.refine_plan", new_callable=AsyncMock) as mock_refine,
+    ):
+        mock_modify.side_effect = PatchError("Patch is not valid JSON")
+        mock_refine.return_value = ("Добавьте два подхода тяги.", [{"role": "assistant", "ref": "plan"}])
+
+        result = await process_refinement_input(mock_update, mock_context)
+
+    assert result == AWAITING_REFINEMENT_CHOICE
+    assert mock_context.user_data[USER_DATA_PLAN] == "### День 1\nСтановая тяга — 3×5"
+    mock_refine.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_process_refinement_input_answers_weight_question_locally(mock_update, mock_context, mock_message):
+    """A question about the plan's weights is answered from the stored plan without calling OpenAI."""
+    mock_message.text = "Сколько кг на 2 неделе?"
+    mock_update.message = mock_message
+    mock_context.user_data.update(
+        {
+            USER_DATA_PLAN: "### День 1\n**Основная часть:**\nЖим штанги лежа — 4×8×70% (70/75)",
+            USER_DATA_HISTORY: [{"role": "assistant", "ref": "plan"}],
+            USER_DATA_REFINEMENT_TYPE: "ask",
+            "bench": "100 кг",
+        }
+    )
+
+    with patch("ai_gym_bro.handlers.workflow_handler.openai_service.refine_plan") as mock_refine:
+        result = await process_refinement_input(mock_update, mock_context)
+
+    assert result == AWAITING_REFINEMENT_CHOICE
+    sent = " ".join(str(call.kwargs.get("text", call.args)) for call in mock_message.reply_text.call_args_list)
+    assert "75 кг" in sent
+    assert mock_context.user_data[USER_DATA_HISTORY][-1]["role"] == "assistant"
+    mock_refine.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_received_goal_takes_over_speculative_plan(mock_update, mock_context, mock_callback_query, mock_message):
+    """With speculation on, both goals' plans start after the injuries and the picked one is used."""
+    mock_message.text = "Нет"
+    mock_update.message = mock_message
+    mock_update.callback_query = mock_callback_query
+    mock_callback_query.data = FAT_LOSS
+    mock_context.user_data.update({key: value for key, value in TEST_USER_DATA.items() if key != "goal"})
+    plans = SpeculativePlans(max_in_flight=4, ttl=60)
+    settings = replace(Settings(), speculation_enabled=True, plan_queue_enabled=False, stream_plan=False)
+
+    async def generate_plan(profile, on_delta=None):
+        return f"План: {profile['goal']}", [{"role": "assistant", "ref": "plan"}]
+
+    with (
+        patch("ai_gym_bro.handlers.workflow_handler.get_settings", return_value=settings),
+        patch("ai_gym_bro.handlers.workflow_handler.get_speculative_plans", return_value=plans),
+        patch("ai_gym_bro.services.speculation.get_plan_queue", return_value=MagicMock(depth=0)),
+        patch(
+            "ai_gym_bro.handlers.workflow_handler.openai_service.generate_plan", side_effect=generate_plan
+        ) as mock_generate,
+    ):
+        await received_injuries(mock_update, mock_context)
+        await asyncio.sleep(0)  # The user reads the goal keyboard
+        result = await received_goal(mock_update, mock_context)
+
+    assert result == AWAITING_REFINEMENT_CHOICE
+    assert mock_context.user_data[USER_DATA_PLAN] == f"План: {FAT_LOSS}"
+    assert sorted(call.args[0]["goal"] for call in mock_generate.call_args_list) == sorted(GOAL_OPTIONS)
+
+
+@pytest.mark.asyncio
+async def test_show_week_generates_the_missing_week_once(mock_update, mock_context, mock_message):
+    """/week 2 of a plan with week 1 only generates week 2, stores it and shows it; the next time it is local."""
+    mock_update.message = mock_message
+    mock_update.callback_query = None
+    mock_context.args = ["2"]
+    plan = "### День 1\n\n**Основная часть:**\nЖим штанги лежа — 4×8×65%"
+    two_weeks = "### День 1\n\n**Основная часть:**\nЖим штанги лежа — 4×8×65% (65/70)"
+    mock_context.user_data.update({USER_DATA_PLAN: plan, USER_DATA_PLAN_WEEKS: 1, "bench": "100"})
+
+    with patch(
+        "ai_gym_bro.handlers.workflow_handler.openai_service.generate_weeks", AsyncMock(return_value=two_weeks)
+    ) as mock_generate:
+        await show_week(mock_update, mock_context)
+        await show_week(mock_update, mock_context)
+
+    mock_generate.assert_awaited_once_with(mock_generate.call_args.args[0], plan, 1, 2)
+    assert mock_context.user_data[USER_DATA_PLAN] == two_weeks
+    assert mock_context.user_data[USER_DATA_PLAN_WEEKS] == 2
+    sent = [str(call.kwargs.get("text", call.args)) for call in mock_message.reply_text.call_args_list]
+    assert sum("Жим штанги лежа — 4×8×70% (≈70 кг)" in text for text in sent) == 2
+
+
+@pytest.mark.asyncio
+async def test_received_goal_stops_when_the_generation_is_cancelled(mock_update, mock_context, mock_callback_query):
+    """/cancel during generation cancels the OpenAI call; the handler stores nothing and sends no error."""
+    mock_update.callback_query = mock_callback_query
+    mock_callback_query.edit_message_text = AsyncMock(return_value=True)
+    mock_context.user_data.update(TEST_USER_DATA)
+    calls = InflightCalls()
+    settings = replace(Settings(), speculation_enabled=False, plan_queue_enabled=False, stream_plan=False)
+    started = asyncio.Event()
+
+    async def generate_plan(profile, on_delta=None):
+        started.set()
+        await asyncio.Event().wait()
+
+    with (
+        patch("ai_gym_bro.handlers.workflow_handler.get_settings", return_value=settings),
+        patch("ai_gym_bro.handlers.workflow_handler.get_inflight_calls", return_value=calls),
+        patch("ai_gym_bro.handlers.workflow_handler.openai_service.generate_plan", side_effect=generate_plan),
+    ):
+        handler = asyncio.create_task(received_goal(mock_update, mock_context))
+        await started.wait()
+        assert calls.cancel(mock_update.effective_user.id) == 1
+        result = await handler
+
+    assert result == SELECT_GOAL
+    assert USER_DATA_PLAN not in mock_context.user_data
+    mock_context.bot.send_message.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_received_goal_regenerates_when_the_speculative_plan_fails(
+    mock_update, mock_context, mock_callback_query, mock_message
+):
+    """A speculative plan that ends without a plan falls back to a normal generation and keeps the profile."""
+    mock_message.text = "Нет"
+    mock_update.message = mock_message
+    mock_update.callback_query = mock_callback_query
+    mock_callback_query.data = FAT_LOSS
+    mock_context.user_data.update({key: value for key, value in TEST_USER_DATA.items() if key != "goal"})
+    plans = SpeculativePlans(max_in_flight=4, ttl=60)
+    settings = replace(Settings(), speculation_enabled=True, plan_queue_enabled=False, stream_plan=False)
+    release = asyncio.Event()
+    results = iter([(None, []), (None, []), (f"План: {FAT_LOSS}", [{"role": "assistant", "ref": "plan"}])])
+
+    async def generate_plan(profile, on_delta=None):
+        result = next(results)
+        if result[0] is None:
+            await release.wait()  # The speculative plans fail only once the goal is picked
+        return result
+
+    with (
+        patch("ai_gym_bro.handlers.workflow_handler.get_settings", return_value=settings),
+        patch("ai_gym_bro.handlers.workflow_handler.get_speculative_plans", return_value=plans),
+        patch("ai_gym_bro.services.speculation.get_plan_queue", return_value=MagicMock(depth=0)),
+        patch(
+            "ai_gym_bro.handlers.workflow_handler.openai_service.generate_plan", side_effect=generate_plan
+        ) as mock_generate,
+    ):
+        await received_injuries(mock_update, mock_context)
+        await asyncio.sleep(0)
+        handler = asyncio.create_task(received_goal(mock_update, mock_context))
+        await asyncio.sleep(0.01)
+        release.set()
+        result = await handler
+
+    assert result == AWAITING_REFINEMENT_CHOICE
+    assert mock_context.user_data[USER_DATA_PLAN] == f"План: {FAT_LOSS}"
+    assert mock_context.user_data["age"] == TEST_USER_DATA["age"]
+    assert mock_generate.call_count == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("outcome", [(None, ConversationHandler.END), ("План на неделю", AWAITING_REFINEMENT_CHOICE)])
+async def test_message_after_a_queued_plan_moves_to_the_state_the_job_ended_in(
+    mock_update, mock_context, mock_callback_query, mock_message, outcome
+):
+    """Once the queued job is done, the next message leaves GENERATING_PLAN for the state the job returned."""
+    plan, state = outcome
+    mock_update.callback_query = mock_callback_query
+    mock_update.message = mock_message
+    mock_context.user_data.update(TEST_USER_DATA)
+    queue = PlanJobQueue(workers=1, max_depth=5)
+    await queue.start()
+    settings = replace(Settings(), speculation_enabled=False, plan_queue_enabled=True, stream_plan=False)
+    release = asyncio.Event()
+
+    async def generate_plan(profile, on_delta=None):
+        await release.wait()
+        return plan, []
+
+    with (
+        patch("ai_gym_bro.handlers.workflow_handler.get_settings", return_value=settings),
+        patch("ai_gym_bro.handlers.workflow_handler.get_plan_queue", return_value=queue),
+        patch("ai_gym_bro.handlers.workflow_handler.openai_service.generate_plan", side_effect=generate_plan),
+    ):
+        assert await received_goal(mock_update, mock_context) == GENERATING_PLAN
+        await asyncio.sleep(0)
+        assert await plan_in_progress(mock_update, mock_context) == GENERATING_PLAN
+
+        release.set()
+        await asyncio.wait_for(queue._queue.join(), timeout=1)
+        result = await plan_in_progress(mock_update, mock_context)
+    await queue.stop()
+
+    assert result == state
+    assert "/start" in mock_message.reply_text.call_args.args[0]  # Text is not expected in either state
+    assert mock_context.user_data.get(USER_DATA_PLAN) == plan
+
+
+@pytest.mark.parametrize("state", [SELECT_GOAL, GENERATING_PLAN, AWAITING_REFINEMENT_INPUT])
+def test_start_restarts_from_the_generating_states(state):
+    """/start during a generation restarts instead of getting the unknown command reply."""
+    handler = create_workflow_handler()
+    message = Message(
+        message_id=1,
+        date=datetime.now(),
+        chat=Chat(id=1, type=Chat.PRIVATE),
+        from_user=User(id=1, first_name="Test", is_bot=False),
+        text="/start",
+        entities=[MessageEntity(type=MessageEntity.BOT_COMMAND, offset=0, length=6)],
+    )
+    update = Update(update_id=1, message=message)
+
+    matched = next(h for h in handler.states[state] + handler.fallbacks if h.check_update(update))
+
+    assert matched.callback is start
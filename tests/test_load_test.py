@@ -0,0 +1,34 @@
+"""Smoke test of the load-test harness in benchmarks/load_test.py"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_load_test_drives_users_through_the_whole_flow(tmp_path):
+    """A few simulated users complete the conversation and every stage is reported."""
+    results = tmp_path / "results.json"
+    # Own process: the OpenAI client is created when the bot is imported, pointed at the fake
+    env = {**os.environ, "TELEGRAM_CHAT_RATE": "1000", "TELEGRAM_CHAT_BURST": "1000", "STREAM_EDIT_INTERVAL": "0.05"}
+    env.pop("OPENAI_API_KEY", None)
+    options = "--users 3 --refinements 1 --ramp 0 --think-time 0 --openai-latency 0.01 --timeout 20".split()
+    subprocess.run(
+        [sys.executable, "-m", "benchmarks.load_test", *options, "--json", str(results)],
+        cwd=ROOT,
+        env=env,
+        check=True,
+        capture_output=True,
+        timeout=90,
+    )
+
+    result = json.loads(results.read_text())
+    assert result["completed"] == 3
+    assert result["errors"] == {}
+    stages = "start age height weight experience bench injuries goal_ack plan refine_choice refine".split()
+    assert set(result["stages"]) == set(stages)
+    assert result["stages"]["refine"]["count"] == 3
+    assert result["openai_requests"] == 6
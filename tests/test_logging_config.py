@@ -0,0 +1,73 @@
+"""Tests for logging_config.py"""
+
+import json
+import sys
+from dataclasses import replace
+from unittest.mock import MagicMock, patch
+
+import pytest
+from loguru import logger
+
+from ai_gym_bro import logging_config
+from ai_gym_bro.config import Settings
+
+
+@pytest.fixture
+def restore_logger():
+    yield
+    logger.remove()
+    logger.add(sys.stderr)
+
+
+def _with_sample_rate(rate):
+    return patch.object(logging_config, "get_settings", return_value=replace(Settings(), log_payload_sample_rate=rate))
+
+
+def test_payload_is_not_built_when_not_sampled():
+    """With sampling off the payload callable is never called."""
+    payload = MagicMock(return_value={"age": 30})
+
+    with _with_sample_rate(0.0):
+        logging_config.log_payload("Profile", payload)
+
+    payload.assert_not_called()
+
+
+def test_payload_is_not_built_when_debug_is_disabled(restore_logger):
+    """A sampled payload is still not built if no sink accepts DEBUG."""
+    payload = MagicMock(return_value={"age": 30})
+    logger.remove()
+    logger.add(lambda message: None, level="INFO")
+
+    with _with_sample_rate(1.0):
+        logging_config.log_payload("Profile", payload)
+
+    payload.assert_not_called()
+
+
+def test_payload_is_logged_when_sampled(restore_logger):
+    """A sampled payload is formatted into a DEBUG record."""
+    messages = []
+    logger.remove()
+    logger.add(messages.append, level="DEBUG", format="{message}")
+
+    with _with_sample_rate(1.0):
+        logging_config.log_payload("Profile", lambda: {"age": 30})
+
+    assert messages == ["Profile: {'age': 30}\n"]
+
+
+def test_log_file_is_json_lines_with_bound_fields(tmp_path, restore_logger):
+    """The file sink writes one JSON object per record, with bound fields under extra."""
+    log_file = tmp_path / "bot.log"
+    settings = replace(Settings(), log_level="ERROR", log_file=str(log_file), log_file_level="INFO")
+
+    logging_config.setup_logging(settings)
+    logger.bind(user_id=42, latency=0.5).info("OpenAI answered")
+    logger.debug("not written")
+    logger.complete()
+    logger.remove()  # Flushes the background writer
+
+    records = [json.loads(line)["record"] for line in log_file.read_text().splitlines()]
+    assert [record["message"] for record in records] == ["OpenAI answered"]
+    assert records[0]["extra"] == {"user_id": 42, "latency": 0.5}
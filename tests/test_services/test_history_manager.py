@@ -0,0 +1,88 @@
+"""Tests for history_manager.py"""
+
+import pytest
+
+from ai_gym_bro.services.history_manager import SUMMARY_PREFIX, HistoryManager, split_history
+from ai_gym_bro.services.token_estimator import estimate_message_tokens
+
+PINNED = [
+    {"role": "system", "content": "plan prompt"},
+    {"role": "system", "content": "profile"},
+    {"role": "assistant", "content": "PLAN"},
+]
+
+
+def make_history(turns, answer_size=10):
+    """Create a history with the pinned prefix followed by `turns` question/answer pairs."""
+    history = list(PINNED)
+    for i in range(turns):
+        history.append({"role": "user", "content": f"q{i}"})
+        history.append({"role": "assistant", "content": f"a{i}" + "x" * answer_size})
+    return history
+
+
+def test_split_history_separates_plan_from_turns():
+    """The pinned prefix ends with the plan, each turn starts with a user message."""
+    pinned, turns = split_history([*make_history(2), {"role": "user", "content": "current"}])
+
+    assert pinned == PINNED
+    assert [turn[0]["content"] for turn in turns] == ["q0", "q1", "current"]
+
+
+def test_build_messages_keeps_pinned_and_last_turns():
+    """Only the last K turns are sent verbatim, the plan is always included."""
+    manager = HistoryManager(token_budget=10_000, keep_turns=2, summary_batch_turns=2)
+    history = [*make_history(5), {"role": "user", "content": "current"}]
+
+    messages = manager.build_messages(history)
+
+    assert messages[:3] == PINNED
+    assert [m["content"] for m in messages[3:]] == ["q4", "a4" + "x" * 10, "current"]
+
+
+def test_build_messages_includes_summary_and_skips_summarized_turns():
+    """Summarized turns are replaced by one system message with the summary."""
+    manager = HistoryManager(token_budget=10_000, keep_turns=10, summary_batch_turns=2)
+    history = [*make_history(3), {"role": "user", "content": "current"}]
+
+    messages = manager.build_messages(history, {"text": "old stuff", "turns": 2})
+
+    assert messages[3] == {"role": "system", "content": SUMMARY_PREFIX + "old stuff"}
+    assert [m["content"] for m in messages[4:]] == ["q2", "a2" + "x" * 10, "current"]
+
+
+def test_prompt_size_stays_flat_as_conversation_grows():
+    """With a tight budget, long turns are dropped and the prompt size stops growing."""
+    manager = HistoryManager(token_budget=300, keep_turns=10, summary_batch_turns=2)
+    sizes = [
+        estimate_message_tokens(manager.build_messages([*make_history(n, 300), {"role": "user", "content": "q"}]))
+        for n in (5, 50, 500)
+    ]
+
+    assert max(sizes) <= 300
+    assert max(sizes) - min(sizes) < 10  # Only the digits in the turn numbers differ
+
+
+def test_turns_to_summarize_waits_for_full_batch():
+    """Turns are folded only when a whole batch has left the verbatim window."""
+    manager = HistoryManager(token_budget=10_000, keep_turns=2, summary_batch_turns=2)
+
+    assert manager.turns_to_summarize(make_history(3)) == []
+    assert len(manager.turns_to_summarize(make_history(4))) == 2
+    assert manager.turns_to_summarize(make_history(4), {"text": "s", "turns": 2}) == []
+
+
+@pytest.mark.asyncio
+async def test_fold_extends_summary():
+    """fold() passes the previous summary and pending turns to the summarizer."""
+    manager = HistoryManager(token_budget=10_000, keep_turns=1, summary_batch_turns=1)
+    calls = []
+
+    async def summarize(previous, messages):
+        calls.append((previous, [m["content"] for m in messages]))
+        return "new summary"
+
+    summary = await manager.fold(make_history(3, answer_size=0), {"text": "old", "turns": 1}, summarize)
+
+    assert calls == [("old", ["q1", "a1"])]
+    assert summary == {"text": "new summary", "turns": 2}
@@ -0,0 +1,57 @@
+"""Tests for history_store.py"""
+
+import pickle
+
+from ai_gym_bro.services.history_store import compact_history, compact_message, expand_history
+from ai_gym_bro.services.prompts import PLAN_GENERATION_PROMPT_ID, SYSTEM_PROMPT_PLAN_GENERATION
+
+PLAN = "**День 1**\n" + "Жим лежа — 3×10×70% (70/72/75/77/65)\n" * 200
+
+
+def make_history():
+    """Create a full history as built by generate_plan and refine_plan."""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT_PLAN_GENERATION},
+        {"role": "system", "content": "profile"},
+        {"role": "assistant", "content": PLAN},
+        {"role": "user", "content": "Можно заменить жим?"},
+        {"role": "assistant", "content": "Да, " + "гантели " * 300},
+    ]
+
+
+def test_prompts_and_plan_are_stored_by_reference():
+    """Registered prompts become ids and the plan becomes a reference."""
+    compact = compact_history(make_history(), PLAN)
+
+    assert compact[0] == {"role": "system", "prompt_id": PLAN_GENERATION_PROMPT_ID}
+    assert compact[1] == {"role": "system", "content": "profile"}
+    assert compact[2] == {"role": "assistant", "ref": "plan"}
+    assert compact[3] == {"role": "user", "content": "Можно заменить жим?"}
+    assert "zlib" in compact[4]
+
+
+def test_round_trip_restores_full_messages():
+    """Expanding a compact history gives back the original messages."""
+    history = make_history()
+
+    assert expand_history(compact_history(history, PLAN), PLAN) == history
+
+
+def test_plain_entries_are_accepted():
+    """Histories saved in the old full format expand unchanged."""
+    history = make_history()
+
+    assert expand_history(history, PLAN) == history
+
+
+def test_compact_history_is_much_smaller_at_rest():
+    """The pickled compact history is a fraction of the full one."""
+    full = pickle.dumps(make_history())
+    compact = pickle.dumps(compact_history(make_history(), PLAN))
+
+    assert len(compact) * 10 < len(full)
+
+
+def test_short_messages_stay_plain():
+    """Compression is skipped for short messages."""
+    assert compact_message({"role": "assistant", "content": "ok"}) == {"role": "assistant", "content": "ok"}
@@ -0,0 +1,84 @@
+"""Tests for inflight.py"""
+
+import asyncio
+
+import pytest
+
+from ai_gym_bro.metrics import GENERATION_CALLS
+from ai_gym_bro.services.inflight import CallCancelledError, InflightCalls, fingerprint
+
+
+def test_fingerprint_is_stable_and_order_independent_for_dicts():
+    assert fingerprint("plan", {"age": "30", "goal": "mass"}) == fingerprint("plan", {"goal": "mass", "age": "30"})
+    assert fingerprint("plan", {"goal": "mass"}) != fingerprint("plan", {"goal": "cut"})
+
+
+@pytest.mark.asyncio
+async def test_duplicate_request_joins_the_call_in_flight():
+    """The same request while in flight gets the first call's result instead of a second call."""
+    calls = InflightCalls()
+    release = asyncio.Event()
+    started = []
+
+    async def generate(name):
+        started.append(name)
+        await release.wait()
+        return name
+
+    coalesced = GENERATION_CALLS.labels("coalesced")
+    before = coalesced._value.get()
+    first = asyncio.create_task(calls.run(1, "plan", lambda: generate("first")))
+    second = asyncio.create_task(calls.run(1, "plan", lambda: generate("second")))
+    other_user = asyncio.create_task(calls.run(2, "plan", lambda: generate("other")))
+    await asyncio.sleep(0)
+    assert calls.in_flight(1, "plan")
+
+    release.set()
+    assert await asyncio.gather(first, second, other_user) == ["first", "first", "other"]
+    assert started == ["first", "other"]
+    assert coalesced._value.get() == before + 1
+    assert not calls.in_flight(1, "plan")
+    assert await calls.run(1, "plan", lambda: generate("again")) == "again"  # Done calls are not reused
+
+
+@pytest.mark.asyncio
+async def test_cancel_stops_the_users_calls_and_counts_them_wasted():
+    """Cancelling a user cancels their calls; every waiter gets CallCancelledError."""
+    calls = InflightCalls()
+    never = asyncio.Event()
+
+    async def generate():
+        await never.wait()
+
+    wasted = GENERATION_CALLS.labels("wasted")
+    before = wasted._value.get()
+    waiters = [asyncio.create_task(calls.run(1, key, generate)) for key in ("plan", "plan", "weeks")]
+    await asyncio.sleep(0)
+
+    assert calls.cancel(1) == 2
+    for waiter in waiters:
+        with pytest.raises(CallCancelledError):
+            await waiter
+    assert wasted._value.get() == before + 2
+    assert calls.cancel(1) == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelling_a_waiter_leaves_the_call_running():
+    """A waiter that goes away does not cancel the call others may still wait for."""
+    calls = InflightCalls()
+    release = asyncio.Event()
+
+    async def generate():
+        await release.wait()
+        return "plan"
+
+    waiter = asyncio.create_task(calls.run(1, "plan", generate))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    assert calls.in_flight(1, "plan")
+    release.set()
+    assert await calls.run(1, "plan", generate) == "plan"
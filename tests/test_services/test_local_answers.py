@@ -0,0 +1,107 @@
+"""Tests for local_answers.py"""
+
+import pytest
+
+from ai_gym_bro.metrics import LOCAL_ANSWERS
+from ai_gym_bro.services.local_answers import answer_locally, classify, round_to_plates
+
+PLAN = """### День 1 — Грудь и спина
+
+**Разминка:**
+Отжимания — 2×15
+
+**Основная часть:**
+Жим штанги лежа — 4×8×70% (70/72/75/77/65)
+Тяга штанги в наклоне — 4×10×65% (65/67/70/72/60)
+
+### День 2 — Ноги
+
+**Основная часть:**
+Приседания — 4×8×70% (70/72/75/77/65)
+
+### День 3 — Жимовой
+
+**Основная часть:**
+Жим лежа узким хватом
+- Неделя 1: 60% × 3 подходов × 10 повторений
+- Неделя 2: 62.5% × 3 подходов × 10 повторений
+- Неделя 3: 65% × 4 подходов × 8 повторений
+- Неделя 4: 67.5% × 4 подходов × 8 повторений
+- Неделя 5: 55% × 3 подходов × 10 повторений"""
+
+
+@pytest.mark.parametrize(
+    "question, kind, slots",
+    [
+        ("сколько кг это на 3 неделе?", "weight", {"week": 3}),
+        ("Какой вес на третьей неделе в день 1?", "weight", {"week": 3, "day": 1}),
+        ("что у меня во вторник?", None, {}),
+        ("Что в четверг на неделе 2?", None, {}),
+        ("покажи второй день", "day", {"day": 2}),
+        ("что на 4-й неделе", "week", {"week": 4}),
+        ("сколько кг в приседе на 3 неделе?", None, {}),
+        ("Почему на 5 неделе вес меньше?", None, {}),
+        ("Можно заменить жим лежа на жим гантелей?", None, {}),
+        ("Как долго отдыхать между подходами?", None, {}),
+    ],
+)
+def test_classify(question, kind, slots):
+    assert classify(question) == (kind, slots)
+
+
+def test_round_to_plates():
+    assert round_to_plates(71.2) == 70
+    assert round_to_plates(73.8) == 75
+
+
+def test_weight_for_a_week():
+    answer = answer_locally("сколько кг это на 3 неделе?", PLAN, 102)
+
+    assert "Ваш 1ПМ в жиме лежа: 102 кг" in answer
+    assert "**День 1, Жим штанги лежа:**\n- Неделя 3: 75% → **77.5 кг**, 4×8" in answer
+    assert "**День 3, Жим лежа узким хватом:**\n- Неделя 3: 65% → **67.5 кг**, 4×8" in answer
+    assert "Тяга" not in answer
+
+
+def test_weight_needs_the_bench_max():
+    assert answer_locally("сколько кг на 3 неделе?", PLAN, None) is None
+
+
+def test_day_shows_the_loads_of_the_week():
+    answer = answer_locally("что у меня в день 2 на 2 неделе?", PLAN, 100)
+
+    assert answer.startswith("**День 2 — Ноги** (неделя 2)")
+    assert "Приседания — 4×8×72%" in answer
+
+
+def test_weekday_falls_back():
+    """The plan has no weekdays, so they are not mapped onto its days."""
+    assert answer_locally("что у меня в среду на 2 неделе?", PLAN, 100) is None
+    assert answer_locally("что у меня во вторник?", PLAN, 100) is None
+
+
+def test_week_lists_every_day_with_kg_for_bench():
+    answer = answer_locally("что на 5 неделе", PLAN, 100)
+
+    assert answer.count("(неделя 5)") == 3
+    assert "Жим штанги лежа — 4×8×65% (≈65 кг)" in answer
+    assert "Жим лежа узким хватом — 3×10×55% (≈55 кг)" in answer
+    assert "Отжимания — 2×15" in answer
+
+
+def test_unknown_week_or_day_falls_back():
+    assert answer_locally("что на 7 неделе", PLAN, 100) is None
+    assert answer_locally("покажи день 6", PLAN, 100) is None
+    assert answer_locally("что на 2 неделе", "Свободный текст без структуры", 100) is None
+
+
+def test_hit_rate_counter():
+    answered = LOCAL_ANSWERS.labels("day", "answered")
+    fallback = LOCAL_ANSWERS.labels("other", "fallback")
+    answered_before, fallback_before = answered._value.get(), fallback._value.get()
+
+    answer_locally("покажи день 1", PLAN, 100)
+    answer_locally("Почему так много жима?", PLAN, 100)
+
+    assert answered._value.get() == answered_before + 1
+    assert fallback._value.get() == fallback_before + 1
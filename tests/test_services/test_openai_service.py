@@ -1,10 +1,26 @@
 """Tests for the OpenAI service layer, including API connectivity."""
 
+import json
 import os
+import time
+from dataclasses import replace
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
 import pytest
 from dotenv import load_dotenv
-from langfuse.openai import AsyncOpenAI
-from openai import OpenAIError
+from openai import AsyncOpenAI, OpenAIError
+
+from ai_gym_bro.config import Settings
+from ai_gym_bro.services import openai_service, tracing
+from ai_gym_bro.services.history_store import compact_history, expand_history
+from ai_gym_bro.services.plan_cache import PlanCache
+from ai_gym_bro.services.plan_model import parse_plan, render_plan
+from ai_gym_bro.services.plan_template import build_template_plan
+from ai_gym_bro.services.prompts import SYSTEM_PROMPT_FIRST_WEEK
+from ai_gym_bro.services.tracing import Tracer
+from ai_gym_bro.testing.fake_openai import FakeOpenAI
+from benchmarks.bench_fanout import plan_responder
 
 # Load environment variables for the test
 load_dotenv(override=True)
@@ -67,3 +83,294 @@ async def test_refine_plan_mocked():
     """Placeholder for testing refine_plan logic with mocked API calls."""
     # TODO: Implement test using mocks
     assert True
+
+
+class _FakeStream:
+    """Async iterator yielding OpenAI-like streaming chunks."""
+
+    def __init__(self, deltas):
+        self._chunks = [
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))]) for delta in deltas
+        ]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._chunks:
+            raise StopAsyncIteration
+        return self._chunks.pop(0)
+
+
+async def test_generate_plan_streams_deltas():
+    """Streaming mode forwards every delta and still returns the assembled plan and history."""
+    fake_client = MagicMock()
+    fake_client.chat.completions.create = AsyncMock(return_value=_FakeStream(["**День 1**", None, "\nЖим  "]))
+    received = []
+
+    async def on_delta(delta):
+        received.append(delta)
+
+    with patch.object(openai_service, "get_client", return_value=fake_client):
+        plan, history = await openai_service.generate_plan({"goal": "Набор мышечной массы"}, on_delta=on_delta)
+
+    assert received == ["**День 1**", "\nЖим  "]
+    assert plan == "**День 1**\nЖим"
+    assert expand_history(history, plan)[-1] == {"role": "assistant", "content": plan}
+    assert fake_client.chat.completions.create.call_args.kwargs["stream"] is True
+
+
+async def test_streamed_plan_is_traced_when_sampled(monkeypatch):
+    """A sampled call hands its output and time to first token to the trace exporter."""
+    fake_client = MagicMock()
+    fake_client.chat.completions.create = AsyncMock(return_value=_FakeStream(["**День 1**", "\nЖим"]))
+    exporter = MagicMock()
+    monkeypatch.setattr(tracing, "get_tracer", lambda: Tracer(exporter, sample_rates={"generate_plan_stream": 1.0}))
+
+    async def on_delta(delta):
+        pass
+
+    with (
+        patch.object(openai_service, "get_client", return_value=fake_client),
+        patch.object(openai_service, "_plan_cache_key", return_value=None),
+    ):
+        await openai_service.generate_plan({"goal": "Набор мышечной массы"}, on_delta=on_delta)
+
+    generation = exporter.submit.call_args.args[0][1]["body"]
+    assert generation["name"] == "generate_plan_stream"
+    assert generation["output"] == "**День 1**\nЖим"
+    assert "completionStartTime" in generation
+
+
+async def test_generate_plan_cache_hit_skips_openai():
+    """A cached plan for a similar profile is returned without calling the API."""
+    fake_client = MagicMock()
+    fake_client.chat.completions.create = AsyncMock()
+    cache = PlanCache()
+    profile = {"age": "30", "experience": "начинающий", "injuries": "нет", "goal": "Набор мышечной массы"}
+    await cache.put(openai_service._plan_cache_key(profile), "cached plan")
+
+    with (
+        patch.object(openai_service, "get_client", return_value=fake_client),
+        patch.object(openai_service, "get_plan_cache", return_value=cache),
+    ):
+        plan, history = await openai_service.generate_plan(profile)
+
+    assert plan == "cached plan"
+    assert expand_history(history, plan)[-1]["content"] == "cached plan"
+    fake_client.chat.completions.create.assert_not_called()
+
+
+def _template_settings():
+    return patch.object(openai_service, "get_settings", return_value=replace(Settings(), plan_template_enabled=True))
+
+
+async def test_generate_plan_from_template_without_injuries_skips_openai():
+    """Without injuries a profile the rules cover gets the template plan, with no API call."""
+    fake_client = MagicMock()
+    fake_client.chat.completions.create = AsyncMock()
+    deltas = []
+
+    async def on_delta(delta):
+        deltas.append(delta)
+
+    profile = {"experience": "начинающий", "injuries": "нет", "goal": "Набор мышечной массы"}
+    with patch.object(openai_service, "get_client", return_value=fake_client), _template_settings():
+        plan, history = await openai_service.generate_plan(profile, on_delta)
+
+    assert plan == render_plan(build_template_plan(profile))
+    assert deltas == [plan]
+    assert expand_history(history, plan)[-1]["content"] == plan
+    fake_client.chat.completions.create.assert_not_called()
+
+
+async def test_generate_plan_from_template_personalizes_for_injuries():
+    """With injuries the model only patches the numbered template plan."""
+    profile = {"experience": "начинающий", "injuries": "болит колено", "goal": "Набор мышечной массы"}
+    template = render_plan(build_template_plan(profile))
+    patch_text = json.dumps(
+        {
+            "summary": "Приседания заменены жимом ногами из-за колена.",
+            "ops": [{"op": "substitute", "find": "Приседания со штангой", "text": "Жим ногами"}],
+        }
+    )
+    fake_client = MagicMock()
+    fake_client.chat.completions.create = AsyncMock(
+        return_value=SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=patch_text))], usage=None)
+    )
+
+    with patch.object(openai_service, "get_client", return_value=fake_client), _template_settings():
+        plan, _ = await openai_service.generate_plan(profile)
+
+    kwargs = fake_client.chat.completions.create.call_args.kwargs
+    assert kwargs["max_tokens"] == openai_service.MAX_TOKENS_PERSONALIZATION
+    assert kwargs["messages"][-1]["content"].startswith("1| ### День 1")
+    assert plan.startswith("Приседания заменены жимом ногами из-за колена.")
+    assert "Приседания со штангой" not in plan and plan.endswith(template.split("\n")[-1])
+
+
+async def test_generate_plan_falls_back_to_full_generation_on_invalid_patch():
+    """An invalid personalization patch falls back to generating the plan in full."""
+    profile = {"experience": "начинающий", "injuries": "болит колено", "goal": "Набор мышечной массы"}
+    replies = ["not a patch", "Полный план"]
+    fake_client = MagicMock()
+    fake_client.chat.completions.create = AsyncMock(
+        side_effect=[
+            SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))], usage=None)
+            for reply in replies
+        ]
+    )
+
+    with patch.object(openai_service, "get_client", return_value=fake_client), _template_settings():
+        plan, _ = await openai_service.generate_plan(profile)
+
+    assert plan == "Полный план"
+    assert fake_client.chat.completions.create.await_count == 2
+
+
+def _fanout_settings():
+    settings = replace(Settings(), plan_fanout_enabled=True, plan_cache_enabled=False)
+    return patch.object(openai_service, "get_settings", return_value=settings)
+
+
+async def test_generate_plan_fanout_scales_with_the_longest_day():
+    """Fanned out, the days are written concurrently and merged in order, in the usual history shape."""
+    template = build_template_plan({"experience": "продвинутый", "goal": "Набор мышечной массы"})
+    chars_per_second = len(render_plan(template)) / 1.0  # The whole plan takes 1s, a day about 0.2s
+    fake = FakeOpenAI(responder=plan_responder(template, chars_per_second))
+    await fake.start()
+    client = AsyncOpenAI(api_key="test", base_url=fake.base_url, max_retries=0)
+    try:
+        with patch.object(openai_service, "get_client", return_value=client), _fanout_settings():
+            started = time.perf_counter()
+            plan, history = await openai_service.generate_plan({"goal": "Набор мышечной массы", "injuries": "нет"})
+            elapsed = time.perf_counter() - started
+    finally:
+        await client.close()
+        await fake.stop()
+
+    assert len(fake.requests) == 1 + len(template.days)
+    assert parse_plan(plan) == template
+    assert expand_history(history, plan)[-1] == {"role": "assistant", "content": plan}
+    assert elapsed < 0.7
+
+
+async def test_generate_plan_fanout_falls_back_on_inconsistent_days():
+    """Days that do not match the split are discarded for a single completion."""
+    split = json.dumps({"days": [{"title": "Присед", "main": ["Приседания"]}]})
+    replies = [split, "**Основная часть:**\nВыпады — 3×10", "Полный план"]
+    fake_client = MagicMock()
+    fake_client.chat.completions.create = AsyncMock(
+        side_effect=[
+            SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))], usage=None)
+            for reply in replies
+        ]
+    )
+
+    with patch.object(openai_service, "get_client", return_value=fake_client), _fanout_settings():
+        plan, _ = await openai_service.generate_plan({"goal": "Набор мышечной массы", "injuries": "нет"})
+
+    assert plan == "Полный план"
+    assert fake_client.chat.completions.create.await_count == 3
+
+
+def _lazy_settings():
+    settings = replace(Settings(), plan_lazy_weeks=True, plan_fanout_enabled=True, plan_cache_enabled=False)
+    return patch.object(openai_service, "get_settings", return_value=settings)
+
+
+def _reply(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+
+async def test_generate_plan_with_lazy_weeks_asks_for_week_one_only():
+    """With lazy weeks the plan is one completion for week 1, and the history keeps the week 1 prompt."""
+    fake_client = MagicMock()
+    fake_client.chat.completions.create = AsyncMock(return_value=_reply("**День 1**\nЖим — 4×8×65%"))
+
+    with patch.object(openai_service, "get_client", return_value=fake_client), _lazy_settings():
+        plan, history = await openai_service.generate_plan({"goal": "Набор мышечной массы", "injuries": "нет"})
+
+    messages = fake_client.chat.completions.create.call_args.kwargs["messages"]
+    assert messages[-1] == {"role": "system", "content": SYSTEM_PROMPT_FIRST_WEEK}
+    assert fake_client.chat.completions.create.await_count == 1  # Not fanned out
+    assert expand_history(history, plan)[-2:] == messages[-1:] + [{"role": "assistant", "content": plan}]
+
+
+async def test_generate_weeks_merges_the_json_loads():
+    """The next weeks come back as JSON loads, merged into the plan."""
+    plan = "### День 1 — Жим\n\n**Основная часть:**\nЖим штанги лежа — 4×8×65%"
+    loads = [{"week": 2, "day": 1, "exercise": "Жим штанги лежа", "pct": 70, "sets": 4, "reps": "8"}]
+    fake_client = MagicMock()
+    fake_client.chat.completions.create = AsyncMock(return_value=_reply(json.dumps({"loads": loads})))
+
+    with patch.object(openai_service, "get_client", return_value=fake_client):
+        new_plan = await openai_service.generate_weeks({"goal": "Набор мышечной массы"}, plan, 1, 2)
+
+    kwargs = fake_client.chat.completions.create.call_args.kwargs
+    assert kwargs["response_format"] == {"type": "json_object"}
+    assert kwargs["messages"][-3] == {"role": "assistant", "content": plan}
+    assert kwargs["messages"][-1]["content"].endswith("- День 1: Жим штанги лежа")
+    assert new_plan == "### День 1 — Жим\n\n**Основная часть:**\nЖим штанги лежа — 4×8×65% (65/70)"
+
+    fake_client.chat.completions.create = AsyncMock(return_value=_reply(json.dumps({"loads": []})))
+    with patch.object(openai_service, "get_client", return_value=fake_client):
+        assert await openai_service.generate_weeks({}, plan, 1, 2) is None
+
+
+async def test_get_client_builds_plain_client_once(monkeypatch):
+    """The plain OpenAI client is built, once, even with Langfuse configured, and closed on request."""
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("LANGFUSE_PUBLIC_KEY", "pk-lf-test")
+    openai_service.get_client.cache_clear()
+
+    client = openai_service.get_client()
+
+    assert type(client) is AsyncOpenAI
+    assert client.max_retries == 0
+    assert openai_service.get_client() is client
+    await openai_service.close_client()
+    assert openai_service.get_client.cache_info().currsize == 0
+
+
+async def test_get_client_without_api_key(monkeypatch):
+    """Without an API key no client is built and the service functions report the error."""
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    openai_service.get_client.cache_clear()
+
+    assert openai_service.get_client() is None
+    plan, history = await openai_service.generate_plan({"goal": "Набор мышечной массы"})
+    assert plan.startswith("Error")
+    openai_service.get_client.cache_clear()  # Later tests may have a key
+
+
+async def test_modify_plan_applies_patch_from_numbered_plan():
+    """The model sees numbered plan lines and answers with a patch, applied to the plan locally."""
+    plan = "### День 1\nЖим лежа — 4×8\n\n### День 2\nПрисед — 4×8"
+    history = compact_history(
+        [
+            *openai_service.build_plan_messages({"goal": "Набор мышечной массы"}),
+            {"role": "assistant", "content": plan},
+            {"role": "user", "content": "Замени присед на жим ногами"},
+        ],
+        plan,
+    )
+    patch_text = json.dumps(
+        {"summary": "Присед заменен жимом ногами.", "ops": [{"op": "replace", "line": 5, "text": "Жим ногами — 4×10"}]}
+    )
+    fake_client = MagicMock()
+    fake_client.chat.completions.create = AsyncMock(
+        return_value=SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=patch_text))], usage=None)
+    )
+
+    with patch.object(openai_service, "get_client", return_value=fake_client):
+        modification, new_history = await openai_service.modify_plan(history, None, plan)
+
+    kwargs = fake_client.chat.completions.create.call_args.kwargs
+    assert kwargs["max_tokens"] == openai_service.MAX_TOKENS_MODIFICATION
+    assert kwargs["response_format"] == {"type": "json_object"}
+    assert "5| Присед — 4×8" in [message["content"] for message in kwargs["messages"]][2]
+    assert kwargs["messages"][-1] == {"role": "user", "content": "Замени присед на жим ногами"}
+    assert modification.plan == "### День 1\nЖим лежа — 4×8\n\n### День 2\nЖим ногами — 4×10"
+    assert modification.changed_sections == ("### День 2\nЖим ногами — 4×10",)
+    assert new_history[-1] == {"role": "assistant", "content": "Присед заменен жимом ногами."}
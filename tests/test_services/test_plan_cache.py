@@ -0,0 +1,86 @@
+"""Tests for plan_cache.py"""
+
+import pytest
+
+from ai_gym_bro.services.plan_cache import PlanCache, make_cache_key
+
+PROFILE = {
+    "age": "25",
+    "height": "174 см",
+    "weight": "81 кг",
+    "experience": "Начинающий",
+    "bench": "60",
+    "injuries": "Нет",
+    "goal": "Набор мышечной массы",
+}
+
+
+class FakeClock:
+    """Manually advanced wall clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_similar_profiles_share_a_key():
+    """Profiles in the same buckets map to the same key."""
+    similar = dict(PROFILE, age="26", height="1.73", weight="84", experience="новичок", bench="65 кг", injuries="нет.")
+
+    assert make_cache_key(PROFILE, "v1") == make_cache_key(similar, "v1")
+
+
+def test_key_depends_on_goal_and_prompt_version():
+    """A different goal or prompt version never hits the same entry."""
+    key = make_cache_key(PROFILE, "v1")
+
+    assert make_cache_key(dict(PROFILE, goal="Уменьшение жировой массы"), "v1") != key
+    assert make_cache_key(PROFILE, "v2") != key
+
+
+def test_profiles_with_injuries_opt_out():
+    """Free-text injuries (or a missing answer) disable caching."""
+    assert make_cache_key(dict(PROFILE, injuries="болит левое колено"), "v1") is None
+    assert make_cache_key({k: v for k, v in PROFILE.items() if k != "injuries"}, "v1") is None
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction_and_counters():
+    """The least recently used entry is evicted and hits/misses are counted."""
+    cache = PlanCache(max_entries=2)
+    await cache.put("a", "plan a")
+    await cache.put("b", "plan b")
+    assert await cache.get("a") == "plan a"  # "a" is now most recent
+
+    await cache.put("c", "plan c")
+
+    assert await cache.get("b") is None
+    assert await cache.get("c") == "plan c"
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert len(cache) == 2
+
+
+@pytest.mark.asyncio
+async def test_entries_expire_after_ttl():
+    """Entries are not served past their TTL."""
+    clock = FakeClock()
+    cache = PlanCache(ttl_seconds=60, clock=clock)
+    await cache.put("a", "plan a")
+
+    clock.now += 59
+    assert await cache.get("a") == "plan a"
+    clock.now += 2
+    assert await cache.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_disk_tier_survives_restart(tmp_path):
+    """Plans stored with a disk tier are found by a new cache instance."""
+    await PlanCache(disk_path=tmp_path / "plans.sqlite3").put("a", "plan a")
+
+    restarted = PlanCache(disk_path=tmp_path / "plans.sqlite3")
+
+    assert await restarted.get("a") == "plan a"
+    assert len(restarted) == 1  # Promoted into memory
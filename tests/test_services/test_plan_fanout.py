@@ -0,0 +1,67 @@
+"""Tests for plan_fanout.py"""
+
+import json
+
+import pytest
+
+from ai_gym_bro.services.plan_fanout import (
+    DaySpec,
+    SplitError,
+    check_consistency,
+    merge_days,
+    parse_split,
+    split_outline,
+)
+
+DAYS = [
+    DaySpec(1, "Присед", "Ноги", ("Приседания",)),
+    DaySpec(2, "Жим", "Грудь", ("Жим лежа",)),
+]
+
+
+def day_text(number, lift, weeks="65/70/72/75/65"):
+    return f"**День {number}**\n\n**Основная часть:**\n{lift} — 4×8×65% ({weeks})"
+
+
+def test_parse_split():
+    text = json.dumps({"days": [{"title": "Присед", "focus": "Ноги", "main": ["Приседания"]}, {"title": "Жим"}]})
+
+    days = parse_split(f"```json\n{text}\n```")
+
+    assert days == [DaySpec(1, "Присед", "Ноги", ("Приседания",)), DaySpec(2, "Жим", "", ())]
+    assert split_outline(days) == "День 1 — Присед (Ноги): Приседания\nДень 2 — Жим"
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "not json",
+        json.dumps({"days": []}),
+        json.dumps({"days": [{"main": ["Присед"]}]}),
+        json.dumps({"days": [{"title": "Жим", "main": "Жим лежа"}]}),
+    ],
+)
+def test_parse_split_rejects_malformed(text):
+    with pytest.raises(SplitError):
+        parse_split(text)
+
+
+def test_merge_days_replaces_headings_in_split_order():
+    plan = merge_days(DAYS, [day_text(1, "Приседания"), "**Основная часть:**\nЖим лежа — 4×8×65% (65/70/72/75/65)"])
+
+    assert plan.startswith("### День 1 — Присед\n\n**Основная часть:**\nПриседания")
+    assert "### День 2 — Жим\n\n**Основная часть:**" in plan
+    assert check_consistency(plan, DAYS) == []
+
+
+def test_check_consistency_finds_missing_lifts_and_week_mismatches():
+    plan = merge_days(DAYS, [day_text(1, "Выпады"), day_text(2, "Жим лежа", weeks="65/70/75")])
+
+    problems = check_consistency(plan, DAYS)
+
+    assert any("missing the main lift 'Приседания'" in problem for problem in problems)
+    assert any("number of weeks" in problem for problem in problems)
+
+
+def test_check_consistency_finds_missing_days():
+    assert check_consistency(merge_days(DAYS[:1], [day_text(1, "Приседания")]), DAYS)
@@ -0,0 +1,120 @@
+"""Tests for plan_model.py"""
+
+import pickle
+
+import pytest
+
+from ai_gym_bro.services.plan_model import (
+    ACCESSORY,
+    MAIN,
+    WARMUP,
+    Plan,
+    PlanParseError,
+    WeekLoad,
+    parse_plan,
+    render_plan,
+)
+
+# As the model writes it: bold headers, bullets, a table and a week list
+GENERATED_PLAN = """Программа рассчитана на 5 недель.
+
+---
+
+## **День 1: Верх тела**
+
+**Разминка:**
+- Вращения плечами — 2×15
+- Бег на дорожке — 5 минут
+
+**Основная часть:**
+1. **Жим штанги лежа** — 4×8×70% (70/72/75/77/65)
+2. **Тяга штанги в наклоне**
+   - Неделя 1: 65 % × 4 подходов × 10 повторений
+   - Неделя 2: 67,5 % × 4 подходов × 10 повторений
+   - Неделя 3: 70 % × 4 подходов × 8 повторений
+   - Неделя 4: 72,5 % × 5 подходов × 8 повторений
+   - Неделя 5: 60 % × 3 подходов × 10 повторений
+
+**Вспомогательные упражнения:**
+- Разведения гантелей — 3×12–15
+
+## **День 2: Низ тела**
+
+**Основная часть:**
+Приседания со штангой
+| Неделя | % | Подходы | Повторы |
+|---|---|---|---|
+| 1 | 70 | 4 | 8 |
+| 2 | 72 | 4 | 8 |
+| 3 | 75 | 4 | 6 |
+| 4 | 77 | 4 | 6 |
+| 5 | 65 | 3 | 8 |
+
+Отдыхайте 2–3 минуты между подходами.
+"""
+
+
+def test_parses_days_sections_and_loads():
+    plan = parse_plan(GENERATED_PLAN)
+
+    assert plan.notes == ["Программа рассчитана на 5 недель."]
+    assert [(day.number, day.title) for day in plan.days] == [(1, "Верх тела"), (2, "Низ тела")]
+    assert [section.kind for section in plan.days[0].sections] == [WARMUP, MAIN, ACCESSORY]
+
+    warmup = plan.days[0].section(WARMUP).exercises
+    assert warmup[0].week(3) == WeekLoad(0, 2, 15, 15)
+    assert (warmup[1].name, warmup[1].note, warmup[1].weeks) == ("Бег на дорожке", "5 минут", 0)
+
+    bench, row = plan.days[0].section(MAIN).exercises
+    assert bench.name == "Жим штанги лежа"
+    assert [bench.week(week).pct for week in range(1, 6)] == [70, 72, 75, 77, 65]
+    assert row.week(2) == WeekLoad(67.5, 4, 10, 10)
+    assert row.week(4).sets == 5
+    assert row.week(6) is None
+    assert plan.days[0].section(ACCESSORY).exercises[0].week(1).reps == "12–15"
+
+    squat = plan.days[1].section(MAIN).exercises[0]
+    assert squat.week(3) == WeekLoad(75, 4, 6, 6)
+    assert plan.days[1].notes == ["Отдыхайте 2–3 минуты между подходами."]
+    assert plan.week_count == 5
+
+
+def test_render_round_trip():
+    """Rendering is canonical: it parses back to the same plan and renders to the same text."""
+    plan = parse_plan(GENERATED_PLAN)
+    text = render_plan(plan)
+
+    assert parse_plan(text) == plan
+    assert render_plan(parse_plan(text)) == text
+
+    plan.notes.clear()
+    for day in plan.days:
+        day.notes.clear()
+    assert parse_plan(render_plan(plan), strict=True) == plan
+    assert "Жим штанги лежа — 4×8×70% (70/72/75/77/65)" in text
+    assert "- Неделя 4: 72.5% × 5 подходов × 8 повторений" in text
+
+
+def test_strict_mode_rejects_unknown_lines():
+    with pytest.raises(PlanParseError) as error:
+        parse_plan(GENERATED_PLAN, strict=True)
+    assert error.value.line_number == 1
+
+    with pytest.raises(PlanParseError):
+        parse_plan("### День 1\n**Основная часть:**\nЖим лежа — на ваше усмотрение", strict=True)
+
+
+def test_find_exercises():
+    plan = parse_plan(GENERATED_PLAN)
+
+    [(day, section, exercise)] = plan.find("жим штанги")
+    assert (day.number, section.kind, exercise.week(5).pct) == (1, MAIN, 65)
+    assert len(plan.find("штанг")) == 3
+
+
+def test_compact_form_is_smaller_and_lossless():
+    plan = parse_plan(GENERATED_PLAN)
+    compact = plan.to_compact()
+
+    assert Plan.from_compact(pickle.loads(pickle.dumps(compact))) == plan
+    assert len(pickle.dumps(compact)) < len(GENERATED_PLAN.encode("utf-8"))
@@ -0,0 +1,102 @@
+"""Tests for plan_patch.py"""
+
+import json
+
+import pytest
+
+from ai_gym_bro.services.plan_patch import PatchError, apply_patch, number_lines, parse_patch
+
+PLAN = "\n".join(
+    [
+        "### День 1",  # 1
+        "**Основная часть:**",  # 2
+        "Жим штанги лежа — 4×8×70% (70/72/75/77/65)",  # 3
+        "Присед — 4×8×70% (70/72/75/77/65)",  # 4
+        "",  # 5
+        "### День 2",  # 6
+        "**Основная часть:**",  # 7
+        "Становая тяга — 3×6×75% (75/77/80/82/70)",  # 8
+        "Жим штанги лежа — 3×10×65% (65/67/70/72/60)",  # 9
+        "",  # 10
+        "### День 3",  # 11
+        "Подтягивания — 4×8",  # 12
+    ]
+)
+
+
+def patch_json(*ops, summary="Готово"):
+    return json.dumps({"summary": summary, "ops": list(ops)})
+
+
+def test_number_lines():
+    assert number_lines("a\nb").split("\n") == ["1| a", "2| b"]
+
+
+def test_replace_sends_only_changed_section():
+    patch = parse_patch(patch_json({"op": "replace", "line": 8, "text": "Румынская тяга — 3×8×70%"}), 12)
+
+    modification = apply_patch(PLAN, patch)
+
+    assert "Румынская тяга — 3×8×70%" in modification.plan
+    assert "Становая тяга" not in modification.plan
+    assert len(modification.changed_sections) == 1
+    assert modification.changed_sections[0].startswith("### День 2")
+    assert modification.render().startswith("Готово\n\n### День 2")
+
+
+def test_insert_delete_and_substitute():
+    patch = parse_patch(
+        patch_json(
+            {"op": "insert_after", "line": 4, "text": "Выпады — 3×10\nПланка — 3×45с"},
+            {"op": "delete", "line": 12},
+            {"op": "substitute", "find": "Жим штанги лежа", "text": "Жим гантелей лежа"},
+        ),
+        12,
+    )
+
+    modification = apply_patch(PLAN, patch)
+    lines = modification.plan.split("\n")
+
+    assert lines[3:6] == ["Присед — 4×8×70% (70/72/75/77/65)", "Выпады — 3×10", "Планка — 3×45с"]
+    assert "Подтягивания — 4×8" not in lines
+    assert modification.plan.count("Жим гантелей лежа") == 2
+    assert [section.split("\n")[0] for section in modification.changed_sections] == [
+        "### День 1",
+        "### День 2",
+        "### День 3",
+    ]
+
+
+def test_question_without_ops_leaves_plan_unchanged():
+    modification = apply_patch(PLAN, parse_patch(patch_json(summary="Менять ничего не нужно."), 12))
+
+    assert modification.plan == PLAN
+    assert modification.render() == "Менять ничего не нужно."
+
+
+def test_patch_in_code_fence_is_parsed():
+    text = "```json\n" + patch_json({"op": "delete", "line": 1}) + "\n```"
+    assert parse_patch(text, 12).ops[0].line == 1
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Я изменил план так: ...",
+        patch_json({"op": "replace", "line": 13, "text": "x"}),
+        patch_json({"op": "replace", "line": "3", "text": "x"}),
+        patch_json({"op": "replace", "line": 3, "text": ""}),
+        patch_json({"op": "rewrite", "line": 3, "text": "x"}),
+        patch_json({"op": "delete", "line": 3}, {"op": "replace", "line": 3, "text": "x"}),
+        patch_json({"op": "delete", "line": 3}, summary=""),
+    ],
+)
+def test_invalid_patches_are_rejected(text):
+    with pytest.raises(PatchError):
+        parse_patch(text, 12)
+
+
+def test_substitution_of_missing_text_is_rejected():
+    patch = parse_patch(patch_json({"op": "substitute", "find": "Армейский жим", "text": "Жим гантелей"}), 12)
+    with pytest.raises(PatchError):
+        apply_patch(PLAN, patch)
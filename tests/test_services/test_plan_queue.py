@@ -0,0 +1,117 @@
+"""Tests for plan_queue.py"""
+
+import asyncio
+
+import pytest
+
+from ai_gym_bro.services.plan_queue import PlanJob, PlanJobQueue, QueueFullError
+
+
+@pytest.mark.asyncio
+async def test_queue_runs_jobs_in_order_with_worker_cap():
+    """Jobs start in submission order and no more than `workers` run at once."""
+    queue = PlanJobQueue(workers=2, max_depth=10)
+    await queue.start()
+    started, running, peak = [], 0, 0
+    release = asyncio.Event()
+
+    def make_job(user_id):
+        async def run():
+            nonlocal running, peak
+            started.append(user_id)
+            running += 1
+            peak = max(peak, running)
+            await release.wait()
+            running -= 1
+
+        return PlanJob(user_id=user_id, run=run)
+
+    for user_id in range(5):
+        queue.submit(make_job(user_id))
+    await asyncio.sleep(0)
+
+    assert started == [0, 1]
+    assert queue.depth == 3
+    assert queue.position(3) == 2
+
+    release.set()
+    await asyncio.wait_for(queue._queue.join(), timeout=1)
+    await queue.stop()
+
+    assert started == [0, 1, 2, 3, 4]
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_submit_rejects_when_full():
+    """Submitting beyond max_depth raises QueueFullError instead of queueing."""
+    queue = PlanJobQueue(workers=1, max_depth=1)
+    await queue.start()
+    release = asyncio.Event()
+
+    async def run():
+        await release.wait()
+
+    queue.submit(PlanJob(user_id=1, run=run))
+    await asyncio.sleep(0)  # The first job is picked up by the worker
+    assert queue.submit(PlanJob(user_id=2, run=run)) == 1
+
+    with pytest.raises(QueueFullError):
+        queue.submit(PlanJob(user_id=3, run=run))
+
+    release.set()
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_failing_job_does_not_stop_worker():
+    """An exception in one job is logged and the worker moves on."""
+    queue = PlanJobQueue(workers=1, max_depth=5)
+    await queue.start()
+    done = []
+
+    async def fail():
+        raise RuntimeError("boom")
+
+    async def succeed():
+        done.append(True)
+
+    queue.submit(PlanJob(user_id=1, run=fail))
+    queue.submit(PlanJob(user_id=2, run=succeed))
+    await asyncio.wait_for(queue._queue.join(), timeout=1)
+    await queue.stop()
+
+    assert done == [True]
+    assert queue.position(2) is None
+
+
+@pytest.mark.asyncio
+async def test_cancelled_jobs_are_skipped():
+    """A user's waiting job cancelled before a worker takes it never runs and leaves the line."""
+    queue = PlanJobQueue(workers=1, max_depth=5)
+    await queue.start()
+    release = asyncio.Event()
+    done = []
+
+    async def block():
+        await release.wait()
+
+    def record(user_id):
+        async def run():
+            done.append(user_id)
+
+        return run
+
+    queue.submit(PlanJob(user_id=1, run=block))
+    await asyncio.sleep(0)
+    queue.submit(PlanJob(user_id=2, run=record(2)))
+    queue.submit(PlanJob(user_id=3, run=record(3)))
+
+    assert queue.cancel(2) == 1
+    assert queue.depth == 1
+    assert queue.position(3) == 1
+    release.set()
+    await asyncio.wait_for(queue._queue.join(), timeout=1)
+    await queue.stop()
+
+    assert done == [3]
@@ -0,0 +1,50 @@
+"""Tests for plan_template.py"""
+
+import pytest
+
+from ai_gym_bro.handlers.common import FAT_LOSS, MUSCLE_GAIN
+from ai_gym_bro.services.plan_model import ACCESSORY, MAIN, parse_plan, render_plan
+from ai_gym_bro.services.plan_template import SUPERSET_NOTE, build_template_plan, training_days
+
+
+@pytest.mark.parametrize(
+    "experience, days", [("начинающий", 3), ("Средний уровень", 3), ("продвинутый", 5), ("не знаю", None)]
+)
+def test_training_days_by_level(experience, days):
+    assert training_days({"experience": experience}) == days
+
+
+def test_muscle_gain_wave_stays_within_the_prompt_rules():
+    plan = build_template_plan({"experience": "начинающий", "goal": MUSCLE_GAIN})
+
+    assert len(plan.days) == 3 and plan.week_count == 5
+    for day in plan.days:
+        for exercise in day.section(MAIN).exercises:
+            loads = [exercise.week(number) for number in range(1, 6)]
+            assert all(65 <= load.pct <= 75 and 8 <= load.reps_lo <= 12 for load in loads)
+            assert loads[4].pct < loads[3].pct  # Deload in the last week
+
+
+def test_fat_loss_adds_supersets_and_cardio():
+    plan = build_template_plan({"experience": "продвинутый", "goal": FAT_LOSS})
+
+    assert len(plan.days) == 5
+    for day in plan.days:
+        main = [exercise.week(number) for exercise in day.section(MAIN).exercises for number in range(1, 6)]
+        assert all(60 <= load.pct <= 70 and 12 <= load.reps_lo <= 15 for load in main)
+        accessories = day.section(ACCESSORY).exercises
+        assert SUPERSET_NOTE in [exercise.note for exercise in accessories]
+        assert accessories[-1].name.startswith("Кардио")
+
+
+def test_rendered_template_parses_back_strictly():
+    plan = build_template_plan({"experience": "средний", "goal": MUSCLE_GAIN})
+
+    assert parse_plan(render_plan(plan), strict=True) == plan
+
+
+@pytest.mark.parametrize(
+    "profile", [{"experience": "не помню", "goal": MUSCLE_GAIN}, {"experience": "начинающий", "goal": "Сила"}]
+)
+def test_profiles_outside_the_rules_get_no_template(profile):
+    assert build_template_plan(profile) is None
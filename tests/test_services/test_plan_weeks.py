@@ -0,0 +1,72 @@
+"""Tests for plan_weeks.py"""
+
+import json
+
+import pytest
+
+from ai_gym_bro.services.plan_model import parse_plan
+from ai_gym_bro.services.plan_weeks import (
+    WeekLoadsError,
+    add_week_loads,
+    render_week,
+    week_request,
+    weeks_in_plan,
+)
+
+PLAN = (
+    "### День 1 — Присед\n\n**Основная часть:**\nПриседания со штангой — 4×8×65%\n\n"
+    "### День 2 — Жим\n\n**Основная часть:**\nЖим штанги лежа — 4×8×65%\nТяга гантели — 3×10"
+)
+LIFTS = ((1, "Приседания со штангой"), (2, "Жим штанги лежа"))
+
+
+def loads(weeks, lifts=LIFTS):
+    return json.dumps(
+        {
+            "loads": [
+                {"week": week, "day": day, "exercise": name, "pct": 60 + 5 * week, "sets": 4, "reps": "6-8"}
+                for week in weeks
+                for day, name in lifts
+            ]
+        },
+        ensure_ascii=False,
+    )
+
+
+def test_week_request_names_the_lifts_with_an_intensity():
+    assert week_request(PLAN, 1, 3) == (
+        "Составьте нагрузки недель 2–3 для основных упражнений:\n"
+        "- День 1: Приседания со штангой\n- День 2: Жим штанги лежа"
+    )
+    assert week_request(PLAN, 1, 2).startswith("Составьте нагрузки недели 2 ")
+
+
+def test_add_week_loads_merges_the_weeks_into_the_plan():
+    plan = add_week_loads(PLAN, 1, 3, f"```json\n{loads([2, 3])}\n```")
+
+    assert weeks_in_plan(PLAN) == 1 and weeks_in_plan(plan) == 3
+    bench = parse_plan(plan).days[1].sections[0].exercises
+    assert [bench[0].week(n).pct for n in (1, 2, 3)] == [65, 70, 75]
+    assert (bench[0].week(3).reps_lo, bench[0].week(3).reps_hi) == (6, 8)
+    assert bench[1].weeks == 1  # Without an intensity the load stays as it was
+    # Later weeks are added on top of the ones already there
+    assert weeks_in_plan(add_week_loads(plan, 3, 5, loads([4, 5]))) == 5
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["not json", json.dumps({"weeks": []}), loads([2], LIFTS[:1]), loads([2]).replace('"6-8"', '"много"')],
+)
+def test_add_week_loads_rejects_loads_that_do_not_fit(text):
+    with pytest.raises(WeekLoadsError):
+        add_week_loads(PLAN, 1, 2, text)
+
+
+def test_render_week_shows_one_week_with_kilograms():
+    plan = add_week_loads(PLAN, 1, 2, loads([2]))
+
+    week = render_week(plan, 2, one_rm=100)
+
+    assert "**День 1 — Присед** (неделя 2)" in week
+    assert "Жим штанги лежа — 4×6–8×70% (≈70 кг)" in week
+    assert "Тяга гантели — 3×10" in week
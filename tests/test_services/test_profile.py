@@ -0,0 +1,29 @@
+"""Tests for profile.py"""
+
+import pytest
+
+from ai_gym_bro.services.profile import parse_height_cm
+
+
+@pytest.mark.parametrize(
+    "answer, height",
+    [
+        ("180", 180),
+        ("180 см", 180),
+        ("1,8", 180),
+        ("5'10", 177.8),
+        ("5'10\"", 177.8),
+        ("5 ft 10 in", 177.8),
+        ("6 футов", 182.88),
+        ("5 футов 10 дюймов", 177.8),
+        ("70 inches", 177.8),
+    ],
+)
+def test_parse_height_cm(answer, height):
+    assert parse_height_cm(answer) == pytest.approx(height)
+
+
+@pytest.mark.parametrize("answer", ["высокий", "18", "600", "5 метров"])
+def test_parse_height_cm_rejects_unlikely_heights(answer):
+    """Answers that do not give a plausible height are left to the raw text."""
+    assert parse_height_cm(answer) is None
@@ -0,0 +1,147 @@
+"""Tests for rate_limiter.py"""
+
+import asyncio
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+from ai_gym_bro.services.rate_limiter import (
+    OpenAIRateLimiter,
+    TokenBucket,
+    get_rate_limiter,
+    model_headers,
+    parse_reset_seconds,
+    record_openai_response,
+)
+from ai_gym_bro.testing.fake_openai import FakeOpenAI, FakeReply
+
+
+class FakeClock:
+    """Clock advanced by the limiter's sleeps instead of real time."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        await asyncio.sleep(0)
+
+
+def make_limiter(rpm=60, tpm=6000, headroom=1.0):
+    clock = FakeClock()
+    return OpenAIRateLimiter(rpm, tpm, headroom=headroom, clock=clock, sleep=clock.sleep), clock
+
+
+def test_parse_reset_seconds():
+    """OpenAI reset durations combine hours, minutes, seconds and milliseconds."""
+    assert parse_reset_seconds("1s") == 1
+    assert parse_reset_seconds("6m0s") == 360
+    assert parse_reset_seconds("20ms") == pytest.approx(0.02)
+    assert parse_reset_seconds("") is None
+
+
+def test_token_bucket_refills_at_per_minute_rate():
+    """An empty bucket refills its capacity over one minute."""
+    clock = FakeClock()
+    bucket = TokenBucket(120, clock)
+    bucket.consume(120)
+
+    assert bucket.wait_time(2) == pytest.approx(1.0)
+    clock.now = 30
+    assert bucket.level == pytest.approx(0) and bucket.wait_time(60) == 0
+
+
+@pytest.mark.asyncio
+async def test_acquire_waits_for_token_budget():
+    """Requests beyond the TPM budget wait until enough tokens have refilled."""
+    limiter, clock = make_limiter(rpm=1000, tpm=6000)
+
+    assert await limiter.acquire(6000) == 0
+    waited = await limiter.acquire(3000)
+
+    assert waited == pytest.approx(30)  # Half of the per-minute budget
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_served_in_arrival_order():
+    """Queued callers get through in FIFO order."""
+    limiter, _ = make_limiter(rpm=60, tpm=100_000)
+    order = []
+
+    async def call(index):
+        await limiter.acquire(10)
+        order.append(index)
+
+    await asyncio.gather(*(call(i) for i in range(70)))
+
+    assert order == list(range(70))
+
+
+@pytest.mark.asyncio
+async def test_throughput_stays_under_headroom():
+    """Sustained load settles at the headroom share of the RPM limit."""
+    limiter, clock = make_limiter(rpm=100, tpm=1_000_000, headroom=0.9)
+
+    for _ in range(500):
+        await limiter.acquire(1)
+
+    # 90 requests are admitted immediately, the rest at 90 per minute
+    assert clock.now == pytest.approx((500 - 90) / 90 * 60)
+
+
+def test_headers_adjust_limits_and_remaining():
+    """Rate limit headers set the capacity and never let us exceed the server's remaining allowance."""
+    limiter, _ = make_limiter(rpm=60, tpm=6000)
+
+    limiter.update_from_headers(
+        {
+            "x-ratelimit-limit-requests": "500",
+            "x-ratelimit-remaining-requests": "499",
+            "x-ratelimit-limit-tokens": "30000",
+            "x-ratelimit-remaining-tokens": "1000",
+        }
+    )
+
+    assert limiter.requests.capacity == 500
+    assert limiter.tokens.capacity == 30000
+    assert limiter.tokens.level == 1000
+
+
+@pytest.mark.asyncio
+async def test_429_response_pauses_model_limiter():
+    """A 429 seen by the httpx hook holds back the following requests of that model."""
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions", headers=model_headers("test-429"))
+    response = httpx.Response(429, headers={"retry-after": "7"}, request=request)
+
+    await record_openai_response(response)
+
+    limiter = get_rate_limiter("test-429")
+    assert limiter._paused_until > limiter._clock() + 6
+
+
+@pytest.mark.asyncio
+async def test_response_hook_finds_the_limiter_from_the_request_header():
+    """Completions sent with the model header update their model's limiter from the response headers."""
+    server = FakeOpenAI()
+    await server.start()
+    server.script(FakeReply(headers={"x-ratelimit-limit-requests": "321", "x-ratelimit-remaining-requests": "320"}))
+    http_client = httpx.AsyncClient(event_hooks={"response": [record_openai_response]})
+    client = AsyncOpenAI(api_key="test", base_url=server.base_url, http_client=http_client, max_retries=0)
+    try:
+        await client.chat.completions.create(
+            model="test-header",
+            messages=[{"role": "user", "content": "Hi"}],
+            extra_headers=model_headers("test-header"),
+        )
+    finally:
+        await client.close()
+        await server.stop()
+
+    limiter = get_rate_limiter("test-header")
+    assert limiter.requests.capacity == pytest.approx(321 * limiter.headroom)
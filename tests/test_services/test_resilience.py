@@ -0,0 +1,209 @@
+"""Tests for resilience.py, against the local fake OpenAI server."""
+
+import asyncio
+import time
+
+import pytest
+import pytest_asyncio
+from openai import AsyncOpenAI, BadRequestError, InternalServerError
+
+from ai_gym_bro.services.resilience import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilientCaller,
+    backoff_delay,
+)
+from ai_gym_bro.testing.fake_openai import FakeOpenAI, FakeReply
+
+pytestmark = pytest.mark.asyncio
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+@pytest_asyncio.fixture
+async def fake_openai():
+    server = FakeOpenAI()
+    await server.start()
+    yield server
+    await server.stop()
+
+
+@pytest_asyncio.fixture
+async def client(fake_openai):
+    client = AsyncOpenAI(api_key="test", base_url=fake_openai.base_url, max_retries=0)
+    yield client
+    await client.close()
+
+
+def make_caller(**kwargs):
+    async def no_sleep(seconds):
+        pass
+
+    return ResilientCaller(sleep=no_sleep, **kwargs)
+
+
+def completion(client):
+    return lambda: client.chat.completions.create(model="gpt-test", messages=MESSAGES)
+
+
+async def test_backoff_delay_is_jittered_and_capped():
+    """Delays grow exponentially up to the cap, scaled by the random jitter."""
+    assert backoff_delay(0, 0.5, 8, rng=lambda: 1.0) == 0.5
+    assert backoff_delay(3, 0.5, 8, rng=lambda: 1.0) == 4
+    assert backoff_delay(10, 0.5, 8, rng=lambda: 1.0) == 8
+    assert backoff_delay(3, 0.5, 8, rng=lambda: 0.25) == 1
+
+
+async def test_retries_transient_errors(fake_openai, client):
+    """5xx responses are retried until a completion succeeds."""
+    fake_openai.script(FakeReply(status=503), FakeReply(status=500), FakeReply(content="Plan"))
+
+    response = await make_caller(max_attempts=3).call("test", completion(client))
+
+    assert response.choices[0].message.content == "Plan"
+    assert len(fake_openai.requests) == 3
+
+
+async def test_does_not_retry_client_errors(fake_openai, client):
+    """A 400 is final and does not count against the circuit."""
+    fake_openai.script(FakeReply(status=400))
+    caller = make_caller(max_attempts=3)
+
+    with pytest.raises(BadRequestError):
+        await caller.call("test", completion(client))
+
+    assert len(fake_openai.requests) == 1
+    assert caller.breaker.state == CIRCUIT_CLOSED
+
+
+async def test_circuit_opens_and_fails_fast(fake_openai, client):
+    """Once the failure threshold is reached, calls fail without reaching the upstream."""
+    fake_openai.script(*[FakeReply(status=500)] * 3)
+    caller = make_caller(max_attempts=3, breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60))
+
+    with pytest.raises(InternalServerError):
+        await caller.call("test", completion(client))
+    with pytest.raises(CircuitOpenError):
+        await caller.call("test", completion(client))
+
+    assert caller.breaker.state == CIRCUIT_OPEN
+    assert len(fake_openai.requests) == 3
+
+
+async def test_circuit_half_open_trial_closes_it():
+    """After the reset timeout a single trial call is let through; its success closes the circuit."""
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    now[0] = 11
+    assert breaker.allow()
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    assert not breaker.allow()  # Only one trial at a time
+
+    breaker.record_success()
+    assert breaker.state == CIRCUIT_CLOSED and breaker.allow()
+
+
+async def test_cancelled_half_open_trial_frees_the_trial_slot():
+    """A trial call cancelled midway leaves the circuit half-open with the next call let through."""
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    now[0] = 11
+    caller = make_caller(breaker=breaker)
+    started = asyncio.Event()
+
+    async def hanging():
+        started.set()
+        await asyncio.Event().wait()
+
+    trial = asyncio.create_task(caller.call("test", hanging))
+    await started.wait()
+    assert breaker.state == CIRCUIT_HALF_OPEN and not breaker.allow()
+    trial.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await trial
+
+    assert breaker.state == CIRCUIT_HALF_OPEN
+
+    async def ok():
+        return "ok"
+
+    assert await caller.call("test", ok) == "ok"
+    assert breaker.state == CIRCUIT_CLOSED
+
+
+async def test_client_error_leaves_the_breaker_state_alone(fake_openai, client):
+    """A 400 neither resets the failure count nor closes a half-open circuit."""
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    fake_openai.script(FakeReply(status=400), FakeReply(status=400))
+    caller = make_caller(breaker=breaker)
+
+    with pytest.raises(BadRequestError):
+        await caller.call("test", completion(client))
+    assert breaker.failures == 1 and breaker.state == CIRCUIT_CLOSED
+
+    breaker.record_failure()
+    breaker.record_failure()
+    now[0] = 11
+    with pytest.raises(BadRequestError):
+        await caller.call("test", completion(client))
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    assert breaker.allow()  # The trial slot was freed for the next call
+
+
+async def test_hedged_request_beats_slow_primary(fake_openai, client):
+    """A call slower than p95 gets a second request, and the faster answer is used."""
+    caller = make_caller(hedge_enabled=True, hedge_min_samples=5)
+    for _ in range(5):
+        caller.latencies.record(0.05)
+    fake_openai.script(FakeReply(content="slow", delay=2.0), FakeReply(content="fast"))
+
+    started = time.monotonic()
+    response = await caller.call("test", completion(client))
+
+    assert response.choices[0].message.content == "fast"
+    assert time.monotonic() - started < 1.0
+    assert len(fake_openai.requests) == 2
+
+
+async def test_no_hedging_without_latency_history(fake_openai, client):
+    """Until enough latencies are known, calls are never hedged."""
+    caller = make_caller(hedge_enabled=True, hedge_min_samples=5)
+    fake_openai.script(FakeReply(content="only", delay=0.2))
+
+    response = await caller.call("test", completion(client))
+
+    assert response.choices[0].message.content == "only"
+    assert len(fake_openai.requests) == 1
+
+
+async def test_cancelling_during_the_hedge_delay_cancels_the_request():
+    """A caller cancelled while waiting to hedge does not leave the primary request running."""
+    caller = make_caller(hedge_enabled=True, hedge_min_samples=5)
+    for _ in range(5):
+        caller.latencies.record(10.0)
+    started, cancelled = asyncio.Event(), asyncio.Event()
+
+    async def request():
+        started.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    call = asyncio.create_task(caller.call("test", request))
+    await started.wait()
+    call.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await call
+
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
@@ -0,0 +1,135 @@
+"""Tests for speculation.py"""
+
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from ai_gym_bro.services.speculation import DeltaRelay, SpeculativePlans
+
+GOALS = ("mass", "cut")
+PROFILE = {"age": "30", "injuries": "нет"}
+
+
+def make_generator(events):
+    """Plans that stream two deltas and finish once `events[goal]` is set."""
+
+    async def generate(goal, on_delta):
+        await on_delta(f"{goal}:")
+        await events[goal].wait()
+        await on_delta("plan")
+        return f"{goal}:plan", []
+
+    return generate
+
+
+@pytest.fixture(autouse=True)
+def empty_queue():
+    with patch("ai_gym_bro.services.speculation.get_plan_queue", return_value=MagicMock(depth=0)):
+        yield
+
+
+@pytest.mark.asyncio
+async def test_take_hands_over_winner_in_flight_and_cancels_loser():
+    """The picked goal's generation streams its past and future deltas; the other one is cancelled."""
+    events = {goal: asyncio.Event() for goal in GOALS}
+    plans = SpeculativePlans(max_in_flight=4, ttl=60)
+    assert plans.start(1, PROFILE, GOALS, make_generator(events))
+    await asyncio.sleep(0)
+
+    winner = plans.take(1, dict(PROFILE), "cut")
+    deltas = []
+
+    async def on_delta(delta):
+        deltas.append(delta)
+
+    result = asyncio.create_task(winner.result(on_delta))
+    await asyncio.sleep(0)
+    events["cut"].set()
+
+    assert await result == ("cut:plan", [])
+    assert deltas == ["cut:", "plan"]
+    assert plans.in_flight == 0
+    assert plans.take(1, PROFILE, "cut") is None
+
+
+@pytest.mark.asyncio
+async def test_take_returns_finished_winner():
+    events = {goal: asyncio.Event() for goal in GOALS}
+    events["mass"].set()
+    plans = SpeculativePlans(max_in_flight=4, ttl=60)
+    plans.start(1, PROFILE, GOALS, make_generator(events))
+    await asyncio.sleep(0.01)
+
+    winner = plans.take(1, PROFILE, "mass")
+
+    assert winner.task.done()
+    assert await winner.result(None) == ("mass:plan", [])
+
+
+@pytest.mark.asyncio
+async def test_take_treats_a_finished_generation_without_plan_as_a_miss():
+    """generate_plan reports errors as a None plan: such a speculation is not handed over."""
+
+    async def failing(goal, on_delta):
+        return None, []
+
+    plans = SpeculativePlans(max_in_flight=4, ttl=60)
+    plans.start(1, PROFILE, GOALS, failing)
+    await asyncio.sleep(0.01)
+
+    assert plans.take(1, PROFILE, "mass") is None
+    assert plans.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_changed_profile_gets_no_speculative_plan():
+    events = {goal: asyncio.Event() for goal in GOALS}
+    plans = SpeculativePlans(max_in_flight=4, ttl=60)
+    plans.start(1, PROFILE, GOALS, make_generator(events))
+    await asyncio.sleep(0)
+
+    assert plans.take(1, {**PROFILE, "injuries": "колено"}, "mass") is None
+    assert plans.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_budget_skips_speculation_under_load():
+    """Speculation stops at the in-flight budget and while plan jobs wait in the queue."""
+    events = {goal: asyncio.Event() for goal in GOALS}
+    plans = SpeculativePlans(max_in_flight=3, ttl=60)
+
+    assert plans.start(1, PROFILE, GOALS, make_generator(events))
+    assert not plans.start(2, PROFILE, GOALS, make_generator(events))
+    with patch("ai_gym_bro.services.speculation.get_plan_queue", return_value=MagicMock(depth=1)):
+        plans.cancel(1)
+        assert not plans.start(3, PROFILE, GOALS, make_generator(events))
+    plans.cancel_all()
+
+
+@pytest.mark.asyncio
+async def test_expired_speculations_are_cancelled():
+    events = {goal: asyncio.Event() for goal in GOALS}
+    plans = SpeculativePlans(max_in_flight=2, ttl=0)
+    plans.start(1, PROFILE, GOALS, make_generator(events))
+    await asyncio.sleep(0.01)
+
+    assert plans.start(2, PROFILE, GOALS, make_generator(events))  # User 1's plans no longer count
+    assert plans.take(1, PROFILE, "mass") is None
+    plans.cancel_all()
+
+
+@pytest.mark.asyncio
+async def test_relay_replays_deltas_received_before_attach():
+    relay = DeltaRelay()
+    await relay("a")
+    await relay("b")
+    received = []
+
+    async def target(delta):
+        received.append(delta)
+
+    await relay.attach(target)
+    await relay("c")
+
+    assert received == ["ab", "c"]
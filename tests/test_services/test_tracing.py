@@ -0,0 +1,146 @@
+"""Tests for tracing.py"""
+
+import base64
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+import pytest_asyncio
+
+from ai_gym_bro.config import Settings
+from ai_gym_bro.services import tracing
+from ai_gym_bro.services.tracing import GenerationTrace, TraceExporter, Tracer, parse_sample_rates, trace_generation
+from ai_gym_bro.testing.fake_langfuse import FakeLangfuse
+
+MESSAGES = [{"role": "system", "content": "prompt"}]
+
+
+@pytest_asyncio.fixture
+async def collector():
+    server = FakeLangfuse()
+    await server.start()
+    yield server
+    await server.stop()
+
+
+@pytest.fixture
+def tracer_getter(monkeypatch):
+    """Builds `get_tracer()` from the given settings and Langfuse keys."""
+
+    def build(keys: bool = True, **settings):
+        for name in ("LANGFUSE_PUBLIC_KEY", "LANGFUSE_SECRET_KEY"):
+            if keys:
+                monkeypatch.setenv(name, "key")
+            else:
+                monkeypatch.delenv(name, raising=False)
+        monkeypatch.setattr(tracing, "get_settings", lambda: Settings(**settings))
+        tracing.get_tracer.cache_clear()
+        return tracing.get_tracer()
+
+    yield build
+    tracing.get_tracer.cache_clear()
+
+
+def _trace(operation: str = "generate_plan") -> GenerationTrace:
+    usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15)
+    return GenerationTrace(operation, "gpt-4.1", MESSAGES, {"temperature": 0.7}, output="plan", usage=usage)
+
+
+def test_parse_sample_rates():
+    rates = parse_sample_rates("refine_plan=0.1, summarize_history=0,, bad=x")
+    assert rates == {"refine_plan": 0.1, "summarize_history": 0.0}
+
+
+def test_sampling_per_operation():
+    """The per-operation rate overrides the default; 0 never and 1 always samples."""
+    tracer = Tracer(MagicMock(), sample_rate=1.0, sample_rates={"summarize_history": 0.0, "refine_plan": 0.5})
+    tracer._rng = iter([0.4, 0.6]).__next__
+
+    assert tracer.sampled("generate_plan")
+    assert not tracer.sampled("summarize_history")
+    assert tracer.sampled("refine_plan")
+    assert not tracer.sampled("refine_plan")
+
+
+def test_tracing_modes(tracer_getter):
+    assert tracer_getter(tracing_mode="auto") is not None
+    assert tracer_getter(keys=False, tracing_mode="auto") is None
+    assert tracer_getter(tracing_mode="off") is None
+    assert tracer_getter(keys=False, tracing_mode="on") is None  # Nothing to authenticate with
+
+
+def test_trace_generation_without_tracer(monkeypatch):
+    monkeypatch.setattr(tracing, "get_tracer", lambda: None)
+    with trace_generation("generate_plan", "gpt-4.1", MESSAGES) as trace:
+        assert trace is None
+
+
+def test_trace_generation_records_errors(monkeypatch):
+    exporter = MagicMock()
+    monkeypatch.setattr(tracing, "get_tracer", lambda: Tracer(exporter))
+
+    with pytest.raises(TimeoutError):
+        with trace_generation("refine_plan", "gpt-4.1", MESSAGES, max_tokens=100) as trace:
+            raise TimeoutError("too slow")
+
+    trace_event, generation_event = exporter.submit.call_args.args[0]
+    generation = generation_event["body"]
+    assert trace_event["type"] == "trace-create"
+    assert generation["traceId"] == trace_event["body"]["id"]
+    assert generation["level"] == "ERROR"
+    assert generation["statusMessage"] == "TimeoutError: too slow"
+    assert generation["modelParameters"] == {"max_tokens": 100}
+    assert trace.end_time is not None
+
+
+def test_submit_drops_when_buffer_full():
+    """Events past the buffer size are dropped instead of queued."""
+    exporter = TraceExporter("http://langfuse", "pk", "sk", buffer_size=3)
+
+    assert exporter.submit(_trace().to_events())
+    assert not exporter.submit(_trace().to_events())
+    assert exporter.pending == 2
+
+
+@pytest.mark.asyncio
+async def test_flush_exports_in_batches(collector):
+    exporter = TraceExporter(collector.url, "pk-lf", "sk-lf", batch_size=4)
+    for _ in range(5):
+        exporter.submit(_trace().to_events())
+
+    await exporter.start()
+    await exporter.stop()
+
+    assert [len(batch) for batch in collector.batches] == [4, 4, 2]
+    assert exporter.pending == 0
+    assert collector.authorizations[0] == "Basic " + base64.b64encode(b"pk-lf:sk-lf").decode()
+    generation = collector.events_of_type("generation-create")[0]["body"]
+    assert generation["usage"] == {"input": 10, "output": 5, "total": 15, "unit": "TOKENS"}
+    assert generation["output"] == "plan"
+
+
+@pytest.mark.asyncio
+async def test_full_batch_is_exported_before_the_interval(collector):
+    exporter = TraceExporter(collector.url, "pk", "sk", batch_size=2, flush_interval=60)
+    await exporter.start()
+    try:
+        exporter.submit(_trace().to_events())
+        for _ in range(100):
+            if collector.batches:
+                break
+            await tracing.asyncio.sleep(0.01)
+        assert len(collector.events) == 2
+    finally:
+        await exporter.stop()
+
+
+@pytest.mark.asyncio
+async def test_failed_export_is_dropped(collector):
+    collector.status = 500
+    exporter = TraceExporter(collector.url, "pk", "sk")
+    exporter.submit(_trace().to_events())
+
+    await exporter.flush()
+
+    assert exporter.pending == 0
+    assert collector.batches == []
@@ -0,0 +1,97 @@
+"""Tests for sqlite_persistence.py and migrate_pickle.py"""
+
+import pickle
+
+import pytest
+
+from ai_gym_bro.storage.migrate_pickle import migrate_pickle
+from ai_gym_bro.storage.sqlite_persistence import SQLitePersistence
+
+
+@pytest.fixture
+def persistence(tmp_path):
+    """Create a persistence on a fresh database."""
+    store = SQLitePersistence(tmp_path / "bot.sqlite3")
+    yield store
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_user_data_is_loaded_lazily_on_refresh(tmp_path, persistence):
+    """Stored user data is not returned up front, but filled in on first refresh."""
+    await persistence.update_user_data(1, {"age": "25", "history": [{"role": "user", "content": "hi"}]})
+    persistence.close()
+
+    reopened = SQLitePersistence(tmp_path / "bot.sqlite3")
+    assert await reopened.get_user_data() == {}
+
+    user_data = {}
+    await reopened.refresh_user_data(1, user_data)
+    assert user_data["age"] == "25"
+
+    # Later refreshes never overwrite the live in-memory dict
+    user_data["age"] = "26"
+    await reopened.refresh_user_data(1, user_data)
+    assert user_data["age"] == "26"
+    reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_unchanged_entries_are_not_rewritten(persistence):
+    """Only users whose data changed hit the database."""
+    await persistence.update_user_data(1, {"plan": "A"})
+    await persistence.update_user_data(2, {"plan": "B"})
+    writes_before = persistence._connection.total_changes
+
+    await persistence.update_user_data(1, {"plan": "A"})  # Unchanged
+    await persistence.update_user_data(2, {"plan": "B2"})  # Changed
+
+    assert persistence._connection.total_changes - writes_before == 1
+
+
+@pytest.mark.asyncio
+async def test_conversation_states_round_trip(tmp_path, persistence):
+    """Conversation states are stored per key and removed when they end."""
+    await persistence.update_conversation("workflow", (10, 1), 3)
+    await persistence.update_conversation("workflow", (20, 2), 5)
+    await persistence.update_conversation("workflow", (20, 2), None)
+    persistence.close()
+
+    reopened = SQLitePersistence(tmp_path / "bot.sqlite3")
+    assert await reopened.get_conversations("workflow") == {(10, 1): 3}
+    reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_drop_user_data(persistence):
+    """Dropped users are removed from the database."""
+    await persistence.update_user_data(1, {"plan": "A"})
+    await persistence.drop_user_data(1)
+
+    user_data = {}
+    await persistence.refresh_user_data(1, user_data)
+    assert user_data == {}
+
+
+@pytest.mark.asyncio
+async def test_migrate_pickle_imports_all_users(tmp_path):
+    """The migration copies every user from a PicklePersistence dump."""
+    pickle_path = tmp_path / "bot_persistence.pkl"
+    with pickle_path.open("wb") as file:
+        pickle.dump(
+            {
+                "user_data": {1: {"goal": "mass"}, 2: {"goal": "cut"}},
+                "chat_data": {},
+                "bot_data": {},
+                "conversations": {},
+            },
+            file,
+        )
+
+    assert migrate_pickle(pickle_path, tmp_path / "bot.sqlite3") == 2
+
+    persistence = SQLitePersistence(tmp_path / "bot.sqlite3")
+    user_data = {}
+    await persistence.refresh_user_data(2, user_data)
+    assert user_data == {"goal": "cut"}
+    persistence.close()
@@ -0,0 +1,156 @@
+"""Tests for update_processor.py"""
+
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+from telegram import Update
+
+from ai_gym_bro.update_processor import PerUserUpdateProcessor
+
+
+def make_update(user_id, chat_id=None, text=None):
+    """Create a mock Update for the given user and chat."""
+    update = MagicMock(spec=Update)
+    update.effective_user.id = user_id
+    update.effective_chat.id = chat_id if chat_id is not None else user_id
+    update.message.text = text
+    return update
+
+
+@pytest.mark.asyncio
+async def test_same_user_updates_are_serialized_in_order():
+    """A user's second update starts only after the first one finished."""
+    processor = PerUserUpdateProcessor(max_concurrent_updates=8)
+    events = []
+
+    async def handle(name, delay):
+        events.append(f"start {name}")
+        await asyncio.sleep(delay)
+        events.append(f"end {name}")
+
+    update = make_update(1)
+    await asyncio.gather(
+        processor.process_update(update, handle("first", 0.02)),
+        processor.process_update(update, handle("second", 0)),
+    )
+
+    assert events == ["start first", "end first", "start second", "end second"]
+    assert processor.active_conversations == 0
+
+
+@pytest.mark.asyncio
+async def test_different_users_run_concurrently():
+    """A slow update of one user does not block another user's update."""
+    processor = PerUserUpdateProcessor(max_concurrent_updates=8)
+    slow_started = asyncio.Event()
+    release_slow = asyncio.Event()
+    finished = []
+
+    async def slow():
+        slow_started.set()
+        await release_slow.wait()
+        finished.append("slow")
+
+    async def fast():
+        finished.append("fast")
+
+    slow_task = asyncio.create_task(processor.process_update(make_update(1), slow()))
+    await slow_started.wait()
+    await processor.process_update(make_update(2), fast())
+    assert finished == ["fast"]
+
+    release_slow.set()
+    await slow_task
+    assert finished == ["fast", "slow"]
+
+
+@pytest.mark.asyncio
+async def test_one_users_backlog_does_not_starve_other_users():
+    """Updates waiting behind their user's slow update hold no global slot, so other users still get one."""
+    processor = PerUserUpdateProcessor(max_concurrent_updates=2)
+    assert processor.max_concurrent_updates == 2
+    release = asyncio.Event()
+    finished = []
+
+    async def slow():
+        await release.wait()
+
+    async def tap(name):
+        finished.append(name)
+
+    backlog = [asyncio.create_task(processor.process_update(make_update(1), slow()))]
+    backlog += [asyncio.create_task(processor.process_update(make_update(1), tap(f"user 1: {i}"))) for i in range(5)]
+    await asyncio.sleep(0)
+
+    await asyncio.wait_for(processor.process_update(make_update(2), tap("user 2")), timeout=1)
+    assert finished == ["user 2"]
+
+    release.set()
+    await asyncio.gather(*backlog)
+    assert finished == ["user 2"] + [f"user 1: {i}" for i in range(5)]
+
+
+@pytest.mark.asyncio
+async def test_global_limit_applies_across_users():
+    """No more than `max_concurrent_updates` updates run at once."""
+    processor = PerUserUpdateProcessor(max_concurrent_updates=2)
+    running, peak = 0, 0
+
+    async def handle():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    await asyncio.gather(*(processor.process_update(make_update(user_id), handle()) for user_id in range(6)))
+
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_updates_without_user_are_not_locked():
+    """Updates that carry no chat/user pair are processed directly."""
+    processor = PerUserUpdateProcessor(max_concurrent_updates=1)
+    done = []
+
+    async def handle():
+        done.append(True)
+
+    await processor.process_update(object(), handle())
+
+    assert done == [True]
+    assert PerUserUpdateProcessor.conversation_key(object()) is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("command", ["/cancel", "/start"])
+async def test_abort_command_aborts_the_update_in_progress_right_away(command):
+    """/cancel and /start call on_abort on arrival, then wait their turn behind the update they unblocked."""
+    release = asyncio.Event()
+    aborted, events = [], []
+
+    def on_abort(user_id):
+        aborted.append(user_id)
+        release.set()
+
+    processor = PerUserUpdateProcessor(max_concurrent_updates=8, on_abort=on_abort)
+
+    async def generate():
+        await release.wait()
+        events.append("generation stopped")
+
+    async def cancel():
+        events.append("cancel")
+
+    generation = asyncio.create_task(processor.process_update(make_update(1, text="Жим"), generate()))
+    await asyncio.sleep(0)
+    await processor.process_update(make_update(1, text=command), cancel())
+    await generation
+
+    assert aborted == [1]
+    assert events == ["generation stopped", "cancel"]
+    # Without an update in progress there is nothing to abort
+    await processor.process_update(make_update(1, text=command), cancel())
+    assert aborted == [1]
@@ -0,0 +1,95 @@
+"""End-to-end tests of update delivery against the local fake Telegram."""
+
+import socket
+
+import pytest
+import pytest_asyncio
+from prometheus_client import REGISTRY
+from telegram import Update
+
+from ai_gym_bro import main
+from ai_gym_bro.config import get_settings
+from ai_gym_bro.storage.sqlite_persistence import SQLitePersistence
+from ai_gym_bro.testing.fake_telegram import FakeTelegram
+
+TOKEN = "123456:TEST"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest_asyncio.fixture
+async def fake_telegram(monkeypatch):
+    """Fake Bot API server the application is pointed at."""
+    fake = FakeTelegram(TOKEN)
+    await fake.start()
+    monkeypatch.setenv("TELEGRAM_API_URL", fake.url)
+    monkeypatch.setenv("CONCURRENT_UPDATES", "1")
+    get_settings.cache_clear()
+    yield fake
+    await fake.stop()
+    get_settings.cache_clear()
+
+
+@pytest_asyncio.fixture
+async def application(fake_telegram, tmp_path):
+    app = main.build_application(TOKEN, SQLitePersistence(tmp_path / "bot.sqlite"))
+    await app.initialize()
+    await app.start()
+    yield app
+    if app.updater.running:
+        await app.updater.stop()
+    await app.stop()
+    await app.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_start_command_is_answered_through_bot_api(fake_telegram, application):
+    """An incoming /start is answered with the greeting and the first question."""
+    update = Update.de_json(fake_telegram.make_message_update(42, "/start"), application.bot)
+
+    await application.process_update(update)
+
+    sent = await fake_telegram.wait_for_calls("sendMessage", count=2)
+    assert sent[-1]["text"] == "Сколько тебе лет?"
+    assert sent[-1]["chat_id"] == 42
+
+
+@pytest.mark.asyncio
+async def test_bot_api_requests_are_timed(fake_telegram, application):
+    """Bot API calls are observed in the request latency histogram by method and status."""
+    labels = {"method": "sendMessage", "status": "200"}
+    before = REGISTRY.get_sample_value("telegram_request_seconds_count", labels) or 0
+
+    await application.bot.send_message(chat_id=42, text="ping")
+
+    assert REGISTRY.get_sample_value("telegram_request_seconds_count", labels) == before + 1
+
+
+@pytest.mark.asyncio
+async def test_webhook_verifies_secret_token(fake_telegram, application):
+    """The webhook registers only the used update types and rejects requests without the secret."""
+    pytest.importorskip("tornado")
+    port = free_port()
+
+    await application.updater.start_webhook(
+        listen="127.0.0.1",
+        port=port,
+        url_path="telegram",
+        webhook_url=f"http://127.0.0.1:{port}/telegram",
+        secret_token="s3cret",
+        max_connections=10,
+        allowed_updates=main.ALLOWED_UPDATES,
+    )
+
+    assert fake_telegram.webhook["allowed_updates"] == ["message", "callback_query"]
+    assert fake_telegram.webhook["max_connections"] == 10
+
+    assert await fake_telegram.post_update(fake_telegram.make_message_update(7, "/start"), secret_token="wrong") == 403
+    assert await fake_telegram.post_update(fake_telegram.make_message_update(7, "/start")) == 200
+
+    sent = await fake_telegram.wait_for_calls("sendMessage", count=2)
+    assert sent[-1]["chat_id"] == 7